@@ -17,8 +17,10 @@ class SensorEmulator:
         gyro_amplitude=1000,  # amplitude for gyro sine wave (raw counts)
         mag_amplitude=500,  # amplitude for magnetometer sine wave (raw counts)
         temperature_raw=250,
+        clock=time.time,  # seconds since the epoch, replaceable for reproducible packets
     ):
         self.fs = fs
+        self.clock = clock
         # Calculate the sample interval in microseconds (integer value)
         self.sample_interval = int(1e6 / fs)
         self.num_samples_per_packet = num_samples_per_packet
@@ -28,7 +30,7 @@ class SensorEmulator:
         self.mag_amplitude = mag_amplitude
         self.temperature_raw = temperature_raw
         # Use current time (in microseconds) as the base timestamp; truncated to 32 bits.
-        self.last_timestamp = int(time.time() * 1e6) & 0xFFFFFFFF
+        self.last_timestamp = int(self.clock() * 1e6) & 0xFFFFFFFF
 
         # CRC function (same settings as in your parser)
         self.crc16_mod = crcmod.mkCrcFun(
@@ -42,7 +44,7 @@ class SensorEmulator:
         # Use the current base timestamp as header timestamp
         header_timestamp = self.last_timestamp
         # tsf is simulated using the current time in microseconds (64-bit)
-        tsf = int(time.time() * 1e6) & 0xFFFFFFFFFFFFFFFF
+        tsf = int(self.clock() * 1e6) & 0xFFFFFFFFFFFFFFFF
         num_samples = self.num_samples_per_packet
 
         payload = b""
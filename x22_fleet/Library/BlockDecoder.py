@@ -0,0 +1,37 @@
+import numpy as np
+
+# One sample of an IMU_RAW_COMBO_V2 / IMU_RAW_COMBO_V3 frame (20 bytes).
+# The IMU delivers acc and gyr big-endian, the magnetometer little-endian
+# and the temperature big-endian again.
+IMU_COMBO_SAMPLE = np.dtype(
+    [
+        ("acc", ">i2", (3,)),
+        ("gyr", ">i2", (3,)),
+        ("mag", "<i2", (3,)),
+        ("temp", ">i2"),
+    ]
+)
+
+
+def decodeComboSamples(buffer, startIndex, numberOfSamples):
+    """Decode ``numberOfSamples`` combo samples starting at ``startIndex`` in one step.
+
+    Returns a structured array viewing ``buffer`` (no copy).
+    """
+    return np.frombuffer(
+        buffer, dtype=IMU_COMBO_SAMPLE, count=numberOfSamples, offset=startIndex
+    )
+
+
+def appendComboSamples(dataDict, timeStamp, samples):
+    """Append decoded combo samples to the raw IMU column stores of a DeviceDataBuffer.
+
+    ``timeStamp`` is the sample number of the first sample, following samples
+    are numbered consecutively.
+    """
+    sampleNumbers = np.arange(timeStamp, timeStamp + len(samples))
+    for key, field in (("ImuAccRaw", "acc"), ("ImuGyrRaw", "gyr"), ("ImuMagRaw", "mag")):
+        values = samples[field]
+        dataDict[key].data.extend((sampleNumbers, values[:, 0], values[:, 1], values[:, 2]))
+
+    dataDict["ImuTemp"].data.extend((sampleNumbers, samples["temp"]))
@@ -0,0 +1,133 @@
+import json
+import os
+import struct
+import time
+
+import numpy as np
+from numpy.lib.format import descr_to_dtype, dtype_to_descr
+
+MAGIC = b"X22C"
+VERSION = 1
+# magic, format version, length of the JSON description that follows
+HEADER = struct.Struct("<4sHI")
+ARRAY_KEY = "__array__"
+BYTES_KEY = "__bytes__"
+
+
+def packState(state):
+    """
+    Checkpoint bytes of ``state``: nested dicts and lists of numbers, strings,
+    None, bytes and numpy arrays (structured ones included).
+
+    The structure and the scalars go to a JSON description, bytes and arrays
+    follow it raw, so packing and unpacking cost one pass over the data.
+    """
+    blobs = []
+    size = 0
+
+    def blob(raw):
+        nonlocal size
+        offset = size
+        blobs.append(raw)
+        size += len(raw)
+        return offset
+
+    def encode(value):
+        if isinstance(value, dict):
+            return {key: encode(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [encode(item) for item in value]
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            raw = bytes(value)
+            return {BYTES_KEY: [blob(raw), len(raw)]}
+        if isinstance(value, np.ndarray):
+            return {ARRAY_KEY: [dtype_to_descr(value.dtype), list(value.shape), blob(np.ascontiguousarray(value).tobytes())]}
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    description = json.dumps(encode(state), separators=(",", ":")).encode()
+    return HEADER.pack(MAGIC, VERSION, len(description)) + description + b"".join(blobs)
+
+
+def unpackState(data):
+    """State packed by ``packState``, arrays are writable copies. Raises ValueError for anything else."""
+    data = bytes(data)
+    if len(data) < HEADER.size:
+        raise ValueError("Checkpoint truncated")
+    magic, version, length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a version {VERSION} checkpoint")
+    body = HEADER.size + length
+    if len(data) < body:
+        raise ValueError("Checkpoint truncated")
+
+    def decode(value):
+        if isinstance(value, list):
+            return [decode(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if ARRAY_KEY in value:
+            descr, shape, offset = value[ARRAY_KEY]
+            dtype = descr_to_dtype(descr)
+            count = int(np.prod(shape, dtype=np.int64))
+            if body + offset + count * dtype.itemsize > len(data):
+                raise ValueError("Checkpoint truncated")
+            return np.frombuffer(data, dtype=dtype, count=count, offset=body + offset).reshape(shape).copy()
+        if BYTES_KEY in value:
+            offset, length = value[BYTES_KEY]
+            if body + offset + length > len(data):
+                raise ValueError("Checkpoint truncated")
+            return data[body + offset : body + offset + length]
+        return {key: decode(item) for key, item in value.items()}
+
+    return decode(json.loads(data[HEADER.size : body]))
+
+
+class Checkpointer:
+    """
+    Writes the state returned by ``snapshot()`` to ``path``, at most once per ``interval`` seconds.
+
+    ``maybeSave`` is meant to be called from the thread that owns the state
+    (e.g. after every parsed message), ``save`` at shutdown. The checkpoint
+    is written next to ``path`` and renamed over it, so a crash while writing
+    leaves the previous one. ``load`` returns the saved state or None.
+    """
+
+    def __init__(self, path, snapshot, interval=10.0):
+        self.path = path
+        self.snapshot = snapshot
+        self.interval = interval
+        self.nextSave = time.monotonic() + interval
+        self.saves = 0
+        self.lastSize = 0
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        if now < self.nextSave:
+            return False
+        self.nextSave = now + self.interval
+        return True
+
+    def maybeSave(self, now=None):
+        if self.due(now):
+            self.save()
+
+    def save(self):
+        data = packState(self.snapshot())
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+        os.replace(temporary, self.path)
+        self.saves += 1
+        self.lastSize = len(data)
+        return len(data)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as file:
+            return unpackState(file.read())
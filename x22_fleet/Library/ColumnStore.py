@@ -0,0 +1,254 @@
+import os
+import re
+from functools import partial
+
+import numpy as np
+
+
+class Column:
+    """
+    Growable, NumPy-backed column with the ``array.array`` interface the parsers use.
+
+    Storage is one contiguous array whose capacity doubles when it runs full,
+    so appends are amortized O(1). With ``maxlen`` set only the newest
+    ``maxlen`` values are retained. Older values are handed to ``spill`` (if
+    set) in batches when the buffer is compacted, or by ``spillEvicted``.
+
+    Arrays returned by ``view`` share memory with the column. The column never
+    writes over rows it already holds (growing and compacting move to a fresh
+    buffer), so a view stays valid after later appends.
+    """
+
+    def __init__(self, typecode, maxlen=None, capacity=16, spill=None):
+        self.typecode = typecode
+        self.maxlen = maxlen
+        self.spill = spill
+        self.appended = 0
+        self._buffer = np.empty(capacity, dtype=typecode)
+        self._start = 0
+        self._stop = 0
+        # evicted values in _buffer[_spilled:_start] have not been spilled yet
+        self._spilled = 0
+
+    def __len__(self):
+        return self._stop - self._start
+
+    @property
+    def dtype(self):
+        return self._buffer.dtype
+
+    @property
+    def firstIndex(self):
+        """Running index (counted over everything ever appended) of the first retained value."""
+        return self.appended - len(self)
+
+    def append(self, value):
+        if self._stop == len(self._buffer):
+            self._reserve(1)
+        self._buffer[self._stop] = value
+        self._stop += 1
+        self.appended += 1
+        if self.maxlen is not None and self._stop - self._start > self.maxlen:
+            self._start += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._buffer.dtype)
+        count = len(values)
+        if self.maxlen is not None and count > self.maxlen:
+            self._start = self._stop
+            self.spillEvicted()
+            dropped = count - self.maxlen
+            if self.spill is not None:
+                self.spill(values[:dropped])
+            self.appended += dropped
+            values = values[dropped:]
+            count = self.maxlen
+        if self._stop + count > len(self._buffer):
+            self._reserve(count)
+        self._buffer[self._stop : self._stop + count] = values
+        self._stop += count
+        self.appended += count
+        if self.maxlen is not None and self._stop - self._start > self.maxlen:
+            self._start = self._stop - self.maxlen
+
+    def _reserve(self, count):
+        length = len(self)
+        capacity = len(self._buffer)
+        # only compact when that frees at least half the buffer, otherwise grow
+        while length + count > capacity // 2:
+            capacity *= 2
+        self.spillEvicted()
+        buffer = np.empty(capacity, dtype=self._buffer.dtype)
+        buffer[:length] = self._buffer[self._start : self._stop]
+        self._buffer = buffer
+        self._start = 0
+        self._stop = length
+        self._spilled = 0
+
+    def spillEvicted(self):
+        """Hand values evicted since the last spill to ``spill``."""
+        if self.spill is not None and self._spilled < self._start:
+            self.spill(self._buffer[self._spilled : self._start])
+        self._spilled = self._start
+
+    def view(self, start=None, stop=None):
+        """Zero-copy array of the retained values ``[start:stop]`` (slice semantics)."""
+        return self._buffer[self._start : self._stop][start:stop]
+
+    def tolist(self):
+        return self.view().tolist()
+
+    def clear(self):
+        self._start = self._stop
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.view()[key]
+        return self.view()[key].item()
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.view()
+        if dtype is not None:
+            return values.astype(dtype)
+        return values.copy() if copy else values
+
+    def __repr__(self):
+        return f"Column('{self.typecode}', {self.tolist()!r})"
+
+
+class ColumnStore:
+    """
+    Columns of one stream type, e.g. ``ColumnStore("Lhhh")`` for sample number + x/y/z.
+
+    Behaves like the list of columns it replaces (``store[0].append(...)``,
+    ``len(store)`` is the number of columns, ``np.array(store)`` stacks them).
+    """
+
+    def __init__(self, typecodes, maxlen=None):
+        self.columns = [Column(typecode, maxlen=maxlen) for typecode in typecodes]
+
+    def spillTo(self, spill):
+        """Route evicted values to ``spill(columnIndex, values)``."""
+        for index, column in enumerate(self.columns):
+            column.spill = partial(spill, index)
+
+    def spillEvicted(self):
+        for column in self.columns:
+            column.spillEvicted()
+
+    @property
+    def length(self):
+        """Number of retained rows."""
+        return len(self.columns[0])
+
+    @property
+    def appended(self):
+        """Number of rows ever appended."""
+        return self.columns[0].appended
+
+    def append(self, row):
+        for column, value in zip(self.columns, row):
+            column.append(value)
+
+    def extend(self, columns):
+        for column, values in zip(self.columns, columns):
+            column.extend(values)
+
+    def view(self, start=None, stop=None):
+        """Zero-copy arrays of rows ``[start:stop]``, one per column."""
+        return [column.view(start, stop) for column in self.columns]
+
+    def clear(self):
+        for column in self.columns:
+            column.clear()
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self.view(), dtype=dtype)
+
+    def __repr__(self):
+        return f"ColumnStore({self.columns!r})"
+
+
+def iterNewRows(streams, steps):
+    """
+    Advance the generator ``steps`` and after each step yield ``(name, rows)``
+    for every store in ``streams`` (``{name: ColumnStore}``) that grew.
+
+    ``rows`` are zero-copy views of the new rows, one array per column.
+    Returns what ``steps`` returns.
+    """
+    named = list(streams.items())
+    counts = [store.appended for _, store in named]
+    while True:
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+        for index, (name, store) in enumerate(named):
+            appended = store.appended
+            if appended != counts[index]:
+                newRows = min(appended - counts[index], store.length)
+                counts[index] = appended
+                yield name, store.view(-newRows)
+
+
+class SpillSink:
+    """
+    Appends values evicted from bounded column stores to raw little-endian files.
+
+    Each column goes to ``<directory>/<stream>.<column>.<dtype>``, e.g.
+    ``ImuAccRaw.1.i2``, and can be read back with ``SpillSink.load``. Files are
+    opened per write, evictions arrive in batches of about ``maxlen`` values.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, stream, column, values):
+        dtype = values.dtype.newbyteorder("<")
+        path = os.path.join(self.directory, f"{stream}.{column}.{dtype.kind}{dtype.itemsize}")
+        with open(path, "ab") as file:
+            file.write(values.astype(dtype, copy=False).tobytes())
+
+    @staticmethod
+    def load(directory, stream):
+        """Spilled columns of ``stream`` as arrays, in column order."""
+        columns = {}
+        for filename in os.listdir(directory):
+            match = re.fullmatch(rf"{re.escape(stream)}\.(\d+)\.([a-z]\d+)", filename)
+            if match:
+                columns[int(match.group(1))] = np.fromfile(os.path.join(directory, filename), dtype="<" + match.group(2))
+        return [columns[index] for index in sorted(columns)]
+
+
+class Retention:
+    """
+    Live retention window per sensor, given in samples or in seconds at ``sampleRate``.
+
+    Samples falling out of the window are spilled below ``spillDir`` (one
+    directory per sensor) or dropped when ``spillDir`` is None.
+    """
+
+    def __init__(self, samples=None, seconds=None, sampleRate=500, spillDir=None):
+        if samples is None and seconds is not None:
+            samples = int(seconds * sampleRate)
+        self.maxlen = samples
+        self.spillDir = spillDir
+
+    def sink(self, deviceName):
+        if self.spillDir is None:
+            return None
+        return SpillSink(os.path.join(self.spillDir, re.sub(r"[^\w.-]+", "_", deviceName)))
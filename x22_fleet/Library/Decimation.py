@@ -0,0 +1,213 @@
+import numpy as np
+
+from x22_fleet.Library.ColumnStore import ColumnStore
+
+# rows per bucket of each level, every factor divides the next
+LEVELS = (10, 100, 1000)
+
+
+class RawLevel:
+    """The ColumnStore itself as level 0 of a pyramid, one bucket per row."""
+
+    factor = 1
+
+    def __init__(self, store, columns):
+        self.store = store
+        self.columns = columns
+
+    @property
+    def firstIndex(self):
+        return self.store.appended - self.store.length
+
+    @property
+    def stopIndex(self):
+        return self.store.appended
+
+    def rows(self, start, stop):
+        """``(x, minimum, maximum, mean)`` of running rows ``[start:stop)``, values as ``(n, columns)``."""
+        first = self.firstIndex
+        x = self.store[0].view(start - first, stop - first)
+        values = np.column_stack([self.store[column].view(start - first, stop - first) for column in self.columns])
+        return x, values, values, values.astype(np.float32)
+
+
+class DecimationLevel:
+    """
+    min / max / mean of ``factor`` consecutive rows of the stream, per value column.
+
+    Buckets are aligned to the running row index of the stream, bucket ``b``
+    covers rows ``b * factor .. (b + 1) * factor - 1``; only complete buckets
+    are stored. Built from the next finer level (``source``), so each level
+    reduces ``factor / source.factor`` rows of it.
+    """
+
+    def __init__(self, factor, source, xTypecode, valueTypecodes, maxlen=None):
+        self.factor = factor
+        self.source = source
+        self.ratio = factor // source.factor
+        self.columns = len(valueTypecodes)
+        # x of the first row, minimum, maximum and mean per value column
+        self.store = ColumnStore(xTypecode + valueTypecodes * 2 + "f" * self.columns, maxlen=maxlen)
+        self.shift = 0  # bucket index of store row r is r + shift
+
+    @property
+    def firstIndex(self):
+        return self.store.appended - self.store.length + self.shift
+
+    @property
+    def stopIndex(self):
+        return self.store.appended + self.shift
+
+    def update(self):
+        source = self.source
+        start = self.stopIndex * self.ratio
+        if source.firstIndex > start:
+            # the source dropped rows before they were reduced, restart at the next complete bucket
+            self.store.clear()
+            self.shift = -(-source.firstIndex // self.ratio) - self.store.appended
+            start = self.stopIndex * self.ratio
+        stop = source.stopIndex // self.ratio * self.ratio
+        if stop <= start:
+            return
+        x, minimum, maximum, mean = source.rows(start, stop)
+        shape = (-1, self.ratio, self.columns)
+        self.store.extend(
+            [x[:: self.ratio]]
+            + list(minimum.reshape(shape).min(axis=1).T)
+            + list(maximum.reshape(shape).max(axis=1).T)
+            + list(mean.reshape(shape).mean(axis=1, dtype=np.float64).T)
+        )
+
+    def rows(self, start, stop):
+        first = self.firstIndex
+        columns = self.store.view(start - first, stop - first)
+        count = self.columns
+        return (
+            columns[0],
+            np.column_stack(columns[1 : 1 + count]),
+            np.column_stack(columns[1 + count : 1 + 2 * count]),
+            np.column_stack(columns[1 + 2 * count :]),
+        )
+
+
+class DecimationPyramid:
+    """
+    1:10, 1:100 and 1:1000 min / max / mean summaries of one ColumnStore, for plotting long series.
+
+    ``update`` reduces the rows appended since its last call (the queries
+    call it), so the work is spread over the session and a query touches at
+    most about ``width`` buckets whatever the range: ``query(start, stop,
+    width)`` picks the finest level with at most ``width`` buckets between
+    the x values (column 0, assumed increasing) ``start`` and ``stop``,
+    ``tail(rows, width)`` does the same for the newest ``rows`` rows. Both
+    return ``(factor, x, minimum, maximum, mean)`` with the values as
+    ``(n, columns)`` arrays; rows not yet in a complete bucket of the chosen
+    level are filled in from the finer levels, so the newest samples are
+    always included.
+
+    Levels keep ``maxlen / factor`` buckets when the store is bounded, and
+    need an ``update`` at least once per ``maxlen`` appended rows.
+    """
+
+    def __init__(self, store, columns=(1, 2, 3), levels=LEVELS):
+        self.store = store
+        maxlen = store[0].maxlen
+        self.levels = [RawLevel(store, columns)]
+        valueTypecodes = "".join(store[column].typecode for column in columns)
+        for factor in levels:
+            self.levels.append(
+                DecimationLevel(
+                    factor,
+                    self.levels[-1],
+                    store[0].typecode,
+                    valueTypecodes,
+                    maxlen=None if maxlen is None else -(-maxlen // factor),
+                )
+            )
+
+    def update(self):
+        for level in self.levels[1:]:
+            level.update()
+
+    def levelFor(self, rows, width):
+        """Index into ``levels`` of the finest level showing ``rows`` rows in at most ``width`` buckets."""
+        for index, level in enumerate(self.levels):
+            if -(-rows // level.factor) <= width:
+                return index
+        return len(self.levels) - 1
+
+    def rowRange(self, start, stop, width):
+        """Decimated running rows ``[start:stop)`` of the store, see the class docstring."""
+        self.update()
+        start = max(start, self.levels[0].firstIndex)
+        stop = min(stop, self.levels[0].stopIndex)
+        chosen = self.levelFor(max(stop - start, 0), width)
+        pieces = []
+        cursor = start
+        for level in reversed(self.levels[: chosen + 1]):
+            factor = level.factor
+            first = max(cursor // factor, level.firstIndex)
+            last = min(-(-stop // factor), level.stopIndex)
+            if last > first:
+                pieces.append(level.rows(first, last))
+                cursor = last * factor
+            if cursor >= stop:
+                break
+        if not pieces:
+            x, minimum, maximum, mean = self.levels[0].rows(0, 0)
+            return self.levels[chosen].factor, x, minimum, maximum, mean
+        return (self.levels[chosen].factor,) + tuple(np.concatenate(part) for part in zip(*pieces))
+
+    def query(self, start, stop, width):
+        """Decimated rows with ``start <= x <= stop``."""
+        x = self.store[0].view()
+        first = self.levels[0].firstIndex
+        return self.rowRange(
+            first + int(np.searchsorted(x, start, "left")),
+            first + int(np.searchsorted(x, stop, "right")),
+            width,
+        )
+
+    def tail(self, rows, width):
+        stop = self.levels[0].stopIndex
+        return self.rowRange(stop - rows, stop, width)
+
+    def nbytes(self):
+        return sum(column.view().nbytes for level in self.levels[1:] for column in level.store)
+
+
+class DecimationPyramids:
+    """
+    DecimationPyramid per stream of a DeviceDataBuffer, created on first use:
+    ``dataBuffer.pyramids["ImuAccRaw"].tail(500 * 3600, 1000)``.
+    """
+
+    def __init__(self, dataBuffer):
+        self.dataBuffer = dataBuffer
+        self.pyramids = {}
+
+    def __getitem__(self, name):
+        store = self.dataBuffer.dataDict[name].data
+        pyramid = self.pyramids.get(name)
+        if pyramid is None or pyramid.store is not store:
+            pyramid = self.pyramids[name] = DecimationPyramid(store, tuple(range(1, len(store))))
+        return pyramid
+
+
+def minMaxDecimate(x, y, width):
+    """
+    At most ``2 * width`` points of the series ``(x, y)`` keeping each bucket's min and max in x order,
+    for one-off plots of arrays (a DecimationPyramid serves growing ColumnStores).
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(y) <= 2 * width:
+        return x, y
+    factor = -(-len(y) // width)
+    complete = len(y) // factor * factor
+    buckets = y[:complete].reshape(-1, factor)
+    offsets = np.arange(0, complete, factor)
+    lows = offsets + np.argmin(buckets, axis=1)
+    highs = offsets + np.argmax(buckets, axis=1)
+    indexes = np.sort(np.concatenate([lows, highs, np.arange(complete, len(y))]))
+    return x[indexes], y[indexes]
@@ -1,25 +1,31 @@
 import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 from datetime import datetime
 from x22_fleet.Library.dataParser import Parser
 
-class FullScaleRangeConstants:
-    """
-    Constants for full-scale range factors.
-    """
-    ACC_FACTOR = 0.488 / 1000
-    GYRO_FACTOR = 140 / 1000
-    MAG_FACTOR = 1 / 1711
-
 class DumpFileParser:
     """
     Class to parse dump files and extract relevant information.
     """
 
+    # frame types feeding the streams get_parser_buffer reads, everything else is only skipped
+    DECODED_TYPES = (
+        Parser.DataStreamType.DATA_TYPE_IMU_RAW_COMBO,
+        Parser.DataStreamType.DATA_TYPE_IMU_RAW_COMBO_V2,
+        Parser.DataStreamType.DATA_TYPE_IMU_RAW_ACC,
+        Parser.DataStreamType.DATA_TYPE_IMU_RAW_GYR,
+        Parser.DataStreamType.DATA_TYPE_IMU_RAW_MAG,
+        Parser.DataStreamType.DATA_TYPE_SYS_BATTERY,
+        Parser.DataStreamType.DATA_TYPE_IMU_CONFIG,
+    )
+
     def __init__(self, raw_data_dir="rawdata"):
         self.directory_path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), raw_data_dir))
+        self.file_timings = []  # (filename, seconds) of the last parse_files run
         print(f"Initialized DumpFileParser with directory: {self.directory_path}")
 
     @staticmethod
@@ -27,48 +33,95 @@ class DumpFileParser:
         message = " ".join(map(str, args))
         print(f"Log info: {message}")
 
-    def get_parser_buffer(self, device_name, timestamp, data):
-        acc = np.array(data.dataDict["ImuAccRaw"].data).T
-        gyr = np.array(data.dataDict["ImuGyrRaw"].data)[1:4].T
-        mag = np.array(data.dataDict["ImuMagRaw"].data)[1:4].T
-        bat = np.array(data.dataDict["Battery"].data).T
-        temp = np.array(data.dataDict["ImuTemp"].data).T
+    def get_parser_buffer(self, device_name, timestamp, parser):
+        # float32 physical units scaled by the dump's IMU_CONFIG, the rest are views on the column stores
+        data = parser.dataBuffer
+        units = parser.units
+        bat = np.column_stack(data.dataDict["Battery"].data.view())
+        temp = np.column_stack(data.dataDict["ImuTemp"].data.view())
 
         sanitized_device_name = re.sub(r"[ :]+", "_", device_name).strip()
         device_data = {
-            "x_vals": list(acc[:, 0]),
-            "y_vals_acc": acc[:, 1:4] * FullScaleRangeConstants.ACC_FACTOR,
-            "y_vals_gyr": gyr * FullScaleRangeConstants.GYRO_FACTOR,
-            "y_vals_mag": mag * FullScaleRangeConstants.MAG_FACTOR,
+            "x_vals": data.dataDict["ImuAccRaw"].data[0].view().astype(np.int64),
+            "y_vals_acc": units["acc"],
+            "y_vals_gyr": units["gyr"],
+            "y_vals_mag": units["mag"],
             "y_vals_bat": bat,
             "y_vals_temp": temp,
+            # received sample ranges, (n, 2) rows of start, stop
+            "sample_intervals": parser.gaps.asArray(),
         }
         print(f"Processed data for device: {sanitized_device_name}")
         return device_data
 
     def parse_and_load_to_memory(self, device_name, timestamp, binary_data):
-        parser = Parser(logf=self.log_info)
+        parser = Parser(logf=self.log_info, types=self.DECODED_TYPES)
         parser.parseStream(binary_data)
         print(f"Parsing data for device: {device_name}, Timestamp: {timestamp}")
-        return self.get_parser_buffer(device_name, timestamp, parser.dataBuffer)
+        return self.get_parser_buffer(device_name, timestamp, parser)
 
-    def find_and_parse_files(self):
-        parsed_data = []
+    def parse_file_to_memory(self, device_name, timestamp, file_path):
+        # the dump is mapped and parsed window by window instead of read into memory
+        parser = Parser(logf=self.log_info, types=self.DECODED_TYPES)
+        parser.parseFile(file_path)
+        print(f"Parsing data for device: {device_name}, Timestamp: {timestamp}")
+        return self.get_parser_buffer(device_name, timestamp, parser)
+
+    def parse_file_range(self, file_path, samples=None, seconds=None):
+        # decodes only the frames covering the range, using the .idx sidecar of the dump
+        device_name, timestamp = self.extract_info_from_filename(os.path.basename(file_path))
+        parser = Parser(logf=self.log_info, types=self.DECODED_TYPES)
+        parser.parseFileRange(file_path, samples=samples, seconds=seconds)
+        print(f"Parsing range {samples or seconds} for device: {device_name}, Timestamp: {timestamp}")
+        return self.get_parser_buffer(device_name or "", timestamp, parser)
+
+    def find_and_parse_files(self, workers=None):
+        dump_files = []
         print(f"Scanning directory: {self.directory_path} for files")
         for root, _, files in os.walk(self.directory_path):
             print(f"Found {len(files)} files in directory: {root}")
             for filename in files:
                 if filename.endswith(".bd.uploaded"):
-                    parsed_data.append(self.process_file(filename, root))
+                    dump_files.append((filename, root))
+        # os.walk order depends on the filesystem, sort so results come back in a stable order
+        dump_files.sort(key=lambda dump_file: (dump_file[1], dump_file[0]))
+        return self.parse_files(dump_files, workers=workers)
+
+    def parse_files(self, dump_files, workers=None):
+        """
+        Parse ``(filename, root)`` pairs, in a pool of ``workers`` processes if given.
+
+        Results are returned in the order of ``dump_files``. Workers send back the
+        NumPy arrays of get_parser_buffer, the parser buffers stay in the worker.
+        """
+        filenames = [filename for filename, _ in dump_files]
+        roots = [root for _, root in dump_files]
+        start = time.perf_counter()
+        if workers and workers > 1 and len(dump_files) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(self.timed_process_file, filenames, roots))
+        else:
+            results = [self.timed_process_file(filename, root) for filename, root in dump_files]
+
+        parsed_data = []
+        self.file_timings = []
+        for filename, (result, elapsed) in zip(filenames, results):
+            print(f"Parsed {filename} in {elapsed:.3f} s")
+            self.file_timings.append((filename, elapsed))
+            parsed_data.append(result)
+        print(f"Parsed {len(parsed_data)} files in {time.perf_counter() - start:.3f} s (workers: {workers or 1})")
         return parsed_data
 
+    def timed_process_file(self, filename, root):
+        start = time.perf_counter()
+        result = self.process_file(filename, root)
+        return result, time.perf_counter() - start
+
     def process_file(self, filename, root):
         print(f"Processing file: {filename}")
-        with open(os.path.join(root, filename), "rb") as file:
-            binary_data = file.read()
-            device_name, timestamp = self.extract_info_from_filename(filename)
-            if device_name and timestamp:
-                return device_name, self.parse_and_load_to_memory(device_name, timestamp, binary_data)
+        device_name, timestamp = self.extract_info_from_filename(filename)
+        if device_name and timestamp:
+            return device_name, self.parse_file_to_memory(device_name, timestamp, os.path.join(root, filename))
         return None, None
 
     @staticmethod
@@ -92,7 +145,11 @@ class EvaluationSummary:
             device_summary[device_name] = {"total_samples": 0, "missing_samples": 0}
         x_vals = device_data["x_vals"]
         total_samples = len(x_vals)
-        missing_samples = np.sum(np.diff(x_vals) - 1)
+        intervals = device_data.get("sample_intervals")
+        if intervals is not None and len(intervals):
+            missing_samples = np.sum(intervals[1:, 0] - intervals[:-1, 1])
+        else:
+            missing_samples = np.sum(np.diff(x_vals) - 1)
         device_summary[device_name]["total_samples"] += total_samples
         device_summary[device_name]["missing_samples"] += missing_samples
         print(f"Updated summary for device: {device_name}")
@@ -121,7 +178,7 @@ class EvaluationSummary:
 
 if __name__ == "__main__":
     parser = DumpFileParser()
-    parsed_data = parser.find_and_parse_files()
+    parsed_data = parser.find_and_parse_files(workers=os.cpu_count())
 
     evaluation = EvaluationSummary()
     df = evaluation.generate_summary(parsed_data)
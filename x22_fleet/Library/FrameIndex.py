@@ -0,0 +1,213 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from x22_fleet.Library.GapTracker import GapTracker
+from x22_fleet.Library.SampleClock import SampleClock
+
+# Frame types carrying the sample number of their first sample:
+# type byte -> (offset of the u16 sample count, offset of the u64 tsf) in the payload, None if absent.
+# The sample number itself is the u32 at the start of the payload.
+SAMPLE_FRAMES = {
+    0x1C: (4, None),  # DATA_TYPE_IMU_RAW_COMBO_V2
+    0x1E: (12, 4),  # DATA_TYPE_IMU_RAW_COMBO_V3
+    0x43: (None, None),  # DATA_TYPE_SYS_PING_V2, stamped with the current sample number
+}
+
+
+class FrameIndex:
+    """
+    Offsets of all valid frames in a dump file, stored next to it as ``<dump>.idx``.
+
+    One row per frame with its ``offset`` in the file, ``type`` byte, payload
+    ``length``, ``frameNumber`` (the running frame counter parseStream hands
+    to the decoders), ``sampleNumber``/``sampleCount`` of sample carrying
+    frames and ``tsf`` of V3 combo frames (-1 where a frame has none).
+
+    Building the index scans the file once without decoding anything. After
+    that ``select`` picks frames by sample number, seconds or tsf and
+    ``decode`` parses only those, so a 10 s window of a long recording no
+    longer needs the whole file parsed.
+
+    Typical use::
+
+        index = FrameIndex.open(path, parser)
+        index.decode(path, parser, index.select(seconds=(60, 70)))
+    """
+
+    MAGIC = b"X22BDIX1"
+    HEADER = struct.Struct("<8sQQ")  # magic, size and mtime (ns) of the indexed dump
+    dtype = np.dtype(
+        [
+            ("offset", "<u8"),
+            ("type", "u1"),
+            ("length", "<u2"),
+            ("frameNumber", "<u4"),
+            ("sampleNumber", "<i8"),
+            ("sampleCount", "<u2"),
+            ("tsf", "<i8"),
+        ]
+    )
+
+    def __init__(self, frames, fileSize=0, mtimeNs=0):
+        self.frames = frames
+        self.fileSize = fileSize
+        self.mtimeNs = mtimeNs
+
+    def __len__(self):
+        return len(self.frames)
+
+    @staticmethod
+    def sidecarPath(path):
+        return path + ".idx"
+
+    @classmethod
+    def build(cls, path, parser):
+        """Scan ``path`` with ``parser``'s frame scanner and index every valid frame."""
+        stat = os.stat(path)
+        rows = []
+        if stat.st_size:
+            scanner = parser.scanner
+            # the frame counter counts every decodable frame, also those a projecting parser skips
+            dispatch = type(parser).dispatch
+            headerLength = parser.HEADER_LENGTH
+            packetOverhead = headerLength + parser.CRC_LENGTH
+            frameNumber = 0
+            with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                i = 0
+                while True:
+                    i, datatype, sampleLength = scanner.nextFrame(mapped, i, stat.st_size)
+                    if datatype is None:
+                        break
+                    payload = i + headerLength
+                    sampleNumber = sampleCount = tsf = -1
+                    if datatype in SAMPLE_FRAMES and sampleLength >= 4:
+                        countOffset, tsfOffset = SAMPLE_FRAMES[datatype]
+                        (sampleNumber,) = struct.unpack_from("<I", mapped, payload)
+                        sampleCount = 0
+                        if countOffset is not None and sampleLength >= countOffset + 2:
+                            (sampleCount,) = struct.unpack_from("<H", mapped, payload + countOffset)
+                        if tsfOffset is not None and sampleLength >= tsfOffset + 8:
+                            (tsf,) = struct.unpack_from("<Q", mapped, payload + tsfOffset)
+                    rows.append((i, datatype, sampleLength, frameNumber, sampleNumber, max(sampleCount, 0), tsf))
+                    if dispatch[datatype]:
+                        frameNumber += 1
+                    i += packetOverhead + sampleLength
+        return cls(np.array(rows, dtype=cls.dtype), stat.st_size, stat.st_mtime_ns)
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(self.HEADER.pack(self.MAGIC, self.fileSize, self.mtimeNs))
+            file.write(self.frames.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        """Index stored at ``path``, or None if it is not a frame index."""
+        with open(path, "rb") as file:
+            header = file.read(cls.HEADER.size)
+            if len(header) < cls.HEADER.size:
+                return None
+            magic, fileSize, mtimeNs = cls.HEADER.unpack(header)
+            if magic != cls.MAGIC:
+                return None
+            frames = np.fromfile(file, dtype=cls.dtype)
+        return cls(frames, fileSize, mtimeNs)
+
+    @classmethod
+    def open(cls, path, parser, save=True):
+        """
+        Index of the dump at ``path``, read from its sidecar when that is up to date.
+
+        Otherwise the dump is scanned and (with ``save``) the sidecar rewritten.
+        """
+        sidecar = cls.sidecarPath(path)
+        stat = os.stat(path)
+        if os.path.exists(sidecar):
+            index = cls.load(sidecar)
+            if index is not None and (index.fileSize, index.mtimeNs) == (stat.st_size, stat.st_mtime_ns):
+                return index
+        index = cls.build(path, parser)
+        if save:
+            index.save(sidecar)
+        return index
+
+    def select(self, samples=None, seconds=None, tsf=None, types=None, sampleRate=500):
+        """
+        Frames needed for a sample number, time or tsf range, as rows of ``frames``.
+
+        Ranges are ``(start, stop)`` with ``stop`` excluded. ``seconds`` count
+        from the first sample of the file at ``sampleRate``. Sample frames
+        overlapping the range are selected together with all other frames
+        (battery, ping, ...) stored between them; ``types`` (type bytes)
+        restricts the result to those frame types.
+        """
+        frames = self.frames
+        mask = np.ones(len(frames), dtype=bool)
+        if seconds is not None:
+            sampleFrames = frames[frames["sampleCount"] > 0]
+            first = int(sampleFrames["sampleNumber"].min()) if len(sampleFrames) else 0
+            samples = (first + int(seconds[0] * sampleRate), first + int(seconds[1] * sampleRate))
+        if samples is not None:
+            start, stop = samples
+            mask &= self.region(
+                (frames["sampleCount"] > 0)
+                & (frames["sampleNumber"] < stop)
+                & (frames["sampleNumber"] + frames["sampleCount"] > start)
+            )
+        if tsf is not None:
+            start, stop = tsf
+            mask &= self.region((frames["tsf"] >= start) & (frames["tsf"] < stop))
+        if types is not None:
+            mask &= np.isin(frames["type"], list(types))
+        return frames[mask]
+
+    def gaps(self, types=None):
+        """GapTracker of the sample frames (restricted to ``types``), built from the index without decoding."""
+        frames = self.frames[self.frames["sampleCount"] > 0]
+        if types is not None:
+            frames = frames[np.isin(frames["type"], list(types))]
+        return GapTracker.fromPackets(frames["sampleNumber"], frames["sampleCount"])
+
+    def clock(self, types=None):
+        """SampleClock fitted to the ``(sampleNumber, tsf)`` pairs of the indexed frames carrying a tsf."""
+        frames = self.frames[self.frames["tsf"] >= 0]
+        if types is not None:
+            frames = frames[np.isin(frames["type"], list(types))]
+        clock = SampleClock()
+        clock.updateMany(frames["sampleNumber"], frames["tsf"])
+        return clock
+
+    @staticmethod
+    def region(matches):
+        """Mask covering everything from the first to the last match."""
+        mask = np.zeros(len(matches), dtype=bool)
+        hits = np.flatnonzero(matches)
+        if len(hits):
+            mask[hits[0] : hits[-1] + 1] = True
+        return mask
+
+    @staticmethod
+    def decode(path, parser, frames):
+        """Decode the indexed ``frames`` of the dump at ``path`` into ``parser.dataBuffer``."""
+        if not len(frames):
+            return parser
+        dispatch = parser.dispatch
+        headerLength = parser.HEADER_LENGTH
+        packetOverhead = headerLength + parser.CRC_LENGTH
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset, datatype, length, frameNumber in zip(
+                frames["offset"].tolist(), frames["type"].tolist(), frames["length"].tolist(), frames["frameNumber"].tolist()
+            ):
+                parserFunc = dispatch[datatype]
+                if parserFunc is None:
+                    continue
+                try:
+                    # decoders get a bytes copy of the frame (including the CRC, some read
+                    # past their payload), so nothing keeps the mapping exported
+                    frame = mapped[offset : offset + packetOverhead + length]
+                    parserFunc(parser, frame, headerLength, length, frameNumber)
+                except Exception as e:
+                    parser.logf(f"Parser: Exception while parising: {str(e)} in function: {str(parserFunc)}")
+        return parser
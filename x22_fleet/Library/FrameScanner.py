@@ -0,0 +1,128 @@
+import re
+
+import crcmod
+
+crc16_mod = crcmod.mkCrcFun(0x18005, rev=True, initCrc=0x0000, xorOut=0x0000)
+
+
+def dispatchTable(parsers):
+    """
+    256-entry list of parse functions indexed by the raw type byte.
+
+    Built once from a parser's ``{DataStreamType: parseFunction}`` mapping so
+    dispatching a frame needs neither an Enum construction nor a dict lookup.
+    """
+    table = [None] * 256
+    for datatype, parserFunc in parsers.items():
+        table[datatype.value] = parserFunc
+    return table
+
+
+def projectedTable(table, types):
+    """Copy of a dispatch table with parse functions only for ``types`` (type bytes or DataStreamTypes)."""
+    keep = {getattr(datatype, "value", datatype) for datatype in types}
+    return [parserFunc if datatype in keep else None for datatype, parserFunc in enumerate(table)]
+
+
+class FrameScanner:
+    """
+    Locates CRC-valid ``[headerID:1] [type:1] [length:2] [payload] [crc:2]`` frames in a buffer.
+
+    Garbage between frames is skipped with a C-level ``find`` for the next header
+    byte instead of testing one byte per Python iteration (a compiled regex
+    search for buffers without ``find`` such as memoryviews). A candidate
+    header must carry a known type and a length within ``maxPacketLen`` before
+    its CRC is computed. Types passed to ``skipCrcFor`` are accepted on the
+    header alone, which is cheaper but lets a header-like pattern in garbage
+    swallow the bytes it claims.
+    """
+
+    def __init__(self, knownTypes, headerId=0x7C, headerLength=4, crcLength=2, maxPacketLen=2048, warn=None):
+        self.knownTypes = bytearray(256)
+        for datatype in knownTypes:
+            self.knownTypes[datatype] = 1
+        self.uncheckedTypes = bytearray(256)
+        self.headerId = headerId
+        self.headerByte = bytes([headerId])
+        self.headerPattern = re.compile(re.escape(self.headerByte))
+        self.headerLength = headerLength
+        self.crcLength = crcLength
+        self.maxPacketLen = maxPacketLen
+        self.warn = warn
+        self.resetCounters()
+
+    def skipCrcFor(self, types):
+        for datatype in types:
+            self.uncheckedTypes[datatype] = 1
+
+    def resetCounters(self):
+        self.frames = 0
+        self.skippedBytes = 0
+        self.crcFailures = 0
+        self.oversizedFrames = 0
+        self.unknownTypes = 0
+
+    def nextFrame(self, buffer, i, end):
+        """
+        Find the next valid frame in ``buffer[i:end]``.
+
+        Returns ``(offset, datatype, sampleLength)`` of the frame, or
+        ``(offset, None, None)`` when no complete frame is left; ``offset`` is
+        then where scanning has to resume once more data has arrived.
+        """
+        knownTypes = self.knownTypes
+        uncheckedTypes = self.uncheckedTypes
+        headerId = self.headerId
+        headerLength = self.headerLength
+        minPacketLength = headerLength + self.crcLength
+        while True:
+            if end - i < minPacketLength:
+                return i, None, None
+
+            if buffer[i] != headerId:
+                if hasattr(buffer, "find"):
+                    nextHeader = buffer.find(self.headerByte, i, end)
+                else:
+                    match = self.headerPattern.search(buffer, i, end)
+                    nextHeader = match.start() if match else -1
+                if nextHeader < 0:
+                    self.skippedBytes += end - i
+                    return end, None, None
+                self.skippedBytes += nextHeader - i
+                i = nextHeader
+                continue
+
+            datatype = buffer[i + 1]
+            sampleLength = buffer[i + 2] | (buffer[i + 3] << 8)
+            packetLength = minPacketLength + sampleLength
+
+            if not knownTypes[datatype]:
+                self.unknownTypes += 1
+                self.skippedBytes += 1
+                i += 1
+                continue
+
+            if packetLength > self.maxPacketLen:
+                self.oversizedFrames += 1
+                if self.warn:
+                    self.warn(f"Packet length {packetLength} exceeds maximum {self.maxPacketLen}")
+                self.skippedBytes += 1
+                i += 1
+                continue
+
+            if end - i < packetLength:
+                return i, None, None
+
+            if not uncheckedTypes[datatype]:
+                crcStart = i + headerLength + sampleLength
+                crcGot = buffer[crcStart] | (buffer[crcStart + 1] << 8)
+                if crcGot != crc16_mod(memoryview(buffer)[i:crcStart]):
+                    self.crcFailures += 1
+                    if self.warn:
+                        self.warn(f"CRC mismatch for packet at offset {i}")
+                    self.skippedBytes += 1
+                    i += 1
+                    continue
+
+            self.frames += 1
+            return i, datatype, sampleLength
@@ -0,0 +1,170 @@
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+
+class GapTracker:
+    """
+    Received sample numbers of one sensor as a sorted set of half-open intervals.
+
+    Fed once per packet with its first sample number and sample count
+    (``add``), or in one go from per-packet arrays (``fromPackets``), so the
+    work is O(packets) instead of O(samples). Packets continuing the newest
+    interval only move its end; late or repeated packets are merged in with a
+    bisect. ``missingSamples`` counts the samples in the gaps between the
+    first and the last received sample, samples received more than once are
+    counted in ``duplicateSamples``, packets starting below the highest
+    sample number already seen in ``outOfOrderPackets``.
+    """
+
+    # counters saved next to the intervals by ``state``
+    STATE = ("packets", "receivedSamples", "missingSamples", "duplicateSamples", "outOfOrderPackets", "highest", "previousStop")
+
+    def __init__(self):
+        self.starts = []
+        self.stops = []
+        self.packets = 0
+        self.receivedSamples = 0
+        self.missingSamples = 0
+        self.duplicateSamples = 0
+        self.outOfOrderPackets = 0
+        self.highest = None  # highest stop seen so far
+        self.previousStop = None  # stop of the packet added last
+
+    def add(self, first, count):
+        """
+        Record a packet with samples ``first .. first + count - 1``.
+
+        Returns True if it does not directly continue the previous packet.
+        """
+        if count <= 0:
+            return False
+        stop = first + count
+        discontinuous = self.previousStop is not None and first != self.previousStop
+        self.previousStop = stop
+        self.packets += 1
+        self.receivedSamples += count
+
+        starts = self.starts
+        stops = self.stops
+        if not stops or first > stops[-1]:
+            if stops:
+                self.missingSamples += first - stops[-1]
+            starts.append(first)
+            stops.append(stop)
+        elif first == stops[-1]:
+            stops[-1] = stop
+        else:
+            self.merge(first, stop)
+
+        if self.highest is not None and first < self.highest:
+            self.outOfOrderPackets += 1
+        if self.highest is None or stop > self.highest:
+            self.highest = stop
+        return discontinuous
+
+    def merge(self, first, stop):
+        starts = self.starts
+        stops = self.stops
+        # intervals overlapping or touching [first, stop)
+        lo = bisect_left(stops, first)
+        hi = bisect_right(starts, stop)
+        duplicates = 0
+        for start, end in zip(starts[lo:hi], stops[lo:hi]):
+            duplicates += max(0, min(stop, end) - max(first, start))
+        self.duplicateSamples += duplicates
+        # new samples not widening the received range fill a gap
+        widened = max(0, stop - stops[-1]) + max(0, starts[0] - first)
+        self.missingSamples -= stop - first - duplicates - widened
+        if lo < hi:
+            first = min(first, starts[lo])
+            stop = max(stop, stops[hi - 1])
+        starts[lo:hi] = [first]
+        stops[lo:hi] = [stop]
+
+    @classmethod
+    def fromPackets(cls, firsts, counts):
+        """Tracker for packets given as arrays of first sample numbers and sample counts, in arrival order."""
+        firsts = np.asarray(firsts, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+        keep = counts > 0
+        firsts = firsts[keep]
+        counts = counts[keep]
+        tracker = cls()
+        if not len(firsts):
+            return tracker
+        stops = firsts + counts
+
+        highest = np.maximum.accumulate(stops)
+        tracker.packets = len(firsts)
+        tracker.receivedSamples = int(counts.sum())
+        tracker.outOfOrderPackets = int(np.count_nonzero(firsts[1:] < highest[:-1]))
+        tracker.highest = int(highest[-1])
+        tracker.previousStop = int(stops[-1])
+
+        # in start order everything received before a packet below the running maximum is contiguous
+        order = np.argsort(firsts, kind="stable")
+        sortedFirsts = firsts[order]
+        sortedStops = stops[order]
+        covered = np.maximum.accumulate(sortedStops)
+        previousCovered = np.concatenate(([sortedFirsts[0]], covered[:-1]))
+        overlap = np.minimum(previousCovered, sortedStops) - sortedFirsts
+        tracker.duplicateSamples = int(np.clip(overlap[1:], 0, None).sum())
+
+        newInterval = np.concatenate(([True], sortedFirsts[1:] > previousCovered[1:]))
+        startIndexes = np.flatnonzero(newInterval)
+        tracker.starts = sortedFirsts[startIndexes].tolist()
+        tracker.stops = covered[np.append(startIndexes[1:] - 1, len(covered) - 1)].tolist()
+        tracker.missingSamples = sum(start - stop for stop, start in tracker.gaps())
+        return tracker
+
+    @classmethod
+    def fromIntervals(cls, intervals):
+        """Tracker holding the ``(start, stop)`` rows of ``intervals`` (e.g. stored by ``asArray``)."""
+        tracker = cls()
+        for start, stop in np.asarray(intervals, dtype=np.int64).reshape(-1, 2).tolist():
+            tracker.add(start, stop - start)
+        return tracker
+
+    @property
+    def intervals(self):
+        return list(zip(self.starts, self.stops))
+
+    def asArray(self):
+        """Received intervals as an ``(n, 2)`` int64 array of ``start, stop`` rows."""
+        return np.array([self.starts, self.stops], dtype=np.int64).T.reshape(-1, 2)
+
+    def gaps(self):
+        """Missing ``(start, stop)`` ranges between the first and the last received sample."""
+        return list(zip(self.stops[:-1], self.starts[1:]))
+
+    def forgetBefore(self, sample):
+        """Drop the intervals ending at or before ``sample``, the counters are kept."""
+        index = bisect_right(self.stops, sample)
+        if index:
+            del self.starts[:index]
+            del self.stops[:index]
+
+    def contains(self, first, count):
+        """True if samples ``first .. first + count - 1`` were all received."""
+        index = bisect_right(self.starts, first) - 1
+        return index >= 0 and first + count <= self.stops[index]
+
+    def state(self):
+        """Intervals and counters for a checkpoint, see ``restoreState``."""
+        state = {name: getattr(self, name) for name in self.STATE}
+        state["intervals"] = self.asArray()
+        return state
+
+    def restoreState(self, state):
+        intervals = np.asarray(state["intervals"], dtype=np.int64).reshape(-1, 2)
+        self.starts = intervals[:, 0].tolist()
+        self.stops = intervals[:, 1].tolist()
+        for name in self.STATE:
+            setattr(self, name, state[name])
+
+    def __repr__(self):
+        return (
+            f"GapTracker(intervals={len(self.starts)}, received={self.receivedSamples}, "
+            f"missing={self.missingSamples}, duplicates={self.duplicateSamples}, outOfOrder={self.outOfOrderPackets})"
+        )
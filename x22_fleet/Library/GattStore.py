@@ -0,0 +1,298 @@
+import struct
+
+import numpy as np
+
+from x22_fleet.Library.ColumnStore import ColumnStore
+
+# 1/1024 s event time units of the CSC and cycling power characteristics -> microseconds
+EVENT_TIME_SCALE = 1000 * 1000 / 1024
+
+
+class GattField:
+    """
+    One wire field of a GATT characteristic, stored in ``column`` (None: skipped).
+
+    The field is present when ``flags & mask == value``, ``mask`` None
+    means always present.
+    """
+
+    def __init__(self, column, wireType, mask=None, value=None):
+        self.column = column
+        self.wireType = wireType
+        self.mask = mask
+        self.value = mask if value is None else value
+
+    def presentIn(self, flags):
+        return self.mask is None or flags & self.mask == self.value
+
+
+class GattLayout:
+    """Wire layout of a characteristic for one flags value, compiled once and cached by GattCharacteristic."""
+
+    def __init__(self, characteristic, flags):
+        self.flags = flags
+        names = ["flags"]
+        formats = ["<" + characteristic.flagsType]
+        offsets = [0]
+        structFormat = "<" + characteristic.flagsType
+        offset = np.dtype(characteristic.flagsType).itemsize
+        # (column index, structured field name, index in the unpacked struct tuple)
+        self.targets = []
+        for field in characteristic.fields:
+            if not field.presentIn(flags):
+                continue
+            size = np.dtype(field.wireType).itemsize if field.column else int(field.wireType)
+            if field.column:
+                self.targets.append((characteristic.columnIndex[field.column], field.column, len(names)))
+                names.append(field.column)
+                formats.append("<" + field.wireType)
+                offsets.append(offset)
+                structFormat += field.wireType
+            else:
+                structFormat += f"{size}x"
+            offset += size
+        self.size = offset
+        self.dtype = np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": offset})
+        self.struct = struct.Struct(structFormat)
+        # row with every absent column zeroed, see GattTable.append
+        self.template = [0] * (len(characteristic.columns) + 2)
+        self.template[1] = flags
+
+
+class GattCharacteristic:
+    """
+    Fixed schema of one GATT measurement characteristic.
+
+    ``columns`` are ``(name, typecode, scale)`` of the stored values in
+    their wire type, ``scale`` is applied on read. ``fields`` lists the wire
+    fields in order, ``flagColumns`` maps names to ``(bit, conditionMask)``
+    of single flag bits, valid where ``flags & conditionMask`` (0: always).
+    """
+
+    def __init__(self, name, flagsType, columns, fields, flagColumns=None):
+        self.name = name
+        self.flagsType = flagsType
+        self.flagsSize = np.dtype(flagsType).itemsize
+        self.columns = columns
+        self.fields = fields
+        self.flagColumns = flagColumns or {}
+        # WallTime and Flags come first in every table
+        self.columnIndex = {name: index + 2 for index, (name, _, _) in enumerate(columns)}
+        self.layouts = {}
+
+    def layout(self, flags):
+        layout = self.layouts.get(flags)
+        if layout is None:
+            layout = self.layouts[flags] = GattLayout(self, flags)
+        return layout
+
+
+HEART_RATE = GattCharacteristic(
+    "HeartRate",
+    "B",
+    [("HeartRate", "H", 1), ("EnergyExpended", "H", 1), ("RRInterval", "H", 1)],
+    [
+        GattField("HeartRate", "B", 1 << 0, 0),
+        GattField("HeartRate", "H", 1 << 0),
+        GattField("EnergyExpended", "H", 1 << 3),
+        # only the first of the RR intervals that may follow is kept
+        GattField("RRInterval", "H", 1 << 4),
+    ],
+    {"SensorContact": (1 << 1, 0), "SensorContactSupported": (1 << 2, 0)},
+)
+
+CYCLING_SPEED_CADENCE = GattCharacteristic(
+    "CyclingSpeedCadence",
+    "B",
+    [
+        ("WheelRevolutions", "I", 1),
+        ("WheelEventTime", "H", EVENT_TIME_SCALE),
+        ("CrankRevolutions", "H", 1),
+        ("CrankEventTime", "H", EVENT_TIME_SCALE),
+    ],
+    [
+        GattField("WheelRevolutions", "I", 1 << 0),
+        GattField("WheelEventTime", "H", 1 << 0),
+        GattField("CrankRevolutions", "H", 1 << 1),
+        GattField("CrankEventTime", "H", 1 << 1),
+    ],
+)
+
+CYCLING_POWER = GattCharacteristic(
+    "CyclingPowerMeasurement",
+    "H",
+    [
+        ("InstantaneousPower", "h", 1),
+        ("PedalPowerBalance", "B", 1 / 2),
+        ("AccumulatedTorque", "H", 1 / 32),
+        ("WheelRevolutions", "I", 1),
+        ("WheelEventTime", "H", EVENT_TIME_SCALE),
+        ("CrankRevolutions", "H", 1),
+        ("CrankEventTime", "H", EVENT_TIME_SCALE),
+        ("MaxForce", "h", 1),
+        ("MinForce", "h", 1),
+        ("MaxTorque", "h", 1),
+        ("MinTorque", "h", 1),
+        ("TopDeadSpotAngle", "H", 1),
+        ("BottomDeadSpotAngle", "H", 1),
+        ("AccumulatedEnergy", "h", 1),
+    ],
+    [
+        GattField("InstantaneousPower", "h"),
+        GattField("PedalPowerBalance", "B", 1 << 0),
+        GattField("AccumulatedTorque", "H", 1 << 2),
+        GattField("WheelRevolutions", "I", 1 << 4),
+        GattField("WheelEventTime", "H", 1 << 4),
+        GattField("CrankRevolutions", "H", 1 << 5),
+        GattField("CrankEventTime", "H", 1 << 5),
+        GattField("MaxForce", "h", 1 << 6),
+        GattField("MinForce", "h", 1 << 6),
+        GattField("MaxTorque", "h", 1 << 7),
+        GattField("MinTorque", "h", 1 << 7),
+        # two packed 12 bit angles, not decoded
+        GattField(None, "3", 1 << 8),
+        GattField("TopDeadSpotAngle", "H", 1 << 9),
+        GattField("BottomDeadSpotAngle", "H", 1 << 10),
+        GattField("AccumulatedEnergy", "h", 1 << 11),
+    ],
+    {
+        "PedalPowerBalanceReference": (1 << 1, 1 << 0),
+        "AccumulatedTorqueSource": (1 << 3, 1 << 2),
+        "OffsetCompensationIndicator": (1 << 12, 0),
+    },
+)
+
+# by characteristic UUID
+GATT_CHARACTERISTICS = {
+    "2a37": HEART_RATE,
+    "2a5b": CYCLING_SPEED_CADENCE,
+    "2a63": CYCLING_POWER,
+}
+
+
+class GattTable:
+    """
+    Columnar store of one GATT characteristic's measurements.
+
+    Rows are kept as ``WallTime``, the raw flags and every value column in
+    its wire type, absent optional fields are stored as 0 and masked out on
+    read: ``table["InstantaneousPower"]`` is a float64 array scaled to the
+    characteristic's unit with NaN where the field was absent,
+    ``table.present(name)`` the mask itself and ``table.masked(name)`` both
+    as a masked array. Flag bits (``table["SensorContact"]``) read as bool.
+
+    ``append`` decodes one record with the struct compiled for its flags,
+    ``extend`` decodes a batch by grouping records of the same flags and
+    reading each group in one ``np.frombuffer`` call.
+    """
+
+    def __init__(self, characteristic, maxlen=None):
+        self.characteristic = characteristic
+        self.store = ColumnStore("d" + characteristic.flagsType + "".join(typecode for _, typecode, _ in characteristic.columns), maxlen=maxlen)
+        self.flagsFormat = struct.Struct("<" + characteristic.flagsType)
+        # records shorter than the layout their flags announce, dropped
+        self.truncated = 0
+
+    @property
+    def length(self):
+        return self.store.length
+
+    @property
+    def fields(self):
+        return (
+            ["WallTime", "Flags"]
+            + [name for name, _, _ in self.characteristic.columns]
+            + list(self.characteristic.flagColumns)
+        )
+
+    def append(self, buffer, timestamp):
+        try:
+            (flags,) = self.flagsFormat.unpack_from(buffer)
+            layout = self.characteristic.layout(flags)
+            values = layout.struct.unpack_from(buffer)
+        except struct.error:
+            self.truncated += 1
+            raise
+        row = layout.template.copy()
+        row[0] = timestamp
+        for columnIndex, _, valueIndex in layout.targets:
+            row[columnIndex] = values[valueIndex]
+        self.store.append(row)
+
+    def extend(self, buffers, timestamps):
+        """Decode ``buffers`` (bytes-like records) received at ``timestamps``, keeping their order."""
+        characteristic = self.characteristic
+        flagsSize = characteristic.flagsSize
+        keep = np.fromiter((len(buffer) >= flagsSize for buffer in buffers), dtype=bool, count=len(buffers))
+        flags = np.zeros(len(buffers), dtype="<" + characteristic.flagsType)
+        flags[keep] = np.frombuffer(
+            b"".join(bytes(buffer[:flagsSize]) for buffer, valid in zip(buffers, keep) if valid),
+            dtype="<" + characteristic.flagsType,
+        )
+        columns = [np.asarray(timestamps, dtype=np.float64), flags]
+        columns += [np.zeros(len(buffers), dtype=column.dtype) for column in self.store.columns[2:]]
+
+        for value in np.unique(flags[keep]):
+            layout = characteristic.layout(int(value))
+            indexes = np.flatnonzero(keep & (flags == value))
+            complete = np.fromiter((len(buffers[index]) >= layout.size for index in indexes), dtype=bool, count=len(indexes))
+            if not complete.all():
+                keep[indexes[~complete]] = False
+                indexes = indexes[complete]
+            records = np.frombuffer(b"".join(bytes(buffers[index][: layout.size]) for index in indexes), dtype=layout.dtype)
+            for columnIndex, name, _ in layout.targets:
+                columns[columnIndex][indexes] = records[name]
+
+        self.truncated += len(buffers) - int(keep.sum())
+        if not keep.all():
+            columns = [column[keep] for column in columns]
+        self.store.extend(columns)
+
+    def present(self, name):
+        """Bool mask of the rows in which ``name`` was sent."""
+        flags = self.store[1].view()
+        if name in self.characteristic.flagColumns:
+            _, conditionMask = self.characteristic.flagColumns[name]
+            return flags & conditionMask == conditionMask
+        if name not in self.characteristic.columnIndex:
+            return np.ones(len(flags), dtype=bool)
+        mask = np.zeros(len(flags), dtype=bool)
+        for field in self.characteristic.fields:
+            if field.column == name:
+                if field.mask is None:
+                    return np.ones(len(flags), dtype=bool)
+                mask |= flags & field.mask == field.value
+        return mask
+
+    def __getitem__(self, name):
+        if name == "WallTime":
+            return self.store[0].view()
+        if name == "Flags":
+            return self.store[1].view()
+        if name in self.characteristic.flagColumns:
+            bit, _ = self.characteristic.flagColumns[name]
+            return self.store[1].view() & bit != 0
+        columnIndex = self.characteristic.columnIndex[name]
+        _, _, scale = self.characteristic.columns[columnIndex - 2]
+        values = self.store[columnIndex].view() * float(scale)
+        values[~self.present(name)] = np.nan
+        return values
+
+    def masked(self, name):
+        values = self[name]
+        return np.ma.MaskedArray(values, mask=~self.present(name))
+
+    def tolist(self):
+        """Rows as lists in ``fields`` order, None for absent fields."""
+        columns = [self[name] for name in self.fields]
+        masks = [self.present(name) for name in self.fields]
+        return [
+            [column[row].item() if mask[row] else None for column, mask in zip(columns, masks)]
+            for row in range(self.length)
+        ]
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return f"GattTable({self.characteristic.name!r}, {self.length} rows)"
@@ -0,0 +1,58 @@
+class ParseSummary:
+    """
+    What one ``parseStream`` call decoded, handed once per call to ``Parser.dataCallback``.
+
+    ``frames`` maps type bytes to the number of frames decoded, ``ranges``
+    maps dataDict keys to the ``(start, stop)`` running row indexes
+    (``ColumnStore.appended``) of the rows that call added. Streams without
+    new rows are left out of both.
+    """
+
+    def __init__(self, deviceName, frames, ranges):
+        self.deviceName = deviceName
+        self.frames = frames
+        self.ranges = ranges
+
+    @classmethod
+    def drain(cls, parser, frames):
+        """
+        Run ``frames`` (a ``parser.parseFrames`` generator) to its end.
+
+        Returns the resume index and the ParseSummary of what was decoded.
+        """
+        streams = parser.dataBuffer.streams
+        appendedBefore = [store.appended for store in streams.values()]
+        counts = {}
+        try:
+            while True:
+                datatype = next(frames)
+                counts[datatype] = counts.get(datatype, 0) + 1
+        except StopIteration as done:
+            resumeIndex = done.value
+        ranges = {}
+        if counts:
+            for (name, store), before in zip(streams.items(), appendedBefore):
+                if store.appended != before:
+                    ranges[name] = (before, store.appended)
+        return resumeIndex, cls(parser.deviceName, counts, ranges)
+
+    @property
+    def samples(self):
+        """Rows added per stream."""
+        return {name: stop - start for name, (start, stop) in self.ranges.items()}
+
+    def rows(self, dataBuffer, name):
+        """Zero-copy views of the rows added to stream ``name`` that are still retained."""
+        store = dataBuffer.streams[name]
+        start, stop = self.ranges.get(name, (store.appended, store.appended))
+        firstIndex = store.appended - store.length
+        return store.view(max(start - firstIndex, 0), max(stop - firstIndex, 0))
+
+    def __contains__(self, datatype):
+        return getattr(datatype, "value", datatype) in self.frames
+
+    def __bool__(self):
+        return bool(self.frames)
+
+    def __repr__(self):
+        return f"ParseSummary({self.deviceName!r}, frames={self.frames!r}, samples={self.samples!r})"
@@ -0,0 +1,185 @@
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# upper bounds (seconds) of the parseStream duration histogram
+DECODE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# metric family -> (type, help)
+FAMILIES = {
+    "x22_parser_frames_total": ("counter", "Frames per type, decoded or skipped by type projection"),
+    "x22_parser_bytes_total": ("counter", "Bytes consumed by parseStream"),
+    "x22_parser_crc_failures_total": ("counter", "Candidate frames with a CRC mismatch"),
+    "x22_parser_resync_bytes_total": ("counter", "Bytes discarded while searching for the next frame"),
+    "x22_parser_oversized_frames_total": ("counter", "Headers announcing more than MAX_PACKET_LEN bytes"),
+    "x22_parser_missed_samples_total": ("counter", "Sample number jumps between combo packets"),
+    "x22_parser_gap_samples": ("gauge", "Combo samples missing between the first and the last received one"),
+    "x22_parser_duplicate_samples_total": ("counter", "Combo samples received more than once"),
+    "x22_parser_out_of_order_packets_total": ("counter", "Combo packets older than the newest received sample"),
+    "x22_parser_reorder_duplicate_packets_total": ("counter", "Combo packets dropped by the reorder stage as duplicates"),
+    "x22_parser_reorder_late_packets_total": ("counter", "Combo packets arriving after the reorder window gave up their gap"),
+    "x22_parser_reorder_reordered_packets_total": ("counter", "Combo packets put back in order by the reorder stage"),
+    "x22_parser_reorder_lost_samples_total": ("counter", "Combo samples given up by the reorder stage"),
+    "x22_parser_reorder_pending_packets": ("gauge", "Combo packets held by the reorder stage"),
+    "x22_parser_sample_rate_hz": ("gauge", "Effective sample rate fitted to the TimeSync frames"),
+    "x22_parser_clock_drift_ppm": ("gauge", "Deviation of the effective from the nominal sample rate"),
+    "x22_parser_decode_seconds": ("histogram", "Duration of parseStream calls"),
+}
+
+
+class ParserMetrics:
+    """
+    Ingest metrics of one Parser, exported as Prometheus text by ``MetricsRegistry``.
+
+    Frame, CRC and resync counters are read from the parser and its scanner
+    when exported, the only thing recorded on the ingest path is ``observe``
+    once per parseStream call.
+    """
+
+    def __init__(self, parser, buckets=DECODE_BUCKETS):
+        self.parser = parser
+        self.buckets = buckets
+        self.bucketCounts = [0] * (len(buckets) + 1)
+        self.decodeSeconds = 0.0
+        self.bytesParsed = 0
+
+    def observe(self, seconds, byteCount):
+        self.bucketCounts[bisect_left(self.buckets, seconds)] += 1
+        self.decodeSeconds += seconds
+        self.bytesParsed += byteCount
+
+    def samples(self):
+        """``(name, labels, value)`` of all metrics of this parser."""
+        parser = self.parser
+        scanner = parser.scanner
+        for datatype in range(256):
+            decoded = parser.decodedFrames[datatype]
+            skipped = parser.skippedFrames[datatype]
+            if decoded or skipped:
+                typeName = parser.DataStreamType(datatype).name.lower().replace("data_type_", "")
+                yield "x22_parser_frames_total", {"type": typeName, "result": "decoded"}, decoded
+                yield "x22_parser_frames_total", {"type": typeName, "result": "skipped"}, skipped
+        yield "x22_parser_bytes_total", {}, self.bytesParsed
+        yield "x22_parser_crc_failures_total", {}, scanner.crcFailures
+        yield "x22_parser_resync_bytes_total", {}, scanner.skippedBytes
+        yield "x22_parser_oversized_frames_total", {}, scanner.oversizedFrames
+        if hasattr(parser, "missedSamples"):
+            yield "x22_parser_missed_samples_total", {}, parser.missedSamples
+        yield "x22_parser_gap_samples", {}, parser.gaps.missingSamples
+        yield "x22_parser_duplicate_samples_total", {}, parser.gaps.duplicateSamples
+        yield "x22_parser_out_of_order_packets_total", {}, parser.gaps.outOfOrderPackets
+        reorder = getattr(parser, "reorder", None)
+        if reorder is not None:
+            yield "x22_parser_reorder_duplicate_packets_total", {}, reorder.duplicatePackets
+            yield "x22_parser_reorder_late_packets_total", {}, reorder.latePackets
+            yield "x22_parser_reorder_reordered_packets_total", {}, reorder.reorderedPackets
+            yield "x22_parser_reorder_lost_samples_total", {}, reorder.lostSamples
+            yield "x22_parser_reorder_pending_packets", {}, reorder.pendingPackets
+        clock = getattr(parser, "clock", None)
+        if clock is not None and clock.ready:
+            yield "x22_parser_sample_rate_hz", {}, clock.sampleRate
+            yield "x22_parser_clock_drift_ppm", {}, clock.driftPpm
+
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.bucketCounts):
+            cumulative += count
+            yield "x22_parser_decode_seconds_bucket", {"le": repr(bound)}, cumulative
+        cumulative += self.bucketCounts[-1]
+        yield "x22_parser_decode_seconds_bucket", {"le": "+Inf"}, cumulative
+        yield "x22_parser_decode_seconds_sum", {}, self.decodeSeconds
+        yield "x22_parser_decode_seconds_count", {}, cumulative
+
+
+def formatLabels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def familyOf(name):
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[: -len(suffix)] in FAMILIES:
+            return name[: -len(suffix)]
+    return name
+
+
+class MetricsRegistry:
+    """
+    Parsers (and extra collectors) exported together in the Prometheus text format.
+
+    ``addParsers`` takes a live ``{sensor: Parser}`` dict such as
+    ``DeviceParser.parsers``, parsers added to it later are exported too.
+    """
+
+    def __init__(self):
+        self.sources = []
+        self.collectors = []
+
+    def addParsers(self, parsers, **labels):
+        self.sources.append((parsers, labels))
+
+    def addCollector(self, collect):
+        """``collect()`` returns ``(name, help, [(labels, value), ...])`` gauges of its own."""
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = {}
+        for parsers, labels in self.sources:
+            for sensor, parser in list(parsers.items()):
+                for name, extraLabels, value in parser.metrics.samples():
+                    sampleLabels = dict(labels, sensor=sensor, **extraLabels)
+                    lines.setdefault(familyOf(name), []).append(f"{name}{formatLabels(sampleLabels)} {value}")
+
+        text = []
+        for family, samples in lines.items():
+            metricType, helpText = FAMILIES[family]
+            text.append(f"# HELP {family} {helpText}")
+            text.append(f"# TYPE {family} {metricType}")
+            text.extend(samples)
+        for collect in self.collectors:
+            name, helpText, samples = collect()
+            text.append(f"# HELP {name} {helpText}")
+            text.append(f"# TYPE {name} gauge")
+            text.extend(f"{name}{formatLabels(labels)} {value}" for labels, value in samples)
+        return "\n".join(text) + "\n"
+
+
+# registry shared by all receivers of a process, served by serveMetrics
+registry = MetricsRegistry()
+servers = {}
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serveMetrics(port=9108, host="127.0.0.1", metricsRegistry=None):
+    """Serve ``metricsRegistry`` (default: the shared registry) on ``http://host:port/metrics`` from a daemon thread."""
+    if (host, port) in servers:
+        return servers[(host, port)]
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        # metrics are optional, a second receiver on the same port runs without them
+        print(f"Metrics endpoint on {host}:{port} not started: {e}")
+        return None
+    server.daemon_threads = True
+    server.registry = metricsRegistry or registry
+    threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+    if port:
+        # port 0 picks a free port each time, nothing to share
+        servers[(host, port)] = server
+    return server
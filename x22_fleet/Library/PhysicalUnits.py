@@ -0,0 +1,137 @@
+import numpy as np
+
+from x22_fleet.Library.FsrConstants import FullScaleRangeConstants
+
+# IMU_CONFIG full-scale codes (see AxiamoX22Composer) -> unit per LSB, from Doc/lsm6dsrx-2.pdf page 10 and Doc/lis3mdl-2.pdf page 3
+ACC_FACTORS = {0x100: 0.061 / 1000, 0x200: 0.122 / 1000, 0x300: 0.244 / 1000, 0x400: 0.488 / 1000}  # g
+GYR_FACTORS = {
+    0x10000: 8.75 / 1000,
+    0x20000: 17.5 / 1000,
+    0x30000: 35 / 1000,
+    0x40000: 70 / 1000,
+    0x50000: 4.375 / 1000,
+    0x60000: 140 / 1000,
+}  # degree / s
+MAG_FACTORS = {0x100000: 1 / 6842, 0x200000: 1 / 3421, 0x300000: 1 / 2281, 0x400000: 1 / 1711}  # gauss
+TEMP_FACTOR = 1 / 256  # degree C per LSB around TEMP_OFFSET
+TEMP_OFFSET = 25.0
+
+# rows converted per step, bounds the temporaries of a conversion
+CHUNK_ROWS = 1 << 16
+
+
+class ImuScale:
+    """Unit per LSB of the raw IMU streams, the FullScaleRangeConstants until an IMU_CONFIG frame says otherwise."""
+
+    def __init__(self, accFactor=FullScaleRangeConstants.accFactor, gyrFactor=FullScaleRangeConstants.gyroFactor, magFactor=FullScaleRangeConstants.magFactor):
+        self.accFactor = accFactor
+        self.gyrFactor = gyrFactor
+        self.magFactor = magFactor
+
+    @classmethod
+    def fromConfig(cls, imuConfig, maskAcc=0x00000F00, maskGyr=0x000F0000, maskMag=0x00F00000):
+        """Scale of an IMU_CONFIG word, unknown codes keep the default factor."""
+        default = cls()
+        return cls(
+            ACC_FACTORS.get(imuConfig & maskAcc, default.accFactor),
+            GYR_FACTORS.get(imuConfig & maskGyr, default.gyrFactor),
+            MAG_FACTORS.get(imuConfig & maskMag, default.magFactor),
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, ImuScale) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return f"ImuScale(acc={self.accFactor!r}, gyr={self.gyrFactor!r}, mag={self.magFactor!r})"
+
+
+class UnitView:
+    """
+    float32 copy of the value columns of one ColumnStore, as ``raw * factor + offset``.
+
+    Converted lazily by ``array``: rows appended since the last call are
+    converted in chunks of ``CHUNK_ROWS`` straight into the float32 cache
+    (no float64 intermediate), rows the store has evicted are dropped. A new
+    factor, or a new store after ``clearSets``, starts over.
+    """
+
+    def __init__(self, columns=(1, 2, 3)):
+        self.columns = columns
+        self.store = None
+        self.scale = None
+        self.buffer = np.empty((0, len(columns)), dtype=np.float32)
+        self.first = 0  # running row index of buffer row 0
+        self.stop = 0  # running row index after the last converted row
+
+    def array(self, store, factor, offset=0.0):
+        retainedFirst = store.appended - store.length
+        if store is not self.store or (factor, offset) != self.scale or store.appended < self.stop:
+            self.store = store
+            self.scale = (factor, offset)
+            self.buffer = self.buffer[:0]
+            self.first = self.stop = retainedFirst
+        elif retainedFirst >= self.stop:
+            # everything converted so far was evicted, arrays handed out keep their rows
+            self.buffer = self.buffer[:0]
+            self.first = self.stop = retainedFirst
+        elif retainedFirst > self.first:
+            self.buffer = self.buffer[retainedFirst - self.first :]
+            self.first = retainedFirst
+
+        if store.appended > self.stop:
+            self.convert(store, factor, offset)
+        return self.buffer[: self.stop - self.first]
+
+    def convert(self, store, factor, offset):
+        rows = store.appended - self.first
+        if rows > len(self.buffer):
+            grown = np.empty((max(rows, 2 * len(self.buffer)), len(self.columns)), dtype=np.float32)
+            grown[: self.stop - self.first] = self.buffer[: self.stop - self.first]
+            self.buffer = grown
+        retainedFirst = store.appended - store.length
+        for chunkStart in range(self.stop, store.appended, CHUNK_ROWS):
+            chunkStop = min(chunkStart + CHUNK_ROWS, store.appended)
+            out = self.buffer[chunkStart - self.first : chunkStop - self.first]
+            for index, column in enumerate(self.columns):
+                target = out[:, index]
+                target[:] = store[column].view(chunkStart - retainedFirst, chunkStop - retainedFirst)
+                target *= np.float32(factor)
+                if offset:
+                    target += np.float32(offset)
+        self.stop = store.appended
+
+
+class PhysicalUnits:
+    """
+    Lazy float32 views of a DeviceDataBuffer's raw IMU streams in g, degree/s, gauss and degree C.
+
+    ``units["acc"]`` is an ``(n, 3)`` float32 array of the retained
+    ImuAccRaw rows (``"temp"`` is ``(n, 1)``). Views are cached and only
+    extended by the rows parsed since, ``configure`` takes the full-scale
+    ranges of an IMU_CONFIG frame.
+    """
+
+    STREAMS = {
+        "acc": ("ImuAccRaw", "accFactor", (1, 2, 3)),
+        "gyr": ("ImuGyrRaw", "gyrFactor", (1, 2, 3)),
+        "mag": ("ImuMagRaw", "magFactor", (1, 2, 3)),
+        "temp": ("ImuTemp", None, (1,)),
+    }
+
+    def __init__(self, dataBuffer, scale=None):
+        self.dataBuffer = dataBuffer
+        self.scale = scale or ImuScale()
+        self.views = {name: UnitView(columns) for name, (_, _, columns) in self.STREAMS.items()}
+
+    def configure(self, imuConfig):
+        self.scale = ImuScale.fromConfig(imuConfig)
+
+    def __getitem__(self, name):
+        stream, factorName, _ = self.STREAMS[name]
+        store = self.dataBuffer.dataDict[stream].data
+        if factorName is None:
+            return self.views[name].array(store, TEMP_FACTOR, TEMP_OFFSET)
+        return self.views[name].array(store, getattr(self.scale, factorName))
+
+    def nbytes(self):
+        return sum(view.buffer.nbytes for view in self.views.values())
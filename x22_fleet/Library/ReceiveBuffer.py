@@ -0,0 +1,48 @@
+class ReceiveBuffer:
+    """
+    Per-sensor receive buffer that consumes parsed bytes by moving a read offset.
+
+    Incoming payloads are appended to ``data``; the parser works on
+    ``data[offset:]`` and reports how far it got with ``consume``. The parsed
+    prefix is only dropped once it reaches ``compactThreshold`` bytes (or
+    everything has been parsed), so each message costs O(new bytes) instead
+    of copying the unparsed tail into a new buffer.
+
+    Typical use::
+
+        buffer.extend(payload)
+        buffer.consume(parser.parseStream(buffer.data, buffer.offset))
+    """
+
+    def __init__(self, compactThreshold=64 * 1024):
+        self.data = bytearray()
+        self.offset = 0
+        self.compactThreshold = compactThreshold
+
+    def extend(self, payload):
+        self.data += payload
+
+    def consume(self, position):
+        """Mark ``data[:position]`` as parsed, ``position`` is an absolute index into ``data``."""
+        self.offset = position
+        if self.offset == len(self.data):
+            self.data.clear()
+            self.offset = 0
+        elif self.offset >= self.compactThreshold:
+            del self.data[: self.offset]
+            self.offset = 0
+
+    def view(self):
+        """memoryview of the unparsed bytes; release it before the next ``extend``."""
+        return memoryview(self.data)[self.offset :]
+
+    def snapshot(self):
+        """The unparsed bytes, i.e. the partial frame at the end, as a checkpoint."""
+        return bytes(self.data[self.offset :])
+
+    def restore(self, data):
+        self.data = bytearray(data)
+        self.offset = 0
+
+    def __len__(self):
+        return len(self.data) - self.offset
@@ -0,0 +1,173 @@
+import heapq
+import time
+
+from x22_fleet.Library.GapTracker import GapTracker
+
+
+class ReorderBuffer:
+    """
+    Bounded reorder stage for the packets of one sensor, keyed on their first sample number.
+
+    ``push(first, count, item)`` returns the ``(first, count, item)``
+    packets that can be handed on, in sample order. A packet continuing the
+    last released one goes straight through; a packet behind a gap is held
+    until the gap is filled, or until the gap has been open for ``maxDelay``
+    seconds or more than ``maxPackets`` packets are held. Only then are the
+    missing samples given up and counted in ``lostSamples``. Exact
+    duplicates (MQTT redelivery) are dropped (``duplicatePackets``), as are
+    packets arriving after their gap was given up (``latePackets``), so the
+    released sample numbers only ever increase. A jump back by more than
+    ``maxRewind`` samples is taken as a restarted sample counter.
+
+    ``hold`` is applied to items that are kept, e.g. to copy arrays that
+    view a receive buffer about to be reused. Timeouts are checked on
+    ``push`` and ``expire``, which a receiver calls periodically so packets
+    are not held forever once a sensor goes quiet; ``flush`` releases
+    everything held, e.g. at shutdown.
+
+    ``state`` / ``restoreState`` carry the position and the held packets
+    over a restart, held items must then be packable by ``packState``.
+    """
+
+    # counters saved by ``state``
+    STATE = ("expected", "highest", "duplicatePackets", "latePackets", "reorderedPackets", "lostSamples", "restarts")
+
+    def __init__(self, maxDelay=0.5, maxPackets=64, maxRewind=30000, hold=None, clock=time.monotonic):
+        self.maxDelay = maxDelay  # None: bounded by maxPackets only
+        self.maxPackets = maxPackets
+        self.maxRewind = maxRewind
+        self.hold = hold
+        self.clock = clock
+        # (first, arrival order, count, arrival time, item), smallest first on top
+        self.pending = []
+        self.pendingFirsts = set()
+        self.arrivals = 0
+        self.oldestArrival = None  # arrival time of the oldest held packet
+        self.expected = None  # sample number after the last released packet
+        self.highest = None  # highest first sample number pushed
+        self.released = GapTracker()
+        self.duplicatePackets = 0
+        self.latePackets = 0
+        self.reorderedPackets = 0
+        self.lostSamples = 0
+        self.restarts = 0
+
+    @property
+    def pendingPackets(self):
+        return len(self.pending)
+
+    def push(self, first, count, item, now=None):
+        expected = self.expected
+        if expected is not None and first < expected:
+            if expected - first <= self.maxRewind:
+                if self.released.contains(first, count):
+                    self.duplicatePackets += 1
+                else:
+                    self.latePackets += 1
+                return []
+            # sample counter restarted, the packets held so far belong to the old count
+            released = self.flush()
+            self.restarts += 1
+            self.expected = self.highest = None
+            self.released = GapTracker()
+            return released + self.push(first, count, item, now)
+
+        if first in self.pendingFirsts:
+            self.duplicatePackets += 1
+            return []
+        if self.highest is not None and first < self.highest:
+            self.reorderedPackets += 1
+        if self.highest is None or first > self.highest:
+            self.highest = first
+        if expected is None or (first == expected and not self.pending):
+            self.deliver(first, count)
+            return [(first, count, item)]
+
+        if now is None:
+            now = self.clock()
+        if self.hold is not None:
+            item = self.hold(item)
+        heapq.heappush(self.pending, (first, self.arrivals, count, now, item))
+        self.arrivals += 1
+        self.pendingFirsts.add(first)
+        if self.oldestArrival is None:
+            self.oldestArrival = now
+        return self.release(now)
+
+    def expire(self, now=None):
+        """Release the held packets whose gap timed out, without waiting for the next ``push``."""
+        if not self.pending:
+            return []
+        return self.release(self.clock() if now is None else now)
+
+    def release(self, now, force=False):
+        released = []
+        pending = self.pending
+        popped = False
+        while pending:
+            first, _, count, _, item = pending[0]
+            if first > self.expected:
+                if popped:
+                    # a new gap, its packets have not waited as long as the ones released
+                    self.oldestArrival = min(entry[3] for entry in pending)
+                    popped = False
+                if not force and len(pending) <= self.maxPackets and (
+                    self.maxDelay is None or now - self.oldestArrival < self.maxDelay
+                ):
+                    break
+                self.lostSamples += first - self.expected
+            heapq.heappop(pending)
+            popped = True
+            self.pendingFirsts.discard(first)
+            if first < self.expected:
+                # overlaps a packet released before it
+                self.duplicatePackets += 1
+                continue
+            self.deliver(first, count)
+            released.append((first, count, item))
+        if not pending:
+            self.oldestArrival = None
+        return released
+
+    def deliver(self, first, count):
+        self.expected = first + count
+        released = self.released
+        released.add(first, count)
+        if len(released.starts) > 1:
+            # packets further back than maxRewind count as a restart, their intervals are not needed
+            released.forgetBefore(self.expected - self.maxRewind)
+
+    def flush(self):
+        """Release every held packet, gaps in front of them count as lost."""
+        if not self.pending:
+            return []
+        return self.release(None, force=True)
+
+    def state(self):
+        pending = sorted(self.pending, key=lambda entry: entry[1])
+        state = {name: getattr(self, name) for name in self.STATE}
+        state["released"] = self.released.state()
+        state["pending"] = [[first, count, item] for first, _, count, _, item in pending]
+        return state
+
+    def restoreState(self, state, now=None):
+        """Continue from ``state``, held packets get a new ``maxDelay`` from ``now``."""
+        if now is None:
+            now = self.clock()
+        for name in self.STATE:
+            setattr(self, name, state[name])
+        self.released = GapTracker()
+        self.released.restoreState(state["released"])
+        self.pending = []
+        self.pendingFirsts = set()
+        for arrival, (first, count, item) in enumerate(state["pending"]):
+            heapq.heappush(self.pending, (first, arrival, count, now, item))
+            self.pendingFirsts.add(first)
+        self.arrivals = len(self.pending)
+        self.oldestArrival = now if self.pending else None
+
+    def __repr__(self):
+        return (
+            f"ReorderBuffer(expected={self.expected}, pending={self.pendingPackets}, duplicates={self.duplicatePackets}, "
+            f"late={self.latePackets}, reordered={self.reorderedPackets}, lost={self.lostSamples})"
+        )
@@ -0,0 +1,147 @@
+import numpy as np
+
+
+class SampleClock:
+    """
+    Online model of a sensor's sample clock against the TSF wall clock.
+
+    Fed with the ``(sampleNumber, tsf)`` pair of every TimeSync frame, it fits
+    ``tsf = offset + period * sampleNumber`` by recursive least squares with a
+    forgetting factor, O(1) per update. The model is re-centered on every
+    accepted pair, so sample numbers and tsf values (microseconds) of any size
+    keep full float precision. Pairs further than ``rejectSigma`` residual
+    standard deviations (and ``minResidual`` microseconds) from the prediction
+    are rejected, during the first ``warmup`` pairs the tolerance also covers
+    a ``maxDrift`` relative rate error. ``resetAfter`` rejections in a row
+    (sensor reboot, sample counter wrap) restart the model from that pair.
+    """
+
+    # model and counters saved by ``state``, the tuning parameters come from the constructor
+    STATE = (
+        "resets", "rejected", "updates", "rejectedInRow", "originSample", "originTsf",
+        "intercept", "period", "p00", "p01", "p11", "residualVariance",
+    )
+
+    def __init__(self, nominalRate=500.0, forgetting=0.999, rejectSigma=6.0, minResidual=2000.0, resetAfter=5, warmup=8, maxDrift=1e-3):
+        self.nominalRate = nominalRate
+        self.forgetting = forgetting
+        self.rejectSigma = rejectSigma
+        self.minResidual = minResidual
+        self.resetAfter = resetAfter
+        self.warmup = warmup
+        self.maxDrift = maxDrift
+        self.resets = 0
+        self.rejected = 0
+        self.reset()
+
+    def reset(self):
+        self.updates = 0
+        self.rejectedInRow = 0
+        self.originSample = None  # sample number and tsf the model is centered on
+        self.originTsf = None
+        self.intercept = 0.0  # tsf - originTsf at originSample
+        self.period = 1e6 / self.nominalRate  # microseconds per sample
+        # covariance of (intercept, period)
+        self.p00, self.p01, self.p11 = 1e6, 0.0, 1.0
+        self.residualVariance = 0.0
+
+    def update(self, sampleNumber, tsf):
+        """Add one TimeSync pair, returns False if it was rejected as an outlier."""
+        if self.originSample is None:
+            self.originSample = sampleNumber
+            self.originTsf = tsf
+            self.updates = 1
+            return True
+
+        u = sampleNumber - self.originSample
+        residual = (tsf - self.originTsf) - (self.intercept + self.period * u)
+        limit = max(self.minResidual, self.rejectSigma * self.residualVariance ** 0.5)
+        if self.updates < self.warmup:
+            # the period is still the nominal one, allow for the largest expected drift
+            limit += self.maxDrift * self.period * abs(u)
+        if abs(residual) > limit:
+            self.rejected += 1
+            self.rejectedInRow += 1
+            if self.rejectedInRow >= self.resetAfter:
+                self.resets += 1
+                self.reset()
+                return self.update(sampleNumber, tsf)
+            return False
+        self.rejectedInRow = 0
+
+        # RLS step for the regressor (1, u)
+        lam = self.forgetting
+        p00, p01, p11 = self.p00, self.p01, self.p11
+        pu0 = p00 + p01 * u
+        pu1 = p01 + p11 * u
+        gain = lam + pu0 + pu1 * u
+        k0 = pu0 / gain
+        k1 = pu1 / gain
+        self.intercept += k0 * residual
+        self.period += k1 * residual
+        p00 = (p00 - k0 * pu0) / lam
+        p01 = (p01 - k0 * pu1) / lam
+        p11 = (p11 - k1 * pu1) / lam
+
+        # re-center on this pair: intercept' = intercept + period * u, P' = T P T^T with T = [[1, u], [0, 1]]
+        self.p00 = p00 + 2 * u * p01 + u * u * p11
+        self.p01 = p01 + u * p11
+        self.p11 = p11
+        self.intercept += self.period * u - (tsf - self.originTsf)
+        self.originSample = sampleNumber
+        self.originTsf = tsf
+
+        self.residualVariance = lam * self.residualVariance + (1 - lam) * residual * residual
+        self.updates += 1
+        return True
+
+    def updateMany(self, sampleNumbers, tsfs):
+        """``update`` for every pair of two sequences, returns the number of accepted pairs."""
+        return sum(self.update(int(sampleNumber), int(tsf)) for sampleNumber, tsf in zip(sampleNumbers, tsfs))
+
+    @property
+    def ready(self):
+        return self.updates >= self.warmup
+
+    @property
+    def sampleRate(self):
+        """Effective sample rate in Hz."""
+        return 1e6 / self.period
+
+    @property
+    def driftPpm(self):
+        """Deviation of the effective from the nominal sample rate in parts per million."""
+        return (self.sampleRate / self.nominalRate - 1.0) * 1e6
+
+    @property
+    def residualRms(self):
+        """Running RMS of the TimeSync residuals in microseconds."""
+        return self.residualVariance ** 0.5
+
+    def sampleToTime(self, sampleNumbers):
+        """TSF time (float64 microseconds) of ``sampleNumbers`` (scalar or array)."""
+        if self.originSample is None:
+            raise ValueError("SampleClock has no TimeSync data yet")
+        u = np.asarray(sampleNumbers, dtype=np.int64) - self.originSample
+        return (self.originTsf + self.intercept) + self.period * u.astype(np.float64)
+
+    def timeToSample(self, tsf):
+        """Fractional sample numbers at TSF times ``tsf`` (microseconds, scalar or array)."""
+        if self.originSample is None:
+            raise ValueError("SampleClock has no TimeSync data yet")
+        elapsed = np.asarray(tsf, dtype=np.float64) - (self.originTsf + self.intercept)
+        return self.originSample + elapsed / self.period
+
+    def state(self):
+        """The fitted model for a checkpoint, see ``restoreState``."""
+        return {name: getattr(self, name) for name in self.STATE}
+
+    def restoreState(self, state):
+        for name in self.STATE:
+            setattr(self, name, state[name])
+
+    def __repr__(self):
+        return (
+            f"SampleClock(rate={self.sampleRate:.4f} Hz, drift={self.driftPpm:.1f} ppm, "
+            f"residual={self.residualRms:.1f} us, updates={self.updates}, rejected={self.rejected})"
+        )
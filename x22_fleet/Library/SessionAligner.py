@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+
+
+class SessionAligner:
+    """
+    Streams of several sensors resampled onto one common TSF time grid.
+
+    ``sensors`` maps names to ``(ColumnStore, SampleClock)``: column 0 of the
+    store holds sample numbers (increasing), all other columns are
+    interpolated. Grid times are mapped through each sensor's clock to
+    fractional sample numbers and interpolated there, so clock drift and
+    offsets between sensors are taken out. Grid points are multiples of
+    ``1 / rate`` seconds of TSF time, chunks of successive calls line up
+    exactly. Grid points outside a sensor's retained rows, or between two
+    samples more than ``maxGap`` sample numbers apart, are NaN.
+
+    Only the rows around a chunk are touched (found by bisection), so an
+    hour-long session is aligned in chunks with ``chunks``, or while it is
+    received with ``advance`` after each parse call.
+    """
+
+    def __init__(self, sensors, rate=500.0, maxGap=1):
+        self.sensors = dict(sensors)
+        self.rate = rate
+        self.step = 1e6 / rate  # grid step in microseconds
+        self.maxGap = maxGap
+        self.position = None  # grid index the next advance() chunk starts at
+
+    def span(self, name):
+        """TSF time (microseconds) of the first and last retained sample of sensor ``name``, None without data."""
+        store, clock = self.sensors[name]
+        sampleNumbers = store[0]
+        if not len(sampleNumbers) or clock.originSample is None:
+            return None
+        first, last = clock.sampleToTime([sampleNumbers[0], sampleNumbers[-1]])
+        return first, last
+
+    def overlap(self):
+        """TSF time range covered by all sensors, None if there is none."""
+        spans = [self.span(name) for name in self.sensors]
+        if not spans or None in spans:
+            return None
+        start = max(first for first, _ in spans)
+        stop = min(last for _, last in spans)
+        return (start, stop) if start <= stop else None
+
+    def gridIndexes(self, start, stop):
+        """Grid points in ``[start, stop]`` TSF microseconds, as indexes (time = index * step)."""
+        return math.ceil(start / self.step), math.floor(stop / self.step) + 1
+
+    def resample(self, first, stop):
+        """
+        Grid points ``first .. stop - 1`` (grid indexes).
+
+        Returns the TSF times (float64 microseconds) and per sensor a float32
+        array of one row per time and one column per interpolated column.
+        """
+        times = np.arange(first, stop, dtype=np.float64) * self.step
+        return times, {name: self.interpolate(name, times) for name in self.sensors}
+
+    def interpolate(self, name, times):
+        store, clock = self.sensors[name]
+        columns = store.view()
+        result = np.full((len(times), len(columns) - 1), np.nan, dtype=np.float32)
+        if not len(times) or not len(columns[0]) or clock.originSample is None:
+            return result
+
+        positions = clock.timeToSample(times)
+        sampleNumbers = columns[0]
+        lo = max(np.searchsorted(sampleNumbers, positions[0], side="right") - 1, 0)
+        hi = np.searchsorted(sampleNumbers, positions[-1], side="left") + 1
+        x = sampleNumbers[lo:hi].astype(np.int64)
+
+        # neighbours of every position, positions on a sample need no second one
+        right = np.searchsorted(x, positions, side="left").clip(0, len(x) - 1)
+        left = (right - (x[right] > positions)).clip(0, len(x) - 1)
+        valid = (positions >= x[0]) & (positions <= x[-1]) & (x[right] - x[left] <= self.maxGap)
+        for column in range(1, len(columns)):
+            result[:, column - 1] = np.interp(positions, x, columns[column][lo:hi])
+        result[~valid] = np.nan
+        return result
+
+    def chunks(self, seconds=10.0, start=None, stop=None):
+        """Yield ``resample`` results of ``seconds`` long chunks from ``start`` to ``stop`` (TSF microseconds, default: overlap)."""
+        overlap = self.overlap()
+        if overlap is None:
+            return
+        first, end = self.gridIndexes(overlap[0] if start is None else start, overlap[1] if stop is None else stop)
+        chunkLength = max(int(seconds * self.rate), 1)
+        for chunkStart in range(first, end, chunkLength):
+            yield self.resample(chunkStart, min(chunkStart + chunkLength, end))
+
+    def advance(self):
+        """
+        Resample the grid points that became available since the last call.
+
+        Returns None while there is nothing new, the first call starts at the
+        beginning of the overlap.
+        """
+        overlap = self.overlap()
+        if overlap is None:
+            return None
+        first, end = self.gridIndexes(*overlap)
+        if self.position is not None:
+            first = max(first, self.position)
+        if first >= end:
+            return None
+        self.position = end
+        return self.resample(first, end)
@@ -0,0 +1,138 @@
+import time
+
+import numpy as np
+
+from x22_fleet.Library.ColumnStore import Column
+
+# one TASK_TRACE entry as sent by the firmware task tracer
+TRACE_ENTRY_DTYPE = np.dtype(
+    [("task_id", "<u4"), ("timestamp", "<u4"), ("stack_high_water", "<u4"), ("cpu_usage", "<u4")]
+)
+
+
+class TaskSummary:
+    """Aggregate of the trace entries of one task."""
+
+    __slots__ = ("entries", "firstTimestamp", "lastTimestamp", "stackHighWater", "minStackHighWater", "cpuUsage", "maxCpuUsage", "cpuSum")
+
+    def __init__(self):
+        self.entries = 0
+        self.firstTimestamp = None
+        self.lastTimestamp = None
+        self.stackHighWater = None  # of the newest entry
+        self.minStackHighWater = None
+        self.cpuUsage = None  # of the newest entry
+        self.maxCpuUsage = 0
+        self.cpuSum = 0
+
+    @property
+    def meanCpuUsage(self):
+        return self.cpuSum / self.entries if self.entries else 0.0
+
+    def __repr__(self):
+        return (
+            f"TaskSummary(entries={self.entries}, cpu={self.cpuUsage}% (mean {self.meanCpuUsage:.1f}%, max {self.maxCpuUsage}%), "
+            f"stack={self.stackHighWater} (min {self.minStackHighWater}))"
+        )
+
+
+class TaskTraceStore:
+    """
+    Append-only record array of TASK_TRACE entries with a per-task summary.
+
+    ``extend`` takes the entries of one frame with a single ``np.frombuffer``
+    into a Column of ``TRACE_ENTRY_DTYPE`` records, ``entries()`` is a
+    zero-copy view of the retained ones (``entries()["cpu_usage"]``). The
+    per-task ``summary()`` folds in the rows appended since its last call,
+    vectorized over all of them; with ``maxlen`` set, rows evicted before a
+    summary are not counted, so summarize at least once per ``maxlen``
+    entries (the parser does with every ``logDue``).
+    """
+
+    def __init__(self, maxlen=None, interval=5.0):
+        self.column = Column(TRACE_ENTRY_DTYPE, maxlen=maxlen)
+        self.tasks = {}
+        self.summarized = 0  # running index of the first entry not in tasks yet
+        self.interval = interval
+        self.nextLog = 0.0  # the first entries are logged right away
+
+    @property
+    def length(self):
+        return len(self.column)
+
+    @property
+    def appended(self):
+        return self.column.appended
+
+    def extend(self, buffer, startIndex=0, length=None):
+        """Append the complete 16 byte entries in ``buffer[startIndex:startIndex + length]``, returns their number."""
+        if length is None:
+            length = len(buffer) - startIndex
+        count = length // TRACE_ENTRY_DTYPE.itemsize
+        if count:
+            self.column.extend(np.frombuffer(buffer, dtype=TRACE_ENTRY_DTYPE, count=count, offset=startIndex))
+        return count
+
+    def entries(self, start=None, stop=None):
+        return self.column.view(start, stop)
+
+    def summary(self):
+        """``{task_id: TaskSummary}`` over every entry summarized so far."""
+        firstRetained = self.column.firstIndex
+        start = max(self.summarized, firstRetained)
+        self.summarized = self.column.appended
+        rows = self.column.view(start - firstRetained)
+        if not len(rows):
+            return self.tasks
+
+        taskIds, inverse, counts = np.unique(rows["task_id"], return_inverse=True, return_counts=True)
+        positions = np.arange(len(rows))
+        first = np.full(len(taskIds), len(rows))
+        np.minimum.at(first, inverse, positions)
+        last = np.zeros(len(taskIds), dtype=np.intp)
+        np.maximum.at(last, inverse, positions)
+        minStack = np.full(len(taskIds), np.iinfo(np.uint32).max, dtype=np.uint32)
+        np.minimum.at(minStack, inverse, rows["stack_high_water"])
+        maxCpu = np.zeros(len(taskIds), dtype=np.uint32)
+        np.maximum.at(maxCpu, inverse, rows["cpu_usage"])
+        cpuSum = np.bincount(inverse, weights=rows["cpu_usage"], minlength=len(taskIds))
+
+        for index, taskId in enumerate(taskIds.tolist()):
+            task = self.tasks.get(taskId)
+            if task is None:
+                task = self.tasks[taskId] = TaskSummary()
+                task.firstTimestamp = int(rows["timestamp"][first[index]])
+                task.minStackHighWater = int(minStack[index])
+            newest = rows[last[index]]
+            task.entries += int(counts[index])
+            task.lastTimestamp = int(newest["timestamp"])
+            task.stackHighWater = int(newest["stack_high_water"])
+            task.cpuUsage = int(newest["cpu_usage"])
+            task.minStackHighWater = min(task.minStackHighWater, int(minStack[index]))
+            task.maxCpuUsage = max(task.maxCpuUsage, int(maxCpu[index]))
+            task.cpuSum += int(cpuSum[index])
+        return self.tasks
+
+    def logDue(self, now=None):
+        """True at most once per ``interval`` seconds, the caller then logs ``summaryLines``."""
+        now = time.monotonic() if now is None else now
+        if now < self.nextLog:
+            return False
+        self.nextLog = now + self.interval
+        return True
+
+    def summaryLines(self):
+        tasks = self.summary()
+        lines = [f"Task Trace: {self.appended} entries of {len(tasks)} tasks"]
+        for taskId in sorted(tasks):
+            task = tasks[taskId]
+            lines.append(
+                f"  Task {taskId}: {task.entries} entries, CPU {task.cpuUsage}% (mean {task.meanCpuUsage:.1f}%, max {task.maxCpuUsage}%), "
+                f"Stack {task.stackHighWater} bytes (min {task.minStackHighWater})"
+            )
+        return lines
+
+    def clear(self):
+        self.column.clear()
+        self.tasks = {}
+        self.summarized = self.column.appended
@@ -0,0 +1,80 @@
+import logging
+import time
+
+
+class Trace:
+    """
+    Per-category tracing for parser hot paths.
+
+    Every category is a child logger ``<logger>.<category>`` with its own
+    level, and a plain boolean attribute of the same name that is True while
+    the category logs DEBUG. Hot paths test that attribute before building any
+    message, so disabled tracing costs one attribute lookup::
+
+        if trace.frames:
+            trace.debug("frames", "Found packet: type=0x%02X, length=%d", datatype, length)
+
+    Warnings that can repeat per frame go through ``warn``, which counts them
+    and logs at most one line per ``interval`` seconds and message, e.g.
+    ``CRC mismatches: 412 in last 5.0 s``. Counts that no later ``warn``
+    logs are left to ``expire`` (periodically) and ``flush`` (at shutdown).
+    """
+
+    def __init__(self, logger, categories, interval=5.0):
+        self.logger = logger
+        self.interval = interval
+        self.loggers = {category: logger.getChild(category) for category in categories}
+        # message -> [count, window start, time of the next log line, logger]
+        self.pending = {}
+        self.refresh()
+
+    def refresh(self):
+        """Update the category flags, needed after changing a level outside ``setLevel``."""
+        for category, logger in self.loggers.items():
+            setattr(self, category, logger.isEnabledFor(logging.DEBUG))
+
+    def setLevel(self, category, level):
+        self.loggers[category].setLevel(level)
+        self.refresh()
+
+    def configure(self, spec):
+        """Set levels from ``"frames=DEBUG,crc=ERROR"``, e.g. taken from an environment variable."""
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            category, _, level = item.partition("=")
+            self.setLevel(category.strip(), level.strip().upper())
+
+    def debug(self, category, message, *args):
+        self.loggers[category].debug(message, *args)
+
+    def warn(self, category, message, count=1):
+        """Count ``count`` occurrences of ``message``, logged aggregated at most once per interval."""
+        logger = self.loggers[category]
+        if not logger.isEnabledFor(logging.WARNING):
+            return
+        now = time.monotonic()
+        pending = self.pending.get(message)
+        if pending is None:
+            pending = self.pending[message] = [0, now, now, logger]
+        pending[0] += count
+        if now >= pending[2]:
+            self.emit(message, pending, now)
+
+    def flush(self):
+        """Log the counts still waiting for their interval to end, e.g. at shutdown."""
+        now = time.monotonic()
+        for message, pending in list(self.pending.items()):
+            if pending[0]:
+                self.emit(message, pending, now)
+
+    def expire(self):
+        """Log the counts whose interval ended without another ``warn``, called from a periodic timer."""
+        now = time.monotonic()
+        for message, pending in list(self.pending.items()):
+            if pending[0] and now >= pending[2]:
+                self.emit(message, pending, now)
+
+    def emit(self, message, pending, now):
+        pending[3].warning("%s: %d in last %.1f s", message, pending[0], now - pending[1])
+        pending[0] = 0
+        pending[1] = now
+        pending[2] = now + self.interval
@@ -1,124 +1,162 @@
+import mmap
 import os
 import re
 import argparse
 import struct
 from enum import Enum
 import time
-import array as arr
-import crcmod
 import binascii
+from functools import partial
 
-crc16_mod = crcmod.mkCrcFun(0x18005, rev=True, initCrc=0x0000, xorOut=0x0000)
+from x22_fleet.Library.BlockDecoder import appendComboSamples, decodeComboSamples
+from x22_fleet.Library.ColumnStore import ColumnStore, iterNewRows
+from x22_fleet.Library.Decimation import DecimationPyramids
+from x22_fleet.Library.FrameIndex import FrameIndex
+from x22_fleet.Library.FrameScanner import FrameScanner, crc16_mod, dispatchTable, projectedTable
+from x22_fleet.Library.GapTracker import GapTracker
+from x22_fleet.Library.GattStore import GATT_CHARACTERISTICS, GattTable
+from x22_fleet.Library.ParseSummary import ParseSummary
+from x22_fleet.Library.ParserMetrics import ParserMetrics
+from x22_fleet.Library.PhysicalUnits import PhysicalUnits
+from x22_fleet.Library.TaskTrace import TaskTraceStore
 
 
 class DeviceDataBuffer:
-    def __init__(self):
+    def __init__(self, maxlen=None, spill=None):
+        # maxlen: keep only the newest maxlen samples per stream (None keeps everything),
+        # spill: SpillSink receiving the samples that fall out of that window
+        self.maxlen = maxlen
+        self.spill = spill
         self.clearSets()
 
     def clearSets(self):
         self.dataDict = {
             "ImuAcc": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_ACC,
-                [arr.array("L"), arr.array("f"), arr.array("f"), arr.array("f")],
+                ColumnStore("Lfff", maxlen=self.maxlen),
             ),
             "ImuGyr": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_GYR,
-                [arr.array("L"), arr.array("f"), arr.array("f"), arr.array("f")],
+                ColumnStore("Lfff", maxlen=self.maxlen),
             ),
             "ImuTemp": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_RAW_TEMP,
-                [arr.array("L"), arr.array("f")],
+                ColumnStore("Lf", maxlen=self.maxlen),
             ),
             "ImuMag": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_MAG,
-                [arr.array("L"), arr.array("f"), arr.array("f"), arr.array("f")],
+                ColumnStore("Lfff", maxlen=self.maxlen),
             ),
             "Quat": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_QUAT,
-                [
-                    arr.array("L"),
-                    arr.array("f"),
-                    arr.array("f"),
-                    arr.array("f"),
-                    arr.array("f"),
-                ],
+                ColumnStore("Lffff", maxlen=self.maxlen),
             ),
             "ImuAccRaw": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_RAW_ACC,
-                [arr.array("L"), arr.array("h"), arr.array("h"), arr.array("h")],
+                ColumnStore("Lhhh", maxlen=self.maxlen),
             ),
             "ImuGyrRaw": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_RAW_GYR,
-                [arr.array("L"), arr.array("h"), arr.array("h"), arr.array("h")],
+                ColumnStore("Lhhh", maxlen=self.maxlen),
             ),
             "ImuMagRaw": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_RAW_MAG,
-                [arr.array("L"), arr.array("h"), arr.array("h"), arr.array("h")],
+                ColumnStore("Lhhh", maxlen=self.maxlen),
             ),
             "ImuRawCombo": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_RAW_MAG,
-                [
-                    arr.array("L"),
-                    arr.array("h"),
-                    arr.array("h"),
-                    arr.array("h"),
-                    arr.array("h"),
-                    arr.array("h"),
-                    arr.array("h"),
-                    arr.array("h"),
-                ],
+                ColumnStore("Lhhhhhhh", maxlen=self.maxlen),
             ),
             "Steps": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_STEP,
-                [arr.array("L"), arr.array("Q")],
+                ColumnStore("LQ", maxlen=self.maxlen),
             ),
             "Barometer": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_BAR,
-                [arr.array("L"), arr.array("l"), arr.array("l")],
+                ColumnStore("Lll", maxlen=self.maxlen),
             ),
             "Battery": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_SYS_BATTERY,
-                [arr.array("L"), arr.array("h"), arr.array("H"), arr.array("H")],
+                ColumnStore("LhHH", maxlen=self.maxlen),
             ),
             "Ping": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_SYS_PING,
-                [
-                    arr.array("L"),
-                    arr.array("Q"),
-                    arr.array("Q"),
-                    arr.array("Q"),
-                    arr.array("H"),
-                ],
+                ColumnStore("LQQQH", maxlen=self.maxlen),
             ),
             "PingV2": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_SYS_PING_V2,
-                [arr.array("L"), arr.array("Q"), arr.array("Q")],
+                ColumnStore("LQQ", maxlen=self.maxlen),
+            ),
+            # system telemetry, a few rows per second at most
+            "ImuConfig": Parser.ParsedData(
+                Parser.DataStreamType.DATA_TYPE_IMU_CONFIG,
+                ColumnStore("LIIII", maxlen=self.maxlen),  # data rate, acc / gyr FSR, features
+            ),
+            "BarConfig": Parser.ParsedData(
+                Parser.DataStreamType.DATA_TYPE_BAR_CONFIG,
+                ColumnStore("LI", maxlen=self.maxlen),
+            ),
+            "TaskStats": Parser.ParsedData(
+                Parser.DataStreamType.DATA_TYPE_SYS_TASK_STATS,
+                # task (index into taskNames), frequency, samples produced, max bytes produced,
+                # bytes produced, buffer overflows, stack high watermark
+                ColumnStore("LHfHHHHH", maxlen=self.maxlen),
+            ),
+            "Resources": Parser.ParsedData(
+                Parser.DataStreamType.DATA_TYPE_SYS_RESOURCES,
+                # core 0 / 1 idle, heap min free / free 8 bit and 32 bit, avg SD card time to save
+                ColumnStore("LBBIIIIB", maxlen=self.maxlen),
+            ),
+            "SysTime": Parser.ParsedData(
+                Parser.DataStreamType.DATA_TYPE_SYS_TIME,
+                ColumnStore("Lq", maxlen=self.maxlen),
             ),
             # "States":       Parser.ParsedData(Parser.DatabinasciiStreamType.DATA_TYPE_SYS_STATES,
-            #                                   [arr.array('L'), arr.array('L'), arr.array('B'), arr.array('B'), arr.array('L'), arr.array('Q'), arr.array('Q')]),
+            #                                   ColumnStore("LLBBLQQ", maxlen=self.maxlen)),
             "gatt": {},
         }
+        self.streams = {key: entry.data for key, entry in self.dataDict.items() if key != "gatt"}
+        self.stores = list(self.streams.values())
+        if self.spill is not None:
+            for key, entry in self.dataDict.items():
+                if key != "gatt":
+                    entry.data.spillTo(partial(self.spill.write, key))
+        # min / max / mean levels of the streams for plotting, built on first use
+        self.pyramids = DecimationPyramids(self)
+        self.taskTrace = TaskTraceStore(maxlen=self.maxlen)
+        # names of the tasks in TaskStats, by the index stored there
+        self.taskNames = []
+        self.taskIndexes = {}
 
         self.imei = ""
 
+    # totLen/maxLen count every sample parsed so far, including the ones a
+    # bounded buffer no longer holds, so rates computed from them stay valid
+
     def totLen(self):
         dataLen = 0
-        for key in self.dataDict.keys():
-            if key == "gatt":
-                continue
-            dataLen += len(self.dataDict[key].data[0])
+        for store in self.stores:
+            dataLen += store.appended
         return dataLen
 
     def maxLen(self):
         maxVal = 0
-        for key in self.dataDict.keys():
-            if key == "gatt":
-                continue
-            entryLen = len(self.dataDict[key].data[0])
-            if entryLen > maxVal:
-                maxVal = entryLen
+        for store in self.stores:
+            if store.appended > maxVal:
+                maxVal = store.appended
         return maxVal
 
+    def spillEvicted(self):
+        for store in self.stores:
+            store.spillEvicted()
+
+    def taskIndex(self, taskName):
+        index = self.taskIndexes.get(taskName)
+        if index is None:
+            index = self.taskIndexes[taskName] = len(self.taskNames)
+            self.taskNames.append(taskName)
+        return index
+
 
 class Parser:
     HEADER_ID_COMMAND = 0x7C  # --> |
@@ -126,6 +164,7 @@ class Parser:
     CRC_LENGTH = 2
     HEADER_LENGTH = 4  # [headerID:1] [type:1] [length:2]
     MAX_PACKET_LEN = 2048  # --> 255
+    FILE_WINDOW_SIZE = 1 << 20  # bytes of a mapped dump file parsed per parseStream call
     WIFI_NUM_PROFILES = 3
     WIFI_LEN_SSID = 32
     ECG_NUM_CHANNELS = 5
@@ -201,17 +240,63 @@ class Parser:
 
     logf = lambda *args, **kwargs: None
 
-    def __init__(self, logf=lambda *args, **kwargs: None):
+    def __init__(self, logf=lambda *args, **kwargs: None, types=None, skipCrc=False):
+        """
+        ``types`` (DataStreamTypes or type bytes) restricts decoding to those
+        frame types, all others are only skipped. With ``skipCrc`` frames
+        that are not decoded are not CRC-checked either.
+        """
         self.logf = logf
         self.dataCallback = None
         self.dataBuffer = DeviceDataBuffer()
         self.deviceName = ""
+        # received combo sample numbers, gaps, duplicates and out-of-order packets
+        self.gaps = GapTracker()
+        # float32 g / dps / gauss / degree C views of the raw IMU streams, scaled by IMU_CONFIG
+        self.units = PhysicalUnits(self.dataBuffer)
+        self.scanner = FrameScanner(
+            [datatype.value for datatype in self.DataStreamType],
+            headerId=self.HEADER_ID_COMMAND,
+            headerLength=self.HEADER_LENGTH,
+            crcLength=self.CRC_LENGTH,
+            maxPacketLen=self.MAX_PACKET_LEN,
+            warn=lambda message: self.logf(f"Parser: {message}, continuing..."),
+        )
+        self.metrics = ParserMetrics(self)
+        # per type byte: callbacks called after each decoded frame (see subscribe)
+        self.subscribers = [None] * 256
+        # frames handed to a decoder / skipped, per type byte (see frameCounts)
+        self.decodedFrames = [0] * 256
+        self.skippedFrames = [0] * 256
+        # projected out types that still advance the frame counter handed to the decoders
+        self.countedTypes = bytearray(256)
+        if types is not None:
+            self.dispatch = projectedTable(self.dispatch, types)
+            for datatype, parserFunc in enumerate(Parser.dispatch):
+                if parserFunc and not self.dispatch[datatype]:
+                    self.countedTypes[datatype] = 1
+        if skipCrc:
+            self.scanner.skipCrcFor(datatype for datatype in range(256) if not self.dispatch[datatype])
         # self.gattParser = GattParser(logf=self.logf)
         pass
 
+    def frameCounts(self):
+        """``{DataStreamType name: (decoded, skipped)}`` of all frame types seen so far."""
+        counts = {}
+        for datatype in range(256):
+            if self.decodedFrames[datatype] or self.skippedFrames[datatype]:
+                counts[self.DataStreamType(datatype).name] = (self.decodedFrames[datatype], self.skippedFrames[datatype])
+        return counts
+
     def setDataCallBack(self, dataCallback):
+        """``dataCallback(summary)`` is called once per parseStream call that decoded frames, with a ParseSummary."""
         self.dataCallback = dataCallback
 
+    def subscribe(self, datatype, callback):
+        """Call ``callback(datatype, deviceName)`` after every decoded frame of ``datatype`` (DataStreamType or type byte)."""
+        datatype = getattr(datatype, "value", datatype)
+        self.subscribers[datatype] = (self.subscribers[datatype] or ()) + (callback,)
+
     @classmethod
     def int2DataStreamType(cls, val):
         try:
@@ -241,62 +326,9 @@ class Parser:
         startIndex += 4
         (numberOfSamples,) = struct.unpack("H", buffer[startIndex : startIndex + 2])
         startIndex += 2
-        for i in range(numberOfSamples):
-            # (checkA,) = struct.unpack(
-            #     "B", buffer[startIndex : startIndex + 1]
-            # )
-            # startIndex += 1
-            (accXValRaw, accYValRaw, accZValRaw) = struct.unpack(
-                ">hhh", buffer[startIndex : startIndex + 6]
-            )
-            startIndex += 6
-            # (checkB,) = struct.unpack(
-            #     "B", buffer[startIndex : startIndex + 1]
-            # )
-            # startIndex += 1
-            (gyrXValRaw, gyrYValRaw, gyrZValRaw) = struct.unpack(
-                ">hhh", buffer[startIndex : startIndex + 6]
-            )
-            startIndex += 6
-            # (checkC,) = struct.unpack(
-            #     "B", buffer[startIndex : startIndex + 1]
-            # )
-            # startIndex += 1
-            (magXValRaw, magYValRaw, magZValRaw) = struct.unpack(
-                "<hhh", buffer[startIndex : startIndex + 6]
-            )
-            startIndex += 6
-            # (checkD,) = struct.unpack(
-            #     "B", buffer[startIndex : startIndex + 1]
-            # )
-            # startIndex += 1
-            (temperature,) = struct.unpack(">h", buffer[startIndex : startIndex + 2])
-            # self.logf(f"Temperature: {temperature} | {binascii.hexlify( buffer[startIndex : startIndex + 2])}")
-            startIndex += 2
-            # (checkE,) = struct.unpack(
-            #     "B", buffer[startIndex : startIndex + 1]
-            # )
-            # startIndex += 1
-
-            self.dataBuffer.dataDict["ImuAccRaw"].data[0].append(timeStamp + i)
-            self.dataBuffer.dataDict["ImuAccRaw"].data[1].append(accXValRaw)
-            self.dataBuffer.dataDict["ImuAccRaw"].data[2].append(accYValRaw)
-            self.dataBuffer.dataDict["ImuAccRaw"].data[3].append(accZValRaw)
-
-            self.dataBuffer.dataDict["ImuGyrRaw"].data[0].append(timeStamp + i)
-            self.dataBuffer.dataDict["ImuGyrRaw"].data[1].append(gyrXValRaw)
-            self.dataBuffer.dataDict["ImuGyrRaw"].data[2].append(gyrYValRaw)
-            self.dataBuffer.dataDict["ImuGyrRaw"].data[3].append(gyrZValRaw)
-
-            self.dataBuffer.dataDict["ImuMagRaw"].data[0].append(timeStamp + i)
-            self.dataBuffer.dataDict["ImuMagRaw"].data[1].append(magXValRaw)
-            self.dataBuffer.dataDict["ImuMagRaw"].data[2].append(magYValRaw)
-            self.dataBuffer.dataDict["ImuMagRaw"].data[3].append(magZValRaw)
-
-            self.dataBuffer.dataDict["ImuTemp"].data[0].append(timeStamp + i)
-            self.dataBuffer.dataDict["ImuTemp"].data[1].append(temperature)
-            # self.logf(f"{timeStamp+i} : {hex(checkA)}, {hex(checkB)}, {hex(checkC)}, {hex(checkD)}, {hex(checkE)}")
-            # self.logf(f"{timeStamp+i} : {accXValRaw}, {accYValRaw}, {accZValRaw}, {gyrXValRaw}, {gyrYValRaw}, {gyrZValRaw}, {temperature}, {magXValRaw}, {magYValRaw}, {magZValRaw}")
+        self.gaps.add(timeStamp, numberOfSamples)
+        samples = decodeComboSamples(buffer, startIndex, numberOfSamples)
+        appendComboSamples(self.dataBuffer.dataDict, timeStamp, samples)
 
     def parseIMURawCombo(self, buffer, startIndex, sampleLength, timeStamp):
 
@@ -461,9 +493,9 @@ class Parser:
         self.dataBuffer.dataDict["States"].data[5].append(shirtIdL)
         self.dataBuffer.dataDict["States"].data[6].append(shirtIdH)
 
-        self.dataBuffer.imei = buffer[
-            startIndex + dataOffset : startIndex + dataOffset + self.IMEI_LEN
-        ].decode("ascii")
+        self.dataBuffer.imei = bytes(
+            buffer[startIndex + dataOffset : startIndex + dataOffset + self.IMEI_LEN]
+        ).decode("ascii")
 
     def parseBatteryData(self, buffer, startIndex, sampleLength, timeStamp):
         (consumption, voltageLevel, currentPercentage) = struct.unpack(
@@ -514,115 +546,49 @@ class Parser:
         self.dataBuffer.dataDict["PingV2"].data[2].append(usSinceEpoch)
 
     def parseIMUConfig(self, buffer, startIndex, sampleLength, timeStamp):
-        imuConfig = struct.unpack("I", buffer[startIndex : startIndex + 4])[0]
-        dataRate = imuConfig & self.maskImuDataRate
-        accelerometerFSR = imuConfig & self.maskImuAccFsr
-        gyroscopeFSR = imuConfig & self.maskImuGyrFsr
-        features = imuConfig & self.maskImuFeatures
-
-        values = [[dataRate, accelerometerFSR, gyroscopeFSR, features]]
-        data = self.ParsedData(self.DataStreamType.DATA_TYPE_IMU_CONFIG, values)
-        # TODO NEEDS STORAGE
+        imuConfig = struct.unpack_from("I", buffer, startIndex)[0]
+        self.units.configure(imuConfig)
+        self.dataBuffer.dataDict["ImuConfig"].data.append(
+            (
+                timeStamp,
+                imuConfig & self.maskImuDataRate,
+                imuConfig & self.maskImuAccFsr,
+                imuConfig & self.maskImuGyrFsr,
+                imuConfig & self.maskImuFeatures,
+            )
+        )
 
     def parseBARConfig(self, buffer, startIndex, sampleLength, timeStamp):
-        barConfig = struct.unpack("I", buffer[startIndex : startIndex + 4])[0]
-
-        data = self.ParsedData(self.DataStreamType.DATA_TYPE_BAR_CONFIG, [[barConfig]])
-        # TODO NEEDS STORAGE
+        barConfig = struct.unpack_from("I", buffer, startIndex)[0]
+        self.dataBuffer.dataDict["BarConfig"].data.append((timeStamp, barConfig))
 
     def parseTaskDataStats(self, buffer, startIndex, sampleLength, timeStamp):
-        # TODO add this stuff
-
-        taskName = buffer[startIndex : startIndex + 15].decode("ascii").split("\x00")[0]
-        (
-            frequency,
-            samplesProduced,
-            maxBytesProduced,
-            bytesProduced,
-            bufferOverflows,
-            stackHighWatermark,
-        ) = struct.unpack("fHHHHH", buffer[startIndex + 16 : startIndex + 30])
-        values = [
-            [
-                taskName,
-                frequency,
-                samplesProduced,
-                maxBytesProduced,
-                bytesProduced,
-                bufferOverflows,
-                stackHighWatermark,
-            ]
-        ]
-        data = self.ParsedData(self.DataStreamType.DATA_TYPE_SYS_TASK_STATS, values)
-        # TODO NEEDS STORAGE
+        taskName = bytes(buffer[startIndex : startIndex + 15]).decode("ascii").split("\x00")[0]
+        # frequency, samplesProduced, maxBytesProduced, bytesProduced, bufferOverflows, stackHighWatermark
+        values = struct.unpack_from("fHHHHH", buffer, startIndex + 16)
+        self.dataBuffer.dataDict["TaskStats"].data.append((timeStamp, self.dataBuffer.taskIndex(taskName)) + values)
 
     def parseResourceDataStats(self, buffer, startIndex, sampleLength, timeStamp):
-        (
-            core0Idle,
-            core1Idle,
-            heapMinFree8bit,
-            heapMinFree32bit,
-            heapFree8bit,
-            heapFree32bit,
-            sdCardAvgTimeToSave,
-        ) = struct.unpack("BBIIIIB", buffer[startIndex : startIndex + 21])
-        # print(str(core0Idle), str(core1Idle), str(heapMinFree8bit), str(heapMinFree32bit), str(heapFree8bit), str(heapFree32bit), str(sdCardAvgTimeToSave))
-        values = [
-            [
-                core0Idle,
-                core1Idle,
-                heapMinFree8bit,
-                heapMinFree32bit,
-                heapFree8bit,
-                heapFree32bit,
-                sdCardAvgTimeToSave,
-            ]
-        ]
-        data = self.ParsedData(self.DataStreamType.DATA_TYPE_SYS_RESOURCES, values)
-        # TODO NEEDS STORAGE
+        # core0Idle, core1Idle, heapMinFree8bit, heapMinFree32bit, heapFree8bit, heapFree32bit, sdCardAvgTimeToSave
+        values = struct.unpack_from("BBIIIIB", buffer, startIndex)
+        self.dataBuffer.dataDict["Resources"].data.append((timeStamp,) + values)
 
     def parseSysTime(self, buffer, startIndex, sampleLength, timeStamp):
-        time = struct.unpack("l", buffer[startIndex : startIndex + 8])
-        # self.logf(str(time))
-        data = self.ParsedData(self.DataStreamType.DATA_TYPE_SYS_TIME, [[time]])
-        # TODO NEEDS STORAGE
+        time = struct.unpack_from("q", buffer, startIndex)[0]
+        self.dataBuffer.dataDict["SysTime"].data.append((timeStamp, time))
 
     def parseTaskTrace(self, buffer, startIndex, sampleLength, timeStamp):
         """Parse task trace data from the buffer"""
         # Task trace entries are 16 bytes each: [task_id:4][timestamp:4][stack_high_water:4][cpu_usage:4]
-        entry_size = 16
-        num_entries = sampleLength // entry_size
-        
-        trace_entries = []
-        for i in range(num_entries):
-            entry_start = startIndex + (i * entry_size)
-            (task_id, entry_timestamp, stack_high_water, cpu_usage) = struct.unpack(
-                "IIII", buffer[entry_start : entry_start + entry_size]
-            )
-            trace_entries.append({
-                'task_id': task_id,
-                'timestamp': entry_timestamp,
-                'stack_high_water': stack_high_water,
-                'cpu_usage': cpu_usage
-            })
-        
-        # Store in data buffer for later access
-        if not hasattr(self.dataBuffer, 'task_trace_data'):
-            self.dataBuffer.task_trace_data = []
-        
-        self.dataBuffer.task_trace_data.extend(trace_entries)
-        
-        # Log the trace data
-        self.logf(f"Task Trace: Received {num_entries} entries")
-        for entry in trace_entries:
-            self.logf(f"  Task {entry['task_id']}: CPU {entry['cpu_usage']}%, Stack {entry['stack_high_water']} bytes")
-        
-        data = self.ParsedData(self.DataStreamType.DATA_TYPE_TASK_TRACE, [trace_entries])
-        return data
+        taskTrace = self.dataBuffer.taskTrace
+        taskTrace.extend(buffer, startIndex, sampleLength)
+        if taskTrace.logDue():
+            for line in taskTrace.summaryLines():
+                self.logf(line)
 
     def parseFileInfo(self, buffer, startIndex, sampleLength, timeStamp):
         fSize = struct.unpack("<I", buffer[:4])[0]
-        fName = buffer[startIndex:sampleLength].decode("ascii")
+        fName = bytes(buffer[startIndex:sampleLength]).decode("ascii")
         self.logf(f"Fname: {fName}, fSize: {fSize}")
         # return fSize, fName
 
@@ -660,6 +626,8 @@ class Parser:
         DataStreamType.DATA_TYPE_FILEINFO: parseFileInfo,
         DataStreamType.DATA_TYPE_FILEPART: parseFilePart,
     }
+    # parse functions by raw type byte, DataStreamType objects are only built on request
+    dispatch = dispatchTable(parsers)
 
     def crcValid(self, data, start, length):
         crcStart = start + length + self.HEADER_LENGTH
@@ -675,48 +643,103 @@ class Parser:
     def crc16(data, start, size):
         return crc16_mod(memoryview(data)[start : start + size])
 
-    def parseStream(self, buffer):
+    def parseStream(self, buffer, start=0, timestamp=0):
+        """
+        Parse all complete frames in ``buffer[start:]`` (bytes, bytearray, mmap or memoryview).
+
+        ``timestamp`` is the frame counter handed to the decoders for the first
+        frame, the counter after the last frame is left in ``frameTimestamp``.
+        Returns the absolute index in ``buffer`` where parsing has to resume.
+        """
+        started = time.perf_counter()
+        if self.dataCallback is None:
+            resumeIndex = self.drainFrames(buffer, start, timestamp)
+        else:
+            resumeIndex, summary = ParseSummary.drain(self, self.parseFrames(buffer, start, timestamp))
+            if summary:
+                self.dataCallback(summary)
+        self.metrics.observe(time.perf_counter() - started, resumeIndex - start)
+        return resumeIndex
+
+    def drainFrames(self, buffer, start=0, timestamp=0):
+        frames = self.parseFrames(buffer, start, timestamp)
+        try:
+            while True:
+                next(frames)
+        except StopIteration as done:
+            return done.value
+
+    def parseFile(self, path, windowSize=None):
+        """
+        Parse a dump file through a read-only mmap, ``windowSize`` bytes at a time.
+
+        A frame cut by the end of a window is parsed again from its header in
+        the next window. Pages of finished windows are released again where
+        the platform supports ``madvise``, so the resident size stays around
+        one window plus the parsed columns. Returns the number of bytes parsed.
+        """
+        windowSize = max(windowSize or self.FILE_WINDOW_SIZE, self.MAX_PACKET_LEN)
+        with open(path, "rb") as file:
+            fileSize = os.fstat(file.fileno()).st_size
+            if fileSize == 0:
+                return 0
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                position = 0
+                released = 0
+                timestamp = 0
+                while True:
+                    stop = min(position + windowSize, fileSize)
+                    with memoryview(mapped) as view, view[:stop] as window:
+                        position = self.parseStream(window, position, timestamp)
+                    timestamp = self.frameTimestamp
+                    if stop == fileSize:
+                        return position
+                    release = position - position % mmap.PAGESIZE
+                    if hasattr(mapped, "madvise") and release > released:
+                        mapped.madvise(mmap.MADV_DONTNEED, released, release - released)
+                        released = release
+
+    def parseFileRange(self, path, samples=None, seconds=None, tsf=None, types=None):
+        """
+        Decode only the frames of a dump file that cover the given range (see FrameIndex.select).
+
+        The frame index is read from the ``.idx`` sidecar next to the dump, or
+        built and stored there on first use. Returns the number of frames decoded.
+        """
+        index = FrameIndex.open(path, self)
+        frames = index.select(samples=samples, seconds=seconds, tsf=tsf, types=types)
+        FrameIndex.decode(path, self, frames)
+        return len(frames)
+
+    def iter_batches(self, buffer, start=0):
+        """
+        Parse ``buffer[start:]`` and yield ``(stream, columns)`` as frames are decoded.
+
+        ``stream`` is the dataDict key (e.g. ``"ImuAccRaw"``), ``columns`` are
+        zero-copy arrays of the rows the frame added, one per column. The rows
+        are kept in dataBuffer as with parseStream. Once exhausted, the index
+        where parsing has to resume is in ``resumeIndex``.
+        """
+        self.resumeIndex = yield from iterNewRows(self.dataBuffer.streams, self.parseFrames(buffer, start))
+
+    def parseFrames(self, buffer, start=0, timestamp=0):
+        """Generator behind parseStream: decodes one frame per step into dataBuffer and yields its type byte."""
         bufferLength = len(buffer)
-
-        i = 0
-        timestamp = 0
-        while i < bufferLength:
-            if (bufferLength - i) <= self.HEADER_LENGTH:
+        dispatch = self.dispatch
+        decodedFrames = self.decodedFrames
+        subscribers = self.subscribers
+
+        i = start
+        while True:
+            i, datatype, sampleLength = self.scanner.nextFrame(buffer, i, bufferLength)
+            if datatype is None:
+                self.frameTimestamp = timestamp
                 return i
-            if buffer[i] != self.HEADER_ID_COMMAND:
-                i = i + 1
-                continue
-            # import pdb; pdb.set_trace()
-
-            (datatype,) = struct.unpack("xB", buffer[i : i + 2])
-            (sampleLength,) = struct.unpack("<H", buffer[i + 2 : i + 4])
-
             packetLength = self.HEADER_LENGTH + sampleLength + self.CRC_LENGTH
 
-            if packetLength > self.MAX_PACKET_LEN:
-                i = i + 1
-                continue
-
-            if (bufferLength - i) < packetLength:
-                return i
-
-            if self.crcValid(buffer, i, sampleLength) is not True:
-                self.logf(
-                    f"Parser: CRC mismatch. seems not to be a valid packet, continuing...: {str(self.int2DataStreamType(datatype))}"
-                )
-                i = i + 1
-                continue
-
-            datatypeEnum = self.int2DataStreamType(datatype)
-            if datatypeEnum is None:
-                self.logf(
-                    f"Parser: Unknown frame type: {datatype} dropping whole sample"
-                )
-                i = i + packetLength
-                continue
-            # self.logf(f"Datatype: {datatypeEnum}")
-            parserFunc = self.parsers.get(datatypeEnum, None)
+            parserFunc = dispatch[datatype]
             if parserFunc:
+                decodedFrames[datatype] += 1
                 try:
                     parserFunc(
                         self, buffer, i + self.HEADER_LENGTH, sampleLength, timestamp
@@ -726,257 +749,37 @@ class Parser:
                     self.logf(
                         f"Parser: Exception while parising: {str(e)} in function: {str(parserFunc)}"
                     )
-                if self.dataCallback:
-                    self.dataCallback()
+                callbacks = subscribers[datatype]
+                if callbacks:
+                    for callback in callbacks:
+                        callback(datatype, self.deviceName)
+                yield datatype
+            else:
+                self.skippedFrames[datatype] += 1
+                timestamp += self.countedTypes[datatype]
 
             i = i + packetLength
 
-        return i
-
-    def parseGattHeartRateMeasurement(self, buffer, timestamp):
-        flags = struct.unpack("B", buffer[:1])[0]
-        dataOffset = 1
-        heartRateValueFormatFlag = bool(flags & 1 << 0)
-        sensorContactFlag = bool(flags & 1 << 1)
-        sensorContactSupportedFlag = bool(flags & 1 << 2)
-        energyExpendedPresentFlag = bool(flags & 1 << 3)
-        rrIntervalPresentFlag = bool(flags & 1 << 4)
-
-        hrValSize = 2 if heartRateValueFormatFlag else 1
-        hrValStructString = "H" if heartRateValueFormatFlag else "B"
-        hrVal = struct.unpack(
-            hrValStructString, buffer[dataOffset : dataOffset + hrValSize]
-        )[0]
-        dataOffset += hrValSize
-        energyExpended = None
-        if energyExpendedPresentFlag:
-            energyExpended = struct.unpack("H", buffer[dataOffset : dataOffset + 2])[0]
-            dataOffset += 2
-        rrInterval = None
-        if rrIntervalPresentFlag:
-            rrInterval = struct.unpack("H", buffer[dataOffset : dataOffset + 2])[0]
-        self.dataBuffer.dataDict["gatt"]["HeartRate"] = self.dataBuffer.dataDict[
-            "gatt"
-        ].get("HeartRate", [])
-        self.dataBuffer.dataDict["gatt"]["HeartRate"].append(
-            [
-                timestamp,
-                hrVal,
-                energyExpended,
-                rrInterval,
-                sensorContactFlag,
-                sensorContactSupportedFlag,
-            ]
-        )
-
-    def parseCumWheelRevs(self, buffer):
-        wheelRevs, timestamp = struct.unpack("IH", buffer[:6])
-        nBytesParsed = 6
-        timestamp = (
-            timestamp * 1000 * 1000 / 1024
-        )  # unit was 1/1024 seconds, is microseconds
-        return nBytesParsed, timestamp, wheelRevs
-
-    def parseCumCrankRevs(self, buffer):
-        crankRevs, timestamp = struct.unpack("HH", buffer[:4])
-        nBytesParsed = 4
-        timestamp = (
-            timestamp * 1000 * 1000 / 1024
-        )  # unit was 1/1024 seconds, is microseconds
-        return nBytesParsed, timestamp, crankRevs
-
-    def parseGattCSC(self, buffer, timestamp):
-        flags = struct.unpack("B", buffer[:1])[0]
-        dataOffset = 1
-        now = timestamp
-
-        wheelRevFlag = bool(flags & 1 << 0)
-        crankRevFlag = bool(flags & 1 << 1)
-
-        if wheelRevFlag:
-            nBytesParsed, timestamp, wheelRevs = self.parseCumWheelRevs(
-                buffer[dataOffset:]
-            )
-            dataOffset += nBytesParsed
-            self.dataBuffer.dataDict["gatt"]["CumulativeWheelRevolutions"] = (
-                self.dataBuffer.dataDict["gatt"].get("CumulativeWheelRevolutions", [])
-            )
-            self.dataBuffer.dataDict["gatt"]["CumulativeWheelRevolutions"].append(
-                [now, wheelRevs]
-            )
-
-        if crankRevFlag:
-            nBytesParsed, timestamp, crankRevs = self.parseCumCrankRevs(
-                buffer[dataOffset:]
-            )
-            dataOffset += nBytesParsed
-            self.dataBuffer.dataDict["gatt"]["CumulativeCrankRevolutions"] = (
-                self.dataBuffer.dataDict["gatt"].get("CumulativeCrankRevolutions", [])
-            )
-            self.dataBuffer.dataDict["gatt"]["CumulativeCrankRevolutions"].append(
-                [now, crankRevs]
-            )
-
-    def parseGattCyclingPowerMeasurement(self, buffer, timestamp):
-        flags = struct.unpack("H", buffer[:2])[0]
-        dataOffset = 2
-
-        outData = []
-
-        now = timestamp
-        outData.append(now)
-
-        instantaneousPower = struct.unpack("h", buffer[dataOffset : dataOffset + 2])[0]
-        dataOffset += 2
-        outData.append(instantaneousPower)
-
-        pedalPowerBalanceData = None
-        pedalPowerBalancePresentFlag = bool(flags & 1 << 0)
-        if pedalPowerBalancePresentFlag:
-            pedalPowerBalanceReferenceFlag = bool(flags & 1 << 1)
-            pedalPowerBalance = struct.unpack("B", buffer[dataOffset : dataOffset + 1])[
-                0
-            ]
-            dataOffset += 1
-            pedalPowerBalanceData = (
-                pedalPowerBalance / 2,
-                pedalPowerBalanceReferenceFlag,
-            )
-        outData.append(pedalPowerBalanceData)
-
-        accumulatedTorqueData = None
-        accumulatedTorquePresentFlag = bool(flags & 1 << 2)
-        if accumulatedTorquePresentFlag:
-            accumulatedTorqueSourceFlag = bool(flags & 1 << 3)
-            accumulatedTorque = struct.unpack("H", buffer[dataOffset : dataOffset + 2])[
-                0
-            ]
-            dataOffset += 2
-            accumulatedTorqueData = (
-                accumulatedTorque / 32,
-                accumulatedTorqueSourceFlag,
-            )
-        outData.append(accumulatedTorqueData)
-
-        wheelRevolutionDataData = None
-        wheelRevolutionDataPresentFlag = bool(flags & 1 << 4)
-        if wheelRevolutionDataPresentFlag:
-            nBytesParsed, timestamp, wheelRevs = self.parseCumWheelRevs(
-                buffer[dataOffset:]
-            )
-            dataOffset += nBytesParsed
-            wheelRevolutionDataData = (timestamp, wheelRevs)
-
-        outData.append(wheelRevolutionDataData)
-
-        crankRevolutionDataData = None
-        crankRevolutionDataPresentFlag = bool(flags & 1 << 5)
-        if crankRevolutionDataPresentFlag:
-            nBytesParsed, timestamp, crankRevs = self.parseCumCrankRevs(
-                buffer[dataOffset:]
-            )
-            dataOffset += nBytesParsed
-            crankRevolutionDataData = (timestamp, crankRevs)
-        outData.append(crankRevolutionDataData)
-
-        extremeForceMagnitudesData = None
-        extremeForceMagnitudesPresentFlag = bool(flags & 1 << 6)
-        if extremeForceMagnitudesPresentFlag:
-            maxForce, minForce = struct.unpack(
-                "hh", buffer[dataOffset : dataOffset + 4]
-            )
-            dataOffset += 4
-            extremeForceMagnitudesData = (maxForce, minForce)
-        outData.append(extremeForceMagnitudesData)
-
-        extremeTorqueMagnitudesData = None
-        extremeTorqueMagnitudesPresentFlag = bool(flags & 1 << 7)
-        if extremeTorqueMagnitudesPresentFlag:
-            maxTorque, minTorque = struct.unpack(
-                "hh", buffer[dataOffset : dataOffset + 4]
-            )
-            dataOffset += 4
-            extremeTorqueMagnitudesData = (maxTorque, minTorque)
-        outData.append(extremeTorqueMagnitudesData)
-
-        extremeAnglesData = None
-        extremeAnglesPresentFlag = bool(flags & 1 << 8)
-        if extremeAnglesPresentFlag:
-            dataOffset += 3
-        outData.append(extremeAnglesData)
-
-        topDeadSpotAngleData = None
-        topDeadSpotAnglePresentFlag = bool(flags & 1 << 9)
-        if topDeadSpotAnglePresentFlag:
-            dataOffset += 2
-        outData.append(topDeadSpotAngleData)
-
-        bottomDeadSpotAngleData = None
-        bottomDeadSpotAnglePresentFlag = bool(flags & 1 << 10)
-        if bottomDeadSpotAnglePresentFlag:
-            dataOffset += 2
-        outData.append(bottomDeadSpotAngleData)
-
-        accumulatedEnergyData = None
-        accumulatedEnergyPresentFlag = bool(flags & 1 << 11)
-        if accumulatedEnergyPresentFlag:
-            accumulatedEnergy = struct.unpack("h", buffer[dataOffset : dataOffset + 2])[
-                0
-            ]
-            dataOffset += 2
-            accumulatedEnergyData = accumulatedEnergy
-
-        outData.append(accumulatedEnergyData)
-
-        offsetCompensationIndicatorFlag = bool(flags & 1 << 12)
-
-        self.dataBuffer.dataDict["gatt"][
-            "CyclingPowerMeasurement"
-        ] = self.dataBuffer.dataDict["gatt"].get(
-            "CyclingPowerMeasurement",
-            {
-                "fields": [
-                    "WallTime",
-                    "InstantaneousPower",
-                    "PedalPowerBalance",
-                    "AccumulatedTorque",
-                    "WheelRevolutionData",
-                    "CrankRevolutionData",
-                    "ExtremeForceMagnitudes",
-                    "ExtremeTorqueMagnitudes",
-                    "ExtremeAngles",
-                    "TopDeadSpotAngle",
-                    "BottomDeadSpotAngle",
-                    "AccumulatedEnergy",
-                    "OffsetCompensationIndicator",
-                ],
-                "data": [],
-            },
-        )
-
-        self.dataBuffer.dataDict["gatt"]["CyclingPowerMeasurement"]["data"].append(
-            outData
-        )
-
-    gattParsers = {
-        "2a5b": parseGattCSC,
-        "2a63": parseGattCyclingPowerMeasurement,
-        "2a37": parseGattHeartRateMeasurement,
-    }
+    def gattTable(self, uuid):
+        """GattTable of characteristic ``uuid`` in ``dataDict["gatt"]``, created on first use."""
+        characteristic = GATT_CHARACTERISTICS[uuid]
+        tables = self.dataBuffer.dataDict["gatt"]
+        table = tables.get(characteristic.name)
+        if table is None:
+            table = tables[characteristic.name] = GattTable(characteristic, maxlen=self.dataBuffer.maxlen)
+        return table
 
     def parseGattBattery(self, buffer) -> int:
         batteryLevel = struct.unpack("B", buffer[:1])[0]
         return batteryLevel
 
     def parseGatt(self, uuid, gattDataBuffer, timestamp):
-        gattParserFunc = self.gattParsers.get(uuid, None)
-        if gattParserFunc:
-            # gattParserFunc(self, gattDataBuffer)
+        if uuid in GATT_CHARACTERISTICS:
             try:
-                gattParserFunc(self, gattDataBuffer, timestamp)
+                self.gattTable(uuid).append(gattDataBuffer, timestamp)
             except Exception as e:
                 self.logf(
-                    f"Parser: Exception while parising: {str(e)} in function: {str(gattParserFunc)}"
+                    f"Parser: Exception while parising: {str(e)} in GATT characteristic: {uuid}"
                 )
         else:
             self.dataBuffer.dataDict["gatt"][uuid] = self.dataBuffer.dataDict[
@@ -984,6 +787,20 @@ class Parser:
             ].get(uuid, [])
             self.dataBuffer.dataDict["gatt"][uuid].append(gattDataBuffer)
 
+    def parseGattMany(self, uuid, gattDataBuffers, timestamps):
+        """Decode a batch of records of one characteristic, records of the same flags in one step."""
+        if uuid not in GATT_CHARACTERISTICS:
+            for gattDataBuffer, timestamp in zip(gattDataBuffers, timestamps):
+                self.parseGatt(uuid, gattDataBuffer, timestamp)
+            return
+        table = self.gattTable(uuid)
+        truncated = table.truncated
+        table.extend(gattDataBuffers, timestamps)
+        if table.truncated != truncated:
+            self.logf(
+                f"Parser: dropped {table.truncated - truncated} truncated records of GATT characteristic: {uuid}, continuing..."
+            )
+
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,146 @@
+import random
+import struct
+import time
+import tracemalloc
+from functools import lru_cache
+
+from sensor_emulator import SensorEmulator
+from x22_fleet.Library.dataParser import DeviceDataBuffer, Parser
+from x22_fleet.Testing.ParserBenchmark import buildFrame, referenceComboDecode
+
+SAMPLES_PER_PACKET = 64
+
+
+class StepClock:
+    """Stand-in for ``time.time`` advancing a fixed step per call, makes SensorEmulator packets reproducible."""
+
+    def __init__(self, start=1_700_000_000.0, step=SAMPLES_PER_PACKET / 500):
+        self.now = start
+        self.step = step
+
+    def __call__(self):
+        now = self.now
+        self.now += self.step
+        return now
+
+
+@lru_cache(maxsize=None)
+def emulatorFrames(packets):
+    """``packets`` COMBO_V3 frames from SensorEmulator.build_packet (500 Hz, 64 samples), always the same bytes."""
+    emulator = SensorEmulator(fs=500, num_samples_per_packet=SAMPLES_PER_PACKET, clock=StepClock())
+    frames = []
+    for index in range(packets):
+        frame = emulator.build_packet()
+        # the emulator sends a microsecond timestamp where sensors send the first sample number,
+        # consecutive sample numbers keep the gap accounting and the reorder stage on their fast path
+        sampleNumber = struct.pack("<I", index * SAMPLES_PER_PACKET)
+        frames.append(buildFrame(frame[1], sampleNumber + frame[8:-2]))
+    return tuple(frames)
+
+
+def toComboV2(frame):
+    """COMBO_V2 frame with the samples of a COMBO_V3 frame, as stored in dump files."""
+    payload = frame[4:-2]
+    # V3 has the u64 tsf between sample number and sample count
+    return buildFrame(Parser.DataStreamType.DATA_TYPE_IMU_RAW_COMBO_V2.value, payload[:4] + payload[12:])
+
+
+def cleanStream(packets, version=3):
+    frames = emulatorFrames(packets)
+    if version == 2:
+        frames = [toComboV2(frame) for frame in frames]
+    return b"".join(frames)
+
+
+def corruptedStream(packets, percent, seed=0, version=3):
+    """Stream with one flipped byte in ``percent`` % of the frames, those fail the CRC check."""
+    rng = random.Random(seed)
+    frames = emulatorFrames(packets)
+    if version == 2:
+        frames = [toComboV2(frame) for frame in frames]
+    stream = bytearray()
+    for frame in frames:
+        if rng.random() * 100 < percent:
+            frame = bytearray(frame)
+            frame[rng.randrange(len(frame))] ^= 1 << rng.randrange(8)
+        stream += frame
+    return bytes(stream)
+
+
+def mixedStream(packets, seed=0, version=3, smallPerCombo=3):
+    """Combo frames with ``smallPerCombo`` random ping / ping V2 / battery frames after each."""
+    rng = random.Random(seed)
+    types = Parser.DataStreamType
+    small = (
+        (types.DATA_TYPE_SYS_PING.value, 32),
+        (types.DATA_TYPE_SYS_PING_V2.value, 16),
+        (types.DATA_TYPE_SYS_BATTERY.value, 6),
+    )
+    stream = bytearray()
+    for index, frame in enumerate(emulatorFrames(packets)):
+        stream += toComboV2(frame) if version == 2 else frame
+        for extra in range(smallPerCombo):
+            datatype, length = small[(index + extra) % len(small)]
+            stream += buildFrame(datatype, bytes(rng.getrandbits(8) for _ in range(length)))
+    return bytes(stream)
+
+
+def fragment(stream, seed=0, minSize=20, maxSize=400):
+    """Split ``stream`` into MQTT messages of random sizes."""
+    rng = random.Random(seed)
+    messages = []
+    offset = 0
+    while offset < len(stream):
+        size = rng.randint(minSize, maxSize)
+        messages.append(stream[offset : offset + size])
+        offset += size
+    return messages
+
+
+def measure(run, byteCount, repeat=3):
+    """
+    Best-of-``repeat`` throughput of ``run()`` and its peak traced memory.
+
+    ``run`` builds its own parser each call and returns the number of
+    samples it decoded. Returns ``{"mb_per_s",
+    "samples_per_s", "peak_mib"}``; memory is traced in an extra run so the
+    tracing overhead does not count into the timing.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        samples = run()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "mb_per_s": byteCount / best / 1e6,
+        "samples_per_s": samples / best,
+        "peak_mib": peak / (1 << 20),
+    }
+
+
+
+def referenceDecode(packets):
+    """
+    ``measure`` result of the per-sample struct decoding (referenceComboDecode)
+    of ``packets`` emulator frames. The benchmark baseline is stored relative
+    to it, so it carries over to machines of different speed. Measured next
+    to each benchmark, a machine slowing down during the run affects both.
+    """
+    frames = emulatorFrames(packets)
+    # V3 payload: sample number, tsf, sample count, then the samples
+    samplesOffset = 4 + 4 + 8 + 2
+
+    def run():
+        dataBuffer = DeviceDataBuffer()
+        for index, frame in enumerate(frames):
+            referenceComboDecode(dataBuffer.dataDict, frame, samplesOffset, index * SAMPLES_PER_PACKET, SAMPLES_PER_PACKET)
+        return len(frames) * SAMPLES_PER_PACKET
+
+    return measure(run, sum(len(frame) for frame in frames))
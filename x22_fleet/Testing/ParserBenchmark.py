@@ -0,0 +1,277 @@
+import argparse
+import importlib.util
+import os
+import random
+import struct
+import time
+
+from x22_fleet.Library.BlockDecoder import appendComboSamples, decodeComboSamples
+from x22_fleet.Library.ReceiveBuffer import ReceiveBuffer
+from x22_fleet.Library.dataParser import DeviceDataBuffer, Parser
+
+
+def buildFrame(datatype, payload):
+    """Wrap ``payload`` into a ``| type len payload crc`` frame."""
+    header = struct.pack("<BBH", Parser.HEADER_ID_COMMAND, datatype, len(payload))
+    crc = Parser.crc16(header + payload, 0, len(header) + len(payload))
+    return header + payload + struct.pack("<H", crc)
+
+
+def buildComboPayload(sampleNumber, numberOfSamples, rng):
+    """IMU_RAW_COMBO_V2 payload with random sample values."""
+    payload = struct.pack("<IH", sampleNumber, numberOfSamples)
+    return payload + bytes(rng.getrandbits(8) for _ in range(numberOfSamples * 20))
+
+
+STREAM_RECEIVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "integrate_stream_receiver")
+
+
+def loadStreamReceiverParser():
+    """Fresh copy of integrate_stream_receiver/dataParser.py, which is not importable as a package module."""
+    spec = importlib.util.spec_from_file_location("dataParser", os.path.join(STREAM_RECEIVER_DIR, "dataParser.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def buildComboV3Payload(sampleNumber, tsf, numberOfSamples, rng):
+    """IMU_RAW_COMBO_V3 payload, the V2 one with the u64 tsf after the sample number."""
+    payload = buildComboPayload(sampleNumber, numberOfSamples, rng)
+    return payload[:4] + struct.pack("<Q", tsf) + payload[4:]
+
+
+def columnLists(store):
+    """Column values of a ColumnStore as plain lists, for comparisons."""
+    return [column.tolist() for column in store]
+
+
+def referenceComboDecode(dataDict, buffer, startIndex, timeStamp, numberOfSamples):
+    """Per-sample struct.unpack decoding as the parsers did before the block decoder."""
+    for i in range(numberOfSamples):
+        (accX, accY, accZ) = struct.unpack(">hhh", buffer[startIndex : startIndex + 6])
+        startIndex += 6
+        (gyrX, gyrY, gyrZ) = struct.unpack(">hhh", buffer[startIndex : startIndex + 6])
+        startIndex += 6
+        (magX, magY, magZ) = struct.unpack("<hhh", buffer[startIndex : startIndex + 6])
+        startIndex += 6
+        (temperature,) = struct.unpack(">h", buffer[startIndex : startIndex + 2])
+        startIndex += 2
+
+        for key, values in (
+            ("ImuAccRaw", (accX, accY, accZ)),
+            ("ImuGyrRaw", (gyrX, gyrY, gyrZ)),
+            ("ImuMagRaw", (magX, magY, magZ)),
+        ):
+            dataDict[key].data[0].append(timeStamp + i)
+            for axis in range(3):
+                dataDict[key].data[axis + 1].append(values[axis])
+
+        dataDict["ImuTemp"].data[0].append(timeStamp + i)
+        dataDict["ImuTemp"].data[1].append(temperature)
+
+
+def benchComboDecode(packets=2000, numberOfSamples=64, seed=0):
+    """Time struct-loop vs block decoding of combo payloads, returns (loop_s, block_s)."""
+    rng = random.Random(seed)
+    payloads = [
+        buildComboPayload(i * numberOfSamples, numberOfSamples, rng) for i in range(packets)
+    ]
+
+    reference = DeviceDataBuffer()
+    start = time.perf_counter()
+    for i, payload in enumerate(payloads):
+        referenceComboDecode(reference.dataDict, payload, 6, i * numberOfSamples, numberOfSamples)
+    loopTime = time.perf_counter() - start
+
+    block = DeviceDataBuffer()
+    start = time.perf_counter()
+    for i, payload in enumerate(payloads):
+        samples = decodeComboSamples(payload, 6, numberOfSamples)
+        appendComboSamples(block.dataDict, i * numberOfSamples, samples)
+    blockTime = time.perf_counter() - start
+
+    for key in ("ImuAccRaw", "ImuGyrRaw", "ImuMagRaw", "ImuTemp"):
+        if columnLists(reference.dataDict[key].data) != columnLists(block.dataDict[key].data):
+            raise AssertionError(f"block decoder differs from reference in {key}")
+
+    return loopTime, blockTime
+
+
+def buildComboStream(packets, numberOfSamples, rng, garbageBytes=0):
+    """Combo V2 stream, optionally with ``garbageBytes`` of random bytes after every frame."""
+    stream = bytearray()
+    for i in range(packets):
+        payload = buildComboPayload(i * numberOfSamples, numberOfSamples, rng)
+        stream += buildFrame(Parser.DataStreamType.DATA_TYPE_IMU_RAW_COMBO_V2.value, payload)
+        stream += bytes(rng.getrandbits(8) for _ in range(garbageBytes))
+    return stream
+
+
+def benchCorruptedStream(packets=500, numberOfSamples=64, garbageBytes=1024, seed=0):
+    """Time parseStream on a clean stream and on one with garbage between frames."""
+    rng = random.Random(seed)
+    results = {}
+    for name, garbage in (("clean", 0), ("corrupted", garbageBytes)):
+        stream = buildComboStream(packets, numberOfSamples, rng, garbage)
+        parser = Parser()
+        start = time.perf_counter()
+        parser.parseStream(stream)
+        results[name] = (len(stream), time.perf_counter() - start, parser.scanner.skippedBytes)
+    return results
+
+
+def buildMixedStream(packets, rng, comboEvery=10):
+    """Stream of small ping / ping V2 / battery frames with a combo V2 frame every ``comboEvery`` frames."""
+    types = Parser.DataStreamType
+    small = (
+        (types.DATA_TYPE_SYS_PING.value, 32),
+        (types.DATA_TYPE_SYS_PING_V2.value, 16),
+        (types.DATA_TYPE_SYS_BATTERY.value, 6),
+    )
+    stream = bytearray()
+    for i in range(packets):
+        if i % comboEvery == 0:
+            payload = buildComboPayload(i * 64, 64, rng)
+            stream += buildFrame(types.DATA_TYPE_IMU_RAW_COMBO_V2.value, payload)
+        else:
+            datatype, length = small[i % len(small)]
+            stream += buildFrame(datatype, bytes(rng.getrandbits(8) for _ in range(length)))
+    return stream
+
+
+def referenceEnumDispatch(parser, buffer):
+    """parseStream as it dispatched before the type table: Enum per frame, then a dict lookup."""
+    i = 0
+    timestamp = 0
+    while True:
+        i, datatype, sampleLength = parser.scanner.nextFrame(buffer, i, len(buffer))
+        if datatype is None:
+            return i
+        parserFunc = parser.parsers.get(parser.int2DataStreamType(datatype), None)
+        if parserFunc:
+            try:
+                parserFunc(parser, buffer, i + parser.HEADER_LENGTH, sampleLength, timestamp)
+                timestamp += 1
+            except Exception as e:
+                parser.logf(f"Parser: Exception while parising: {str(e)} in function: {str(parserFunc)}")
+        i = i + parser.HEADER_LENGTH + sampleLength + parser.CRC_LENGTH
+
+
+def benchMixedDispatch(packets=20000, seed=0, repeat=5):
+    """Time Enum dispatch vs the type table on a mixed stream (best of ``repeat``), returns (frames, enum_s, table_s)."""
+    stream = buildMixedStream(packets, random.Random(seed))
+    enumTime = tableTime = float("inf")
+    for _ in range(repeat):
+        reference = Parser()
+        start = time.perf_counter()
+        referenceEnumDispatch(reference, stream)
+        enumTime = min(enumTime, time.perf_counter() - start)
+
+        parser = Parser()
+        start = time.perf_counter()
+        parser.parseStream(stream)
+        tableTime = min(tableTime, time.perf_counter() - start)
+
+    for key in ("Ping", "PingV2", "Battery", "ImuAccRaw"):
+        if columnLists(reference.dataBuffer.dataDict[key].data) != columnLists(parser.dataBuffer.dataDict[key].data):
+            raise AssertionError(f"type table dispatch differs from reference in {key}")
+    return packets, enumTime, tableTime
+
+
+def benchReceiveBuffer(packets=2000, messageSize=333, seed=0):
+    """Time slice-and-reassign truncation vs ReceiveBuffer on a fragmented stream, returns (messages, slice_s, offset_s)."""
+    stream = buildComboStream(packets, 64, random.Random(seed))
+    messages = [stream[offset : offset + messageSize] for offset in range(0, len(stream), messageSize)]
+
+    parser = Parser()
+    buffer = bytearray()
+    start = time.perf_counter()
+    for message in messages:
+        buffer.extend(message)
+        buffer = buffer[parser.parseStream(buffer) :]
+    sliceTime = time.perf_counter() - start
+
+    parser = Parser()
+    receiveBuffer = ReceiveBuffer()
+    start = time.perf_counter()
+    for message in messages:
+        receiveBuffer.extend(message)
+        receiveBuffer.consume(parser.parseStream(receiveBuffer.data, receiveBuffer.offset))
+    offsetTime = time.perf_counter() - start
+    return len(messages), sliceTime, offsetTime
+
+
+def benchCallbacks(packets=20000, messageSize=4096, seed=0, repeat=5):
+    """
+    Time per-frame callbacks vs one ParseSummary per parseStream on a mixed stream in MQTT-sized messages.
+
+    Returns ``{name: (callbacks, seconds)}`` (best of ``repeat``); the
+    callbacks look the parser up in a dict like DeviceParser does.
+    """
+    stream = buildMixedStream(packets, random.Random(seed))
+    messages = [stream[offset : offset + messageSize] for offset in range(0, len(stream), messageSize)]
+    results = {}
+    for name in ("none", "per frame", "per call"):
+        best = float("inf")
+        for _ in range(repeat):
+            parser = Parser()
+            parsers = {"dev": parser}
+            calls = [0]
+
+            def onFrame(datatype, deviceName):
+                parsers[deviceName or "dev"]
+                calls[0] += 1
+
+            def onSummary(summary):
+                parsers[summary.deviceName or "dev"]
+                calls[0] += 1
+
+            if name == "per frame":
+                for datatype in parser.DataStreamType:
+                    parser.subscribe(datatype, onFrame)
+            elif name == "per call":
+                parser.setDataCallBack(onSummary)
+            receiveBuffer = ReceiveBuffer()
+            start = time.perf_counter()
+            for message in messages:
+                receiveBuffer.extend(message)
+                receiveBuffer.consume(parser.parseStream(receiveBuffer.data, receiveBuffer.offset))
+            best = min(best, time.perf_counter() - start)
+        results[name] = (calls[0], best)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro benchmarks for the X22 data parser.")
+    parser.add_argument("--packets", type=int, default=2000, help="Number of combo packets (default: 2000)")
+    parser.add_argument("--samples", type=int, default=64, help="Samples per packet (default: 64)")
+    args = parser.parse_args()
+
+    loopTime, blockTime = benchComboDecode(args.packets, args.samples)
+    totalSamples = args.packets * args.samples
+    print(f"combo decode, {args.packets} packets x {args.samples} samples")
+    print(f"  struct loop : {loopTime * 1e3:8.1f} ms  {totalSamples / loopTime:12.0f} samples/s")
+    print(f"  block       : {blockTime * 1e3:8.1f} ms  {totalSamples / blockTime:12.0f} samples/s")
+    print(f"  speedup     : {loopTime / blockTime:8.1f}x")
+
+    print(f"parseStream, {args.packets // 4} packets")
+    for name, (size, elapsed, skipped) in benchCorruptedStream(args.packets // 4, args.samples).items():
+        print(f"  {name:<10}: {elapsed * 1e3:8.1f} ms  {size / elapsed / 1e6:8.1f} MB/s  {skipped} bytes skipped")
+
+    frames, enumTime, tableTime = benchMixedDispatch(args.packets * 10)
+    print(f"dispatch, {frames} mixed frames")
+    print(f"  enum + dict : {enumTime * 1e3:8.1f} ms  {enumTime / frames * 1e6:8.2f} us/frame")
+    print(f"  type table  : {tableTime * 1e3:8.1f} ms  {tableTime / frames * 1e6:8.2f} us/frame")
+
+    messages, sliceTime, offsetTime = benchReceiveBuffer(args.packets)
+    print(f"receive buffer, {messages} MQTT-sized messages")
+    print(f"  slice copy  : {sliceTime * 1e3:8.1f} ms")
+    print(f"  read offset : {offsetTime * 1e3:8.1f} ms")
+
+    print(f"data callbacks, {args.packets * 10} mixed frames in 4 kB messages")
+    for name, (calls, elapsed) in benchCallbacks(args.packets * 10).items():
+        print(f"  {name:<11} : {elapsed * 1e3:8.1f} ms  {calls:8d} callbacks")
+
+
+if __name__ == "__main__":
+    main()
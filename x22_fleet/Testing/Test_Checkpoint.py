@@ -0,0 +1,85 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+from x22_fleet.Library.BlockDecoder import IMU_COMBO_SAMPLE
+from x22_fleet.Library.Checkpoint import Checkpointer, packState, unpackState
+from x22_fleet.Library.ReceiveBuffer import ReceiveBuffer
+from x22_fleet.Testing.ParserBenchmark import buildComboV3Payload, buildFrame, loadStreamReceiverParser
+
+
+def test_state_round_trip():
+    samples = np.zeros(3, dtype=IMU_COMBO_SAMPLE)
+    samples["acc"] = [[1, -2, 3]] * 3
+    state = {
+        "name": "0D_17_56",
+        "tsf": 2**63 - 1,
+        "rate": 1 / 3,
+        "missing": None,
+        "nested": [[7, samples], {"raw": b"\x7c\x1e\x00"}],
+        "intervals": np.arange(8, dtype=np.int64).reshape(4, 2),
+    }
+    restored = unpackState(packState(state))
+    assert restored["name"] == "0D_17_56" and restored["tsf"] == 2**63 - 1 and restored["rate"] == 1 / 3
+    assert restored["missing"] is None and restored["nested"][1]["raw"] == b"\x7c\x1e\x00"
+    assert restored["nested"][0][1].dtype == IMU_COMBO_SAMPLE and np.array_equal(restored["nested"][0][1], samples)
+    assert np.array_equal(restored["intervals"], state["intervals"])
+
+    with pytest.raises(ValueError):
+        unpackState(b"X22D" + packState(state)[4:])
+    with pytest.raises(ValueError):
+        unpackState(packState(state)[:-1])
+
+
+def test_restored_parser_continues_where_it_stopped(tmp_path):
+    rng = random.Random(25)
+    module = loadStreamReceiverParser()
+    numberOfSamples = 16
+    # sample numbers 320..335 never arrive, packets 41 and 42 are swapped
+    order = [i for i in range(80) if i != 20]
+    order[40], order[41] = order[41], order[40]
+    stream = b"".join(
+        buildFrame(
+            module.Parser.DataStreamType.DATA_TYPE_IMU_RAW_COMBO_V3.value,
+            buildComboV3Payload(i * numberOfSamples, 10**12 + i * 32_000 + rng.randrange(200), numberOfSamples, rng),
+        )
+        for i in order
+    )
+    frameLength = len(stream) // len(order)
+    # stop in the middle of a frame, with the packets behind the gap held for reordering
+    cut = 40 * frameLength + frameLength // 2
+
+    def feed(parser, buffer, data):
+        buffer.extend(data)
+        buffer.consume(parser.parseStream(buffer.data, buffer.offset))
+
+    reference = module.Parser(reorderDelay=60.0)
+    feed(reference, ReceiveBuffer(), stream)
+    reference.flushReorder()
+
+    parser, buffer = module.Parser(deviceName="0D_17_56", reorderDelay=60.0), ReceiveBuffer()
+    feed(parser, buffer, stream[:cut])
+    assert len(buffer) == frameLength // 2 and parser.reorder.pendingPackets == 20
+
+    checkpointer = Checkpointer(os.path.join(tmp_path, "receiver.checkpoint"), lambda: {"parser": parser.snapshot(), "buffer": buffer.snapshot()})
+    assert checkpointer.load() is None
+    checkpointer.save()
+    state = checkpointer.load()
+    restarted, restartedBuffer = module.Parser(reorderDelay=60.0), ReceiveBuffer()
+    restarted.restore(state["parser"])
+    restartedBuffer.restore(state["buffer"])
+    feed(restarted, restartedBuffer, stream[cut:])
+    restarted.flushReorder()
+
+    assert restarted.deviceName == "0D_17_56"
+    assert restarted.missedSamples == reference.missedSamples == 1
+    assert restarted.gaps.intervals == reference.gaps.intervals == [(0, 320), (336, 1280)]
+    assert restarted.reorder.reorderedPackets == reference.reorder.reorderedPackets == 1
+    assert restarted.clock.state() == reference.clock.state()
+    assert restarted.frameCounts() == reference.frameCounts()
+    # the restarted parser stores the held packets and everything after the cut
+    sampleNumbers = restarted.dataBuffer.dataDict["ImuAccRaw"].data[0].view()
+    assert np.array_equal(sampleNumbers, reference.dataBuffer.dataDict["ImuAccRaw"].data[0].view()[-len(sampleNumbers) :])
+    assert sampleNumbers[0] == 21 * numberOfSamples
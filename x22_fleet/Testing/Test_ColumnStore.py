@@ -0,0 +1,72 @@
+import random
+
+import numpy as np
+
+from x22_fleet.Library.ColumnStore import Column, ColumnStore, SpillSink
+from x22_fleet.Library.dataParser import DeviceDataBuffer, Parser
+from x22_fleet.Testing.ParserBenchmark import buildComboStream
+
+
+def test_column_grows_and_keeps_views_valid():
+    column = Column("h")
+    column.extend(range(10))
+    head = column.view(0, 10)
+    for value in range(10, 1000):
+        column.append(value)
+
+    assert len(column) == 1000
+    assert column.tolist() == list(range(1000))
+    assert head.tolist() == list(range(10))
+    assert column[-1] == 999 and isinstance(column[-1], int)
+    assert column[995:].tolist() == [995, 996, 997, 998, 999]
+
+
+def test_column_retention_keeps_newest_values():
+    column = Column("L", maxlen=100)
+    for start in range(0, 1000, 7):
+        column.extend(range(start, start + 7))
+    column.append(1001)
+
+    assert len(column) == 100
+    assert column.appended == 1002
+    assert column.firstIndex == 902
+    assert column.tolist() == list(range(902, 1002)) and column[0] == 902
+
+    column.extend(range(5000))
+    assert column.tolist() == list(range(4900, 5000))
+    assert column.appended == 6002
+
+
+def test_store_behaves_like_column_list():
+    store = ColumnStore("Lhhh")
+    store.append((1, -1, 2, -3))
+    store.extend((np.arange(2, 5), [4, 5, 6], [7, 8, 9], [10, 11, 12]))
+
+    assert len(store) == 4
+    assert store.length == 4
+    assert [column.typecode for column in store] == ["L", "h", "h", "h"]
+    assert np.array(store).T.tolist() == [[1, -1, 2, -3], [2, 4, 7, 10], [3, 5, 8, 11], [4, 6, 9, 12]]
+    timestamps, x, y, z = store.view(-2)
+    assert timestamps.tolist() == [3, 4] and z.tolist() == [11, 12]
+
+
+
+def test_bounded_buffer_spills_evicted_samples(tmp_path):
+    stream = buildComboStream(100, 64, random.Random(4))
+    reference = Parser()
+    reference.parseStream(stream)
+
+    parser = Parser()
+    parser.dataBuffer = DeviceDataBuffer(maxlen=1000, spill=SpillSink(str(tmp_path)))
+    frameLength = len(stream) // 100
+    for offset in range(0, len(stream), 7 * frameLength):
+        parser.parseStream(stream[offset : offset + 7 * frameLength])
+    parser.dataBuffer.spillEvicted()
+
+    assert parser.dataBuffer.maxLen() == reference.dataBuffer.maxLen() == 6400
+    for key in ("ImuAccRaw", "ImuTemp"):
+        store = parser.dataBuffer.dataDict[key].data
+        assert store.length == 1000
+        spilled = SpillSink.load(str(tmp_path), key)
+        for column, expected in enumerate(reference.dataBuffer.dataDict[key].data):
+            assert np.concatenate((spilled[column], store[column].view())).tolist() == expected.tolist()
@@ -0,0 +1,263 @@
+import random
+import struct
+
+import numpy as np
+
+from x22_fleet.Library.ReceiveBuffer import ReceiveBuffer
+from x22_fleet.Library.dataParser import DeviceDataBuffer, Parser
+from x22_fleet.Testing.ParserBenchmark import (
+    buildComboPayload,
+    buildComboStream,
+    buildComboV3Payload,
+    buildFrame,
+    buildMixedStream,
+    columnLists,
+    loadStreamReceiverParser,
+    referenceComboDecode,
+    referenceEnumDispatch,
+)
+
+
+def test_combo_v2_matches_struct_decoding():
+    rng = random.Random(1)
+    reference = DeviceDataBuffer()
+    stream = bytearray()
+    for packet in range(20):
+        payload = buildComboPayload(packet * 64, 64, rng)
+        referenceComboDecode(reference.dataDict, payload, 6, packet * 64, 64)
+        stream += buildFrame(Parser.DataStreamType.DATA_TYPE_IMU_RAW_COMBO_V2.value, payload)
+
+    parser = Parser()
+    assert parser.parseStream(stream) == len(stream)
+    for key in ("ImuAccRaw", "ImuGyrRaw", "ImuMagRaw", "ImuTemp"):
+        assert columnLists(parser.dataBuffer.dataDict[key].data) == columnLists(reference.dataDict[key].data)
+
+
+def test_combo_v3_counts_missed_samples():
+    streamParser = loadStreamReceiverParser()
+    rng = random.Random(2)
+    stream = bytearray()
+    sampleNumbers = [0, 64, 128, 200, 264]
+    for packet, sampleNumber in enumerate(sampleNumbers):
+        payload = buildComboV3Payload(sampleNumber, 1000 * packet, 64, rng)
+        stream += buildFrame(0x1E, payload)
+
+    parser = streamParser.Parser("dev")
+    assert parser.parseStream(stream) == len(stream)
+    assert parser.missedSamples == 1
+    assert list(parser.dataBuffer.dataDict["TimeSync"].data[1]) == sampleNumbers
+    assert len(parser.dataBuffer.dataDict["ImuAccRaw"].data[0]) == 64 * len(sampleNumbers)
+
+
+def test_garbage_between_frames_is_skipped():
+    clean = Parser()
+    cleanStream = buildComboStream(10, 64, random.Random(3))
+    clean.parseStream(cleanStream)
+
+    # same frames, each followed by an oversized fake header, noise and a frame with a broken CRC
+    frameLength = len(cleanStream) // 10
+    noise = bytes([0x7C, 0x1C, 0xFF, 0x0F]) + bytes(range(200))
+    broken = bytearray(cleanStream[:frameLength])
+    broken[-1] ^= 0xFF
+    corruptedStream = bytearray()
+    for frame in range(10):
+        corruptedStream += cleanStream[frame * frameLength : (frame + 1) * frameLength] + noise + broken
+
+    parser = Parser()
+    assert parser.parseStream(corruptedStream) == len(corruptedStream)
+    assert parser.scanner.crcFailures >= 10
+    assert parser.scanner.oversizedFrames >= 10
+    assert parser.scanner.skippedBytes == 10 * (len(noise) + len(broken))
+    for key in ("ImuAccRaw", "ImuGyrRaw", "ImuMagRaw", "ImuTemp"):
+        assert columnLists(parser.dataBuffer.dataDict[key].data) == columnLists(clean.dataBuffer.dataDict[key].data)
+
+
+def test_dispatch_table_matches_enum_dispatch():
+    for parserClass in (Parser, loadStreamReceiverParser().Parser):
+        for datatype in range(256):
+            enumType = next((t for t in parserClass.DataStreamType if t.value == datatype), None)
+            assert parserClass.dispatch[datatype] is parserClass.parsers.get(enumType)
+
+    stream = buildMixedStream(200, random.Random(5))
+    reference = Parser()
+    referenceEnumDispatch(reference, stream)
+    parser = Parser()
+    assert parser.parseStream(stream) == len(stream)
+    for key in ("Ping", "PingV2", "Battery", "ImuAccRaw"):
+        assert columnLists(parser.dataBuffer.dataDict[key].data) == columnLists(reference.dataBuffer.dataDict[key].data)
+
+
+def test_fragmented_stream_through_receive_buffer():
+    stream = buildComboStream(50, 64, random.Random(6), garbageBytes=17)
+    whole = Parser()
+    whole.parseStream(stream)
+
+    parser = Parser()
+    buffer = ReceiveBuffer(compactThreshold=4096)
+    for offset in range(0, len(stream), 333):
+        buffer.extend(stream[offset : offset + 333])
+        buffer.consume(parser.parseStream(buffer.data, buffer.offset))
+        assert len(buffer.data) < 4096 + 2 * 1292 + 333
+    assert columnLists(parser.dataBuffer.dataDict["ImuAccRaw"].data) == columnLists(whole.dataBuffer.dataDict["ImuAccRaw"].data)
+
+    viewParser = Parser()
+    view = memoryview(bytes(100) + stream)
+    assert viewParser.parseStream(view, 100) == len(view)
+    assert viewParser.scanner.skippedBytes == whole.scanner.skippedBytes
+    assert columnLists(viewParser.dataBuffer.dataDict["ImuAccRaw"].data) == columnLists(whole.dataBuffer.dataDict["ImuAccRaw"].data)
+
+
+def test_iter_batches_yields_new_rows_per_frame():
+    stream = buildMixedStream(100, random.Random(7))
+    parser = Parser()
+    batches = {}
+    for streamName, columns in parser.iter_batches(stream):
+        batches.setdefault(streamName, []).append(columns)
+
+    assert parser.resumeIndex == len(stream)
+    assert len(batches["ImuAccRaw"]) == 10 and len(batches["Ping"]) == 30
+    for streamName, columnBatches in batches.items():
+        stacked = [np.concatenate(column).tolist() for column in zip(*columnBatches)]
+        assert stacked == columnLists(parser.dataBuffer.dataDict[streamName].data)
+
+
+def test_parse_file_carries_frames_across_windows(tmp_path):
+    stream = buildMixedStream(100, random.Random(8)) + buildComboStream(40, 64, random.Random(8), garbageBytes=23)
+    path = tmp_path / "Sensor-1_rec.bd"
+    path.write_bytes(stream)
+    whole = Parser()
+    whole.parseStream(stream)
+
+    # windows of MAX_PACKET_LEN bytes cut through nearly every frame
+    parser = Parser()
+    assert parser.parseFile(str(path), windowSize=1) == len(stream)
+    assert parser.scanner.frames == whole.scanner.frames == 140
+    for key in ("Ping", "Battery", "ImuAccRaw", "ImuGyrRaw", "ImuMagRaw", "ImuTemp"):
+        assert columnLists(parser.dataBuffer.dataDict[key].data) == columnLists(whole.dataBuffer.dataDict[key].data)
+
+    (tmp_path / "empty.bd").write_bytes(b"")
+    assert Parser().parseFile(str(tmp_path / "empty.bd")) == 0
+
+
+def test_type_projection_skips_other_frames():
+    types = Parser.DataStreamType
+    stream = buildMixedStream(200, random.Random(12))
+    whole = Parser()
+    whole.parseStream(stream)
+
+    for skipCrc in (False, True):
+        parser = Parser(types={types.DATA_TYPE_SYS_BATTERY, types.DATA_TYPE_IMU_RAW_COMBO_V2.value}, skipCrc=skipCrc)
+        assert parser.parseStream(stream) == len(stream)
+        for key in ("Battery", "ImuAccRaw", "ImuTemp"):
+            assert columnLists(parser.dataBuffer.dataDict[key].data) == columnLists(whole.dataBuffer.dataDict[key].data)
+        assert len(parser.dataBuffer.dataDict["Ping"].data[0]) == 0
+        counts = parser.frameCounts()
+        assert counts["DATA_TYPE_IMU_RAW_COMBO_V2"] == (20, 0)
+        assert counts["DATA_TYPE_SYS_PING"][0] == 0 and counts["DATA_TYPE_SYS_PING_V2"][0] == 0
+        assert sum(decoded + skipped for decoded, skipped in counts.values()) == 200
+
+    streamParser = loadStreamReceiverParser()
+    v3Only = streamParser.Parser("dev", types={0x1E})
+    v3Stream = buildFrame(0x1E, buildComboV3Payload(0, 0, 64, random.Random(13))) + stream
+    assert v3Only.parseStream(v3Stream) == len(v3Stream)
+    assert len(v3Only.dataBuffer.dataDict["ImuAccRaw"].data[0]) == 64
+    assert v3Only.frameCounts()["DATA_TYPE_IMU_RAW_COMBO_V3"] == (1, 0)
+    assert v3Only.frameCounts()["DATA_TYPE_IMU_RAW_COMBO_V2"] == (0, 20)
+
+
+def test_data_callback_gets_one_summary_per_parse_call():
+    types = Parser.DataStreamType
+    stream = buildMixedStream(100, random.Random(14))
+    parser = Parser()
+    summaries = []
+    batteryFrames = []
+    parser.setDataCallBack(summaries.append)
+    parser.subscribe(types.DATA_TYPE_SYS_BATTERY, lambda datatype, deviceName: batteryFrames.append(datatype))
+
+    half = len(stream) // 2
+    resumeIndex = parser.parseStream(stream[:half])
+    parser.parseStream(stream[resumeIndex:])
+    parser.parseStream(b"")
+
+    assert len(summaries) == 2
+    assert sum(summary.frames.get(types.DATA_TYPE_IMU_RAW_COMBO_V2.value, 0) for summary in summaries) == 10
+    assert types.DATA_TYPE_SYS_PING in summaries[0]
+    assert batteryFrames == [types.DATA_TYPE_SYS_BATTERY.value] * 30
+    first, second = (summary.ranges["ImuAccRaw"] for summary in summaries)
+    assert first[0] == 0 and first[1] == second[0] and second[1] == 640
+    assert summaries[1].samples["ImuAccRaw"] == second[1] - second[0]
+    rows = summaries[1].rows(parser.dataBuffer, "ImuAccRaw")
+    assert [column.tolist() for column in rows] == [column[second[0] :] for column in columnLists(parser.dataBuffer.dataDict["ImuAccRaw"].data)]
+
+
+def test_system_telemetry_is_stored_in_column_tables():
+    types = Parser.DataStreamType
+    stream = (
+        buildFrame(types.DATA_TYPE_SYS_RESOURCES.value, struct.pack("BBIIIIB", 12, 80, 1000, 2000, 3000, 4000, 7))
+        + buildFrame(types.DATA_TYPE_SYS_TASK_STATS.value, b"imuTask".ljust(16, b"\x00") + struct.pack("fHHHHH", 500.0, 64, 1300, 1280, 0, 812))
+        + buildFrame(types.DATA_TYPE_SYS_TASK_STATS.value, b"sdTask".ljust(16, b"\x00") + struct.pack("fHHHHH", 2.0, 0, 0, 0, 1, 640))
+        + buildFrame(types.DATA_TYPE_SYS_TASK_STATS.value, b"imuTask".ljust(16, b"\x00") + struct.pack("fHHHHH", 499.5, 64, 1300, 1280, 0, 800))
+        + buildFrame(types.DATA_TYPE_IMU_CONFIG.value, struct.pack("I", 0x00120224))
+        + buildFrame(types.DATA_TYPE_BAR_CONFIG.value, struct.pack("I", 5))
+        + buildFrame(types.DATA_TYPE_SYS_TIME.value, struct.pack("q", 1_700_000_000_000))
+    )
+    parser = Parser()
+    parser.parseStream(stream)
+    dataBuffer = parser.dataBuffer
+    assert columnLists(dataBuffer.dataDict["Resources"].data) == [[0], [12], [80], [1000], [2000], [3000], [4000], [7]]
+    assert dataBuffer.taskNames == ["imuTask", "sdTask"]
+    taskStats = dataBuffer.dataDict["TaskStats"].data
+    assert taskStats[0].tolist() == [1, 2, 3] and taskStats[1].tolist() == [0, 1, 0]
+    assert taskStats[2].tolist() == [500.0, 2.0, 499.5] and taskStats[7].tolist() == [812, 640, 800]
+    assert columnLists(dataBuffer.dataDict["ImuConfig"].data) == [[4], [0], [0x200], [0x20000], [0x100000]]
+    assert columnLists(dataBuffer.dataDict["BarConfig"].data) == [[5], [5]]
+    assert columnLists(dataBuffer.dataDict["SysTime"].data) == [[6], [1_700_000_000_000]]
+
+    streamParser = loadStreamReceiverParser().Parser("dev")
+    streamParser.parseStream(buildFrame(types.DATA_TYPE_IMU_CONFIG.value, struct.pack("I", 0x00120224)))
+    assert columnLists(streamParser.dataBuffer.dataDict["ImuConfig"].data) == [[0], [0], [0x200], [0x20000], [0x100000]]
+
+
+def test_stream_parser_delivers_system_frames_to_subscribers():
+    module = loadStreamReceiverParser()
+    types = module.Parser.DataStreamType
+    stream = (
+        buildFrame(types.DATA_TYPE_DEVICE_NAME.value, b"0D_17_56\x00\x00")
+        + buildFrame(types.DATA_TYPE_SYS_BATTERY.value, struct.pack("IhHB", 1000, -120, 3900, 87))
+        + buildFrame(types.DATA_TYPE_SYS_PING_V2.value, struct.pack("<IQQQ", 2000, 123456, 1_700_000_000_000_000, 0))
+    )
+    warnings = []
+    module.trace.warn = lambda category, message, count=1: warnings.append((category, message))
+    parser = module.Parser()
+    summaries, delivered = [], []
+    parser.setDataCallBack(summaries.append)
+    for datatype in (types.DATA_TYPE_DEVICE_NAME, types.DATA_TYPE_SYS_BATTERY, types.DATA_TYPE_SYS_PING_V2):
+        parser.subscribe(datatype, lambda datatype, deviceName: delivered.append((datatype, deviceName)))
+
+    assert parser.parseStream(stream) == len(stream)
+    assert not [warning for warning in warnings if warning[0] == "decode"]
+    assert delivered == [
+        (types.DATA_TYPE_DEVICE_NAME.value, "0D_17_56"),
+        (types.DATA_TYPE_SYS_BATTERY.value, "0D_17_56"),
+        (types.DATA_TYPE_SYS_PING_V2.value, "0D_17_56"),
+    ]
+    assert len(summaries) == 1 and types.DATA_TYPE_SYS_BATTERY in summaries[0] and types.DATA_TYPE_SYS_PING_V2 in summaries[0]
+    assert columnLists(parser.dataBuffer.dataDict["Battery"].data) == [[1000], [-120], [3900], [87]]
+    assert columnLists(parser.dataBuffer.dataDict["PingV2"].data) == [[2000], [123456], [1_700_000_000_000_000]]
+
+
+def test_stream_parser_decodes_imu_config():
+    module = loadStreamReceiverParser()
+    types = module.Parser.DataStreamType
+    warnings = []
+    module.trace.warn = lambda category, message, count=1: warnings.append((category, message))
+    parser = module.Parser("dev")
+    delivered = []
+    parser.subscribe(types.DATA_TYPE_IMU_CONFIG, lambda datatype, deviceName: delivered.append((datatype, deviceName)))
+
+    stream = buildFrame(types.DATA_TYPE_IMU_CONFIG.value, struct.pack("<I", 0x00120224))
+    assert parser.parseStream(stream) == len(stream)
+    assert columnLists(parser.dataBuffer.dataDict["ImuConfig"].data) == [[0], [0], [0x200], [0x20000], [0x100000]]
+    assert warnings == []
+    assert delivered == [(types.DATA_TYPE_IMU_CONFIG.value, "dev")]
+    assert parser.frameCounts() == {"DATA_TYPE_IMU_CONFIG": (1, 0)}
@@ -0,0 +1,83 @@
+import random
+
+import numpy as np
+
+from x22_fleet.Library.ColumnStore import ColumnStore
+from x22_fleet.Library.Decimation import DecimationPyramid, minMaxDecimate
+from x22_fleet.Library.dataParser import Parser
+from x22_fleet.Testing.ParserBenchmark import buildComboStream
+
+
+def referenceBuckets(values, first, stop, factor):
+    """min / max / mean of the factor-aligned buckets of running rows [first, stop), computed in one go."""
+    buckets = values[first // factor * factor : stop // factor * factor].reshape(-1, factor, values.shape[1])
+    return buckets.min(axis=1), buckets.max(axis=1), buckets.mean(axis=1)
+
+
+def test_levels_built_incrementally_match_one_pass():
+    rng = np.random.default_rng(23)
+    values = rng.integers(-30000, 30000, size=(123_457, 3), dtype=np.int16)
+    store = ColumnStore("Lhhh")
+    pyramid = DecimationPyramid(store)
+    appended = 0
+    while appended < len(values):
+        count = int(rng.integers(1, 3000))
+        chunk = values[appended : appended + count]
+        store.extend([np.arange(appended, appended + len(chunk))] + list(chunk.T))
+        appended += len(chunk)
+        if rng.random() < 0.3:
+            pyramid.update()
+
+    for factor in (10, 100, 1000):
+        factor, x, minimum, maximum, mean = pyramid.rowRange(0, len(values), len(values) // factor)
+        expected = referenceBuckets(values, 0, len(values), factor)
+        complete = len(expected[0])
+        assert np.array_equal(x[:complete], np.arange(0, complete * factor, factor))
+        assert np.array_equal(minimum[:complete], expected[0]) and np.array_equal(maximum[:complete], expected[1])
+        assert np.allclose(mean[:complete], expected[2], atol=1e-2)
+        # the newest rows come from the finer levels, up to the last raw row
+        assert x[-1] == len(values) - 1 and np.array_equal(minimum[-1], values[-1])
+        assert minimum[complete:].min(axis=0).tolist() == values[complete * factor :].min(axis=0).tolist()
+
+
+def test_query_picks_level_for_width():
+    stream = buildComboStream(800, 64, random.Random(23))
+    parser = Parser()
+    parser.parseStream(stream)
+    pyramid = parser.dataBuffer.pyramids["ImuAccRaw"]
+    sampleNumbers = parser.dataBuffer.dataDict["ImuAccRaw"].data[0].view()
+
+    factor, x, minimum, maximum, mean = pyramid.query(sampleNumbers[0], sampleNumbers[-1], 1000)
+    assert factor == 100 and len(x) <= 1000 + 20
+    # x is the first sample number of each bucket, 51200 samples fill exactly 512 buckets
+    assert x[0] == sampleNumbers[0] and x[-1] == sampleNumbers[-100]
+    assert np.all(minimum <= mean + 1e-3) and np.all(mean <= maximum + 1e-3)
+
+    start = sampleNumbers[5000]
+    factor, x, _, _, _ = pyramid.query(start, start + 799, 1000)
+    assert factor == 1 and np.array_equal(x, sampleNumbers[5000:5800])
+    assert pyramid.tail(20_000, 500)[0] == 100
+    assert parser.dataBuffer.pyramids["ImuAccRaw"] is pyramid
+
+
+def test_bounded_store_and_array_decimation():
+    store = ColumnStore("Lhhh", maxlen=5000)
+    pyramid = DecimationPyramid(store)
+    values = np.arange(40_000) % 1000
+    for start in range(0, 20_000, 700):
+        store.extend([np.arange(start, start + 700)] + [values[start : start + 700]] * 3)
+        pyramid.update()
+    # only the 5000 retained rows can be queried, 5 buckets of 1000
+    factor, x, minimum, maximum, _ = pyramid.tail(5000, 10)
+    assert factor == 1000 and x[0] == store[0].view()[0] // 1000 * 1000
+    assert maximum.max() == 999 and minimum.min() == 0
+
+    # more rows than the window between two updates: the levels restart behind the gap
+    store.extend([np.arange(20_300, 40_000)] + [values[20_300:]] * 3)
+    factor, x, minimum, _, _ = pyramid.tail(5000, 50)
+    assert factor == 100 and x[0] == 35_000 and x[-1] == 39_900
+
+    series = np.sin(np.linspace(0, 20, 100_000))
+    x, y = minMaxDecimate(np.arange(len(series)), series, 1000)
+    assert len(y) <= 2000 and np.all(np.diff(x) > 0)
+    assert y.max() == series.max() and y.min() == series.min()
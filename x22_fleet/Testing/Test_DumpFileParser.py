@@ -0,0 +1,27 @@
+import random
+
+import numpy as np
+
+from x22_fleet.Library.DumpFileParser import DumpFileParser
+from x22_fleet.Testing.ParserBenchmark import buildComboStream
+
+
+def test_parallel_parse_matches_sequential(tmp_path):
+    for index in range(3):
+        session = tmp_path / f"session{index}"
+        session.mkdir()
+        stream = buildComboStream(20 + 10 * index, 64, random.Random(index))
+        (session / f"SensorW_{index}-{1700000000 + index}_rec.bd.uploaded").write_bytes(stream)
+
+    dumpParser = DumpFileParser(raw_data_dir=str(tmp_path))
+    sequential = dumpParser.find_and_parse_files()
+    sequentialFiles = [filename for filename, _ in dumpParser.file_timings]
+    parallel = dumpParser.find_and_parse_files(workers=2)
+
+    assert [filename for filename, _ in dumpParser.file_timings] == sequentialFiles
+    assert [deviceName for deviceName, _ in parallel] == [deviceName for deviceName, _ in sequential]
+    for (_, expected), (_, data) in zip(sequential, parallel):
+        assert len(data["x_vals"]) > 0
+        for key, values in expected.items():
+            assert isinstance(data[key], np.ndarray)
+            assert np.array_equal(data[key], values)
@@ -0,0 +1,69 @@
+import os
+import random
+
+import numpy as np
+
+from x22_fleet.Library.FrameIndex import FrameIndex
+from x22_fleet.Library.dataParser import Parser
+from x22_fleet.Testing.ParserBenchmark import buildComboStream, buildMixedStream, columnLists
+
+
+def writeDump(tmp_path):
+    path = tmp_path / "Sensor-1_rec.bd"
+    path.write_bytes(buildMixedStream(100, random.Random(9)) + buildComboStream(40, 64, random.Random(9), garbageBytes=23))
+    return str(path)
+
+
+def test_decoding_all_indexed_frames_matches_parse_file(tmp_path):
+    path = writeDump(tmp_path)
+    whole = Parser()
+    whole.parseFile(path)
+
+    index = FrameIndex.open(path, Parser())
+    assert len(index) == whole.scanner.frames == 140
+    assert os.path.exists(path + ".idx")
+    loaded = FrameIndex.load(path + ".idx")
+    assert np.array_equal(loaded.frames, index.frames)
+
+    parser = Parser()
+    FrameIndex.decode(path, parser, loaded.frames)
+    for key in ("Ping", "PingV2", "Battery", "ImuAccRaw", "ImuMagRaw", "ImuTemp"):
+        assert columnLists(parser.dataBuffer.dataDict[key].data) == columnLists(whole.dataBuffer.dataDict[key].data)
+
+
+def test_range_decodes_only_covering_frames(tmp_path):
+    # sample numbers must increase through the file for a range to be contiguous
+    path = str(tmp_path / "Sensor-2_rec.bd")
+    with open(path, "wb") as file:
+        file.write(buildMixedStream(400, random.Random(11), comboEvery=4))
+    whole = Parser()
+    whole.parseFile(path)
+    sampleNumbers = np.asarray(whole.dataBuffer.dataDict["ImuAccRaw"].data[0].view())
+    start, stop = int(sampleNumbers[300]), int(sampleNumbers[900])
+
+    parser = Parser()
+    decodedFrames = parser.parseFileRange(path, samples=(start, stop))
+    assert decodedFrames < whole.scanner.frames
+    decoded = parser.dataBuffer.dataDict["ImuAccRaw"].data[0].tolist()
+    assert decoded[0] <= start and decoded[-1] >= stop - 1
+    assert len(decoded) <= stop - start + 2 * 64
+
+    firstSample = int(sampleNumbers.min())
+    seconds = Parser()
+    seconds.parseFileRange(path, seconds=((start - firstSample) / 500, (stop - firstSample) / 500))
+    assert seconds.dataBuffer.dataDict["ImuAccRaw"].data[0].tolist() == decoded
+
+    battery = Parser()
+    battery.parseFileRange(path, types={Parser.DataStreamType.DATA_TYPE_SYS_BATTERY.value})
+    assert columnLists(battery.dataBuffer.dataDict["Battery"].data) == columnLists(whole.dataBuffer.dataDict["Battery"].data)
+    assert len(battery.dataBuffer.dataDict["ImuAccRaw"].data[0]) == 0
+
+
+def test_stale_sidecar_is_rebuilt(tmp_path):
+    path = writeDump(tmp_path)
+    assert len(FrameIndex.open(path, Parser())) == 140
+
+    with open(path, "ab") as file:
+        file.write(buildComboStream(5, 64, random.Random(10)))
+    assert len(FrameIndex.open(path, Parser())) == 145
+    assert len(FrameIndex.load(path + ".idx")) == 145
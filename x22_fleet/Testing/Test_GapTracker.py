@@ -0,0 +1,74 @@
+import random
+
+from x22_fleet.Library.FrameIndex import FrameIndex
+from x22_fleet.Library.GapTracker import GapTracker
+from x22_fleet.Library.dataParser import Parser
+from x22_fleet.Testing.ParserBenchmark import buildComboPayload, buildComboV3Payload, buildFrame, loadStreamReceiverParser
+
+
+def referenceCounts(packets):
+    seen = set()
+    duplicates = 0
+    for first, count in packets:
+        for sampleNumber in range(first, first + count):
+            duplicates += sampleNumber in seen
+            seen.add(sampleNumber)
+    missing = max(seen) + 1 - min(seen) - len(seen) if seen else 0
+    return len(seen), missing, duplicates
+
+
+def test_gaps_duplicates_and_late_packets():
+    tracker = GapTracker()
+    assert not tracker.add(0, 64)
+    assert not tracker.add(64, 64)
+    assert tracker.add(200, 64)  # 128..199 lost
+    assert tracker.add(128, 32)  # late, fills part of the gap
+    assert tracker.add(0, 10)  # repeated
+    assert tracker.intervals == [(0, 160), (200, 264)]
+    assert tracker.gaps() == [(160, 200)]
+    assert tracker.missingSamples == 40
+    assert tracker.duplicateSamples == 10
+    assert tracker.outOfOrderPackets == 2
+    assert GapTracker.fromIntervals(tracker.asArray()).intervals == tracker.intervals
+
+
+def test_incremental_and_batch_agree():
+    rng = random.Random(15)
+    for _ in range(200):
+        packets = [(rng.randrange(0, 500), rng.randrange(0, 40)) for _ in range(rng.randrange(1, 50))]
+        tracker = GapTracker()
+        for first, count in packets:
+            tracker.add(first, count)
+        batch = GapTracker.fromPackets([first for first, _ in packets], [count for _, count in packets])
+
+        received, missing, duplicates = referenceCounts(packets)
+        assert sum(stop - start for start, stop in tracker.intervals) == received
+        assert tracker.missingSamples == batch.missingSamples == missing
+        assert tracker.duplicateSamples == batch.duplicateSamples == duplicates
+        assert tracker.intervals == batch.intervals
+        assert tracker.outOfOrderPackets == batch.outOfOrderPackets
+
+
+def test_parsers_and_frame_index_track_combo_packets(tmp_path):
+    rng = random.Random(16)
+    sampleNumbers = [0, 64, 192, 128, 256, 256]
+    v2 = bytearray()
+    v3 = bytearray()
+    for packet, sampleNumber in enumerate(sampleNumbers):
+        v2 += buildFrame(Parser.DataStreamType.DATA_TYPE_IMU_RAW_COMBO_V2.value, buildComboPayload(sampleNumber, 64, rng))
+        v3 += buildFrame(0x1E, buildComboV3Payload(sampleNumber, 1000 * packet, 64, rng))
+
+    parser = Parser()
+    parser.parseStream(v2)
+    streamParser = loadStreamReceiverParser().Parser("dev")
+    streamParser.parseStream(v3)
+    path = tmp_path / "Sensor-3_rec.bd"
+    path.write_bytes(bytes(v2))
+    indexed = FrameIndex.open(str(path), Parser(), save=False).gaps()
+
+    for tracker in (parser.gaps, streamParser.gaps, indexed):
+        assert tracker.intervals == [(0, 320)]
+        assert tracker.missingSamples == 0
+        assert tracker.duplicateSamples == 64
+        assert tracker.outOfOrderPackets == 2
+    assert streamParser.missedSamples == 4
@@ -0,0 +1,101 @@
+import math
+import random
+import struct
+
+import numpy as np
+
+from x22_fleet.Library.GattStore import EVENT_TIME_SCALE
+from x22_fleet.Library.dataParser import Parser
+
+
+def powerRecord(rng, flags):
+    """Cycling power measurement with random values for the fields ``flags`` announces, and the expected decode."""
+    record = struct.pack("<Hh", flags, rng.randrange(-500, 2000))
+    expected = {"InstantaneousPower": struct.unpack_from("<h", record, 2)[0]}
+    if flags & 1 << 0:
+        balance = rng.randrange(256)
+        record += struct.pack("<B", balance)
+        expected["PedalPowerBalance"] = balance / 2
+    if flags & 1 << 2:
+        torque = rng.randrange(1 << 16)
+        record += struct.pack("<H", torque)
+        expected["AccumulatedTorque"] = torque / 32
+    if flags & 1 << 4:
+        revolutions, eventTime = rng.randrange(1 << 32), rng.randrange(1 << 16)
+        record += struct.pack("<IH", revolutions, eventTime)
+        expected["WheelRevolutions"] = revolutions
+        expected["WheelEventTime"] = eventTime * EVENT_TIME_SCALE
+    if flags & 1 << 5:
+        revolutions, eventTime = rng.randrange(1 << 16), rng.randrange(1 << 16)
+        record += struct.pack("<HH", revolutions, eventTime)
+        expected["CrankRevolutions"] = revolutions
+        expected["CrankEventTime"] = eventTime * EVENT_TIME_SCALE
+    if flags & 1 << 6:
+        record += struct.pack("<hh", 900, -300)
+        expected["MaxForce"], expected["MinForce"] = 900, -300
+    if flags & 1 << 7:
+        record += struct.pack("<hh", 50, -20)
+        expected["MaxTorque"], expected["MinTorque"] = 50, -20
+    if flags & 1 << 8:
+        record += b"\x12\x34\x56"
+    if flags & 1 << 11:
+        energy = rng.randrange(-1000, 1000)
+        record += struct.pack("<h", energy)
+        expected["AccumulatedEnergy"] = energy
+    return record, expected
+
+
+def test_cycling_power_single_and_batch_agree():
+    rng = random.Random(20)
+    records = [powerRecord(rng, rng.choice((0x0000, 0x0031, 0x0915, 0x1FFF & ~0x0600, 0x01C4))) for _ in range(300)]
+
+    single = Parser()
+    for timestamp, (record, _) in enumerate(records):
+        single.parseGatt("2a63", record, timestamp)
+    batch = Parser()
+    batch.parseGattMany("2a63", [record for record, _ in records], range(len(records)))
+
+    for parser in (single, batch):
+        table = parser.dataBuffer.dataDict["gatt"]["CyclingPowerMeasurement"]
+        assert table.length == len(records)
+        assert np.array_equal(table["WallTime"], np.arange(len(records)))
+        for name in ("InstantaneousPower", "PedalPowerBalance", "AccumulatedTorque", "WheelEventTime", "CrankRevolutions", "MinTorque", "AccumulatedEnergy"):
+            expected = np.array([values.get(name, math.nan) for _, values in records])
+            assert np.allclose(table[name], expected, equal_nan=True), name
+            assert np.array_equal(table.present(name), ~np.isnan(expected))
+        assert np.array_equal(table["OffsetCompensationIndicator"], [bool(struct.unpack_from("<H", record)[0] & 1 << 12) for record, _ in records])
+    assert single.dataBuffer.dataDict["gatt"]["CyclingPowerMeasurement"].tolist() == batch.dataBuffer.dataDict["gatt"]["CyclingPowerMeasurement"].tolist()
+
+
+def test_heart_rate_formats_and_truncated_records():
+    logged = []
+    parser = Parser(logf=logged.append)
+    records = [
+        struct.pack("<BB", 0x06, 72),
+        struct.pack("<BHHHH", 0x19, 300, 12, 820, 790),  # 16 bit value, energy, two RR intervals
+        struct.pack("<B", 0x01),  # announces a 16 bit value but ends after the flags
+        b"",
+        struct.pack("<BBH", 0x10, 80, 750),
+    ]
+    parser.parseGattMany("2a37", records, [10, 11, 12, 13, 14])
+    table = parser.dataBuffer.dataDict["gatt"]["HeartRate"]
+    assert table.truncated == 2 and len(logged) == 1
+    assert table["WallTime"].tolist() == [10, 11, 14]
+    assert table["HeartRate"].tolist() == [72, 300, 80]
+    assert np.array_equal(table["RRInterval"], [math.nan, 820, 750], equal_nan=True)
+    assert table.masked("EnergyExpended").tolist() == [None, 12, None]
+    assert table["SensorContact"].tolist() == [True, False, False]
+
+    parser.parseGatt("2a37", struct.pack("<B", 0x01), 15)
+    assert table.truncated == 3 and len(logged) == 2 and table.length == 3
+
+
+def test_speed_cadence_rows():
+    parser = Parser()
+    parser.parseGatt("2a5b", struct.pack("<BIHHH", 0x03, 1234, 1024, 56, 2048), 1)
+    parser.parseGatt("2a5b", struct.pack("<BHH", 0x02, 57, 3072), 2)
+    table = parser.dataBuffer.dataDict["gatt"]["CyclingSpeedCadence"]
+    assert table.tolist() == [
+        [1.0, 3, 1234.0, 1e6, 56.0, 2e6],
+        [2.0, 2, None, None, 57.0, 3e6],
+    ]
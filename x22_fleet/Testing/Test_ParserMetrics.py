@@ -0,0 +1,50 @@
+import random
+import urllib.request
+
+from x22_fleet.Library.ParserMetrics import MetricsRegistry, serveMetrics
+from x22_fleet.Library.dataParser import Parser
+from x22_fleet.Testing.ParserBenchmark import buildComboStream, buildMixedStream
+
+
+def test_registry_renders_parser_counters():
+    parser = Parser(types={Parser.DataStreamType.DATA_TYPE_IMU_RAW_COMBO_V2})
+    stream = buildMixedStream(100, random.Random(16)) + buildComboStream(5, 64, random.Random(16), garbageBytes=40)
+    parser.parseStream(stream)
+    parser.parseStream(b"")
+
+    parsers = {"X22_0D_16_1E": parser}
+    registry = MetricsRegistry()
+    registry.addParsers(parsers, receiver="test")
+    registry.addCollector(lambda: ("x22_bridge_samples", "Samples decoded per sensor", [({"sensor": "a"}, 64)]))
+    lines = registry.render().splitlines()
+
+    labels = 'receiver="test",sensor="X22_0D_16_1E"'
+    assert f'x22_parser_frames_total{{{labels},type="imu_raw_combo_v2",result="decoded"}} 15' in lines
+    assert f'x22_parser_frames_total{{{labels},type="sys_battery",result="skipped"}} 30' in lines
+    assert f"x22_parser_bytes_total{{{labels}}} {len(stream)}" in lines
+    assert f"x22_parser_resync_bytes_total{{{labels}}} {parser.scanner.skippedBytes}" in lines
+    assert f'x22_parser_decode_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f"x22_parser_decode_seconds_count{{{labels}}} 2" in lines
+    assert lines.count("# TYPE x22_parser_frames_total counter") == 1
+    assert 'x22_bridge_samples{sensor="a"} 64' in lines
+
+    # parsers added to the live dict later are exported as well
+    parsers["other"] = Parser()
+    assert 'sensor="other"' in registry.render()
+
+
+def test_metrics_endpoint_serves_registry():
+    registry = MetricsRegistry()
+    parser = Parser()
+    parser.parseStream(buildComboStream(2, 64, random.Random(17)))
+    registry.addParsers({"dev": parser})
+    server = serveMetrics(port=0, metricsRegistry=registry)
+    try:
+        host, port = server.server_address
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5) as response:
+            body = response.read().decode("utf-8")
+        assert response.headers["Content-Type"].startswith("text/plain")
+        assert body == registry.render()
+    finally:
+        server.shutdown()
+        server.server_close()
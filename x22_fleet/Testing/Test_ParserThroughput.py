@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+
+import pytest
+
+from x22_fleet.Library.DumpFileParser import DumpFileParser
+from x22_fleet.Library.ReceiveBuffer import ReceiveBuffer
+from x22_fleet.Testing.BenchmarkCorpus import cleanStream, corruptedStream, fragment, measure, mixedStream, referenceDecode
+from x22_fleet.Testing.ParserBenchmark import loadStreamReceiverParser
+
+# Throughput benchmarks, skipped unless X22_BENCHMARK is set:
+#   X22_BENCHMARK=1 python -m pytest x22_fleet/Testing/Test_ParserThroughput.py
+# X22_BENCHMARK_UPDATE=1 stores the results as the new baseline instead of comparing,
+# X22_BENCHMARK_TOLERANCE (default 0.3) is the allowed relative regression.
+# Throughput is stored as a multiple of referenceDecode measured along with it,
+# so the baseline holds on other machines; peak memory is stored in MiB.
+pytestmark = pytest.mark.skipif(not os.environ.get("X22_BENCHMARK"), reason="set X22_BENCHMARK=1 to run the benchmarks")
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ParserThroughputBaseline.json")
+PACKETS = 1500
+# short enough to measure before every benchmark
+REFERENCE_PACKETS = 300
+CRC_CORRUPTION_PERCENT = 5
+
+logger = logging.getLogger("ParserThroughput")
+
+CORPORA = {
+    "clean": lambda version: cleanStream(PACKETS, version),
+    "crc5": lambda version: corruptedStream(PACKETS, CRC_CORRUPTION_PERCENT, version=version),
+    "mixed": lambda version: mixedStream(PACKETS, version=version),
+}
+
+
+def decodedSamples(parser):
+    return parser.dataBuffer.dataDict["ImuAccRaw"].data.appended
+
+
+def feedMessages(parser, messages):
+    receiveBuffer = ReceiveBuffer()
+    for message in messages:
+        receiveBuffer.extend(message)
+        receiveBuffer.consume(parser.parseStream(receiveBuffer.data, receiveBuffer.offset))
+
+
+def checkBaseline(name, result):
+    reference = referenceDecode(REFERENCE_PACKETS)
+    logger.info(
+        "%-28s %8.2f MB/s %12.0f samples/s %8.2f MiB peak", name, result["mb_per_s"], result["samples_per_s"], result["peak_mib"]
+    )
+    result = {
+        "mb_per_s_ratio": result["mb_per_s"] / reference["mb_per_s"],
+        "samples_per_s_ratio": result["samples_per_s"] / reference["samples_per_s"],
+        "peak_mib": result["peak_mib"],
+    }
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as file:
+            baseline = json.load(file)
+    if os.environ.get("X22_BENCHMARK_UPDATE"):
+        baseline[name] = {key: round(value, 3) for key, value in result.items()}
+        with open(BASELINE_PATH, "w") as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+            file.write("\n")
+        return
+    if name not in baseline:
+        pytest.skip(f"no baseline for {name}, run with X22_BENCHMARK_UPDATE=1")
+
+    tolerance = float(os.environ.get("X22_BENCHMARK_TOLERANCE", "0.3"))
+    expected = baseline[name]
+    assert result["mb_per_s_ratio"] >= expected["mb_per_s_ratio"] * (1 - tolerance), f"{name} throughput regressed: {result} vs {expected}"
+    assert result["samples_per_s_ratio"] >= expected["samples_per_s_ratio"] * (1 - tolerance), f"{name} sample rate regressed: {result} vs {expected}"
+    # small absolute slack, peaks of a few MiB vary with allocator state
+    assert result["peak_mib"] <= expected["peak_mib"] * (1 + tolerance) + 1, f"{name} peak memory regressed: {result} vs {expected}"
+
+
+@pytest.mark.parametrize("corpus", ["clean", "crc5", "mixed", "fragmented"])
+def test_stream_parser(corpus):
+    streamParser = loadStreamReceiverParser()
+    stream = CORPORA.get(corpus, CORPORA["clean"])(3)
+
+    def run():
+        parser = streamParser.Parser("bench")
+        if corpus == "fragmented":
+            feedMessages(parser, fragment(stream))
+        else:
+            parser.parseStream(stream)
+        return decodedSamples(parser)
+
+    checkBaseline(f"stream_parser/{corpus}", measure(run, len(stream)))
+
+
+@pytest.mark.parametrize("corpus", ["clean", "crc5", "mixed", "fragmented"])
+def test_mqtt_bridge(corpus):
+    bridge = pytest.importorskip("x22_fleet.integrate_stream_receiver.KafkaBridge")
+    stream = CORPORA.get(corpus, CORPORA["clean"])(3)
+    messages = fragment(stream) if corpus == "fragmented" else [stream]
+
+    def run():
+        parser = bridge.MQTTDataParser()
+        receiveBuffer = ReceiveBuffer()
+        samples = 0
+        for message in messages:
+            receiveBuffer.extend(message)
+            samples += sum(len(result["samples"]) for result in parser.parse_from_buffer(receiveBuffer, "bench"))
+        # packets still held behind a lost one (crc5) are released at the end of the stream
+        return samples + sum(len(result["samples"]) for result in parser.release_held("bench", flush=True))
+
+    checkBaseline(f"mqtt_bridge/{corpus}", measure(run, len(stream), repeat=1))
+
+
+@pytest.mark.parametrize("corpus", ["clean", "crc5", "mixed"])
+def test_dump_file_parser(corpus, tmp_path):
+    stream = CORPORA[corpus](2)
+    path = tmp_path / "X22_BE_NC_H0-1700000000_rec.bd.uploaded"
+    path.write_bytes(stream)
+    dumpFileParser = DumpFileParser()
+
+    def run():
+        return len(dumpFileParser.parse_file_to_memory("bench", 0, str(path))["x_vals"])
+
+    checkBaseline(f"dump_file_parser/{corpus}", measure(run, len(stream)))
@@ -0,0 +1,45 @@
+import random
+import struct
+
+import numpy as np
+
+from x22_fleet.Library.ColumnStore import ColumnStore
+from x22_fleet.Library.PhysicalUnits import PhysicalUnits, UnitView
+from x22_fleet.Library.dataParser import Parser
+from x22_fleet.Testing.ParserBenchmark import buildComboStream, buildFrame
+
+
+def test_units_follow_imu_config():
+    stream = buildComboStream(20, 64, random.Random(18))
+    parser = Parser()
+    parser.parseStream(stream)
+    raw = np.column_stack(parser.dataBuffer.dataDict["ImuAccRaw"].data.view()[1:4])
+
+    acc = parser.units["acc"]
+    assert acc.dtype == np.float32 and acc.shape == raw.shape
+    assert np.allclose(acc, raw * 0.488 / 1000, rtol=1e-6)
+    assert parser.units["acc"] is not acc and np.shares_memory(parser.units["acc"], acc)
+
+    # 4 g / 500 dps / 4 gauss
+    parser.parseStream(buildFrame(Parser.DataStreamType.DATA_TYPE_IMU_CONFIG.value, struct.pack("<I", 0x00120224)))
+    assert np.allclose(parser.units["acc"], raw * 0.122 / 1000, rtol=1e-6)
+    assert np.allclose(parser.units["gyr"][:, 2], parser.dataBuffer.dataDict["ImuGyrRaw"].data[3].view() * 17.5 / 1000, rtol=1e-6)
+    assert np.allclose(parser.units["mag"][:, 0], parser.dataBuffer.dataDict["ImuMagRaw"].data[1].view() / 6842, rtol=1e-6)
+    temp = parser.dataBuffer.dataDict["ImuTemp"].data[1].view()
+    assert np.allclose(parser.units["temp"][:, 0], temp / 256 + 25)
+
+
+def test_view_converts_only_new_rows_and_drops_evicted():
+    store = ColumnStore("Lhhh", maxlen=100)
+    view = UnitView()
+    store.extend([np.arange(60), np.arange(60), -np.arange(60), np.zeros(60)])
+    first = view.array(store, 0.5)
+    assert np.array_equal(first[:, 0], np.arange(60) * 0.5)
+
+    store.extend([np.arange(60, 130), np.arange(60, 130), -np.arange(60, 130), np.zeros(70)])
+    converted = view.array(store, 0.5)
+    assert np.array_equal(converted[:, 1], -np.arange(30, 130) * 0.5)
+    assert np.array_equal(first[:, 0], np.arange(60) * 0.5)
+
+    store.extend([np.arange(130, 400)] * 4)
+    assert np.array_equal(view.array(store, 2.0)[:, 0], np.arange(300, 400) * 2.0)
@@ -0,0 +1,112 @@
+import random
+
+import numpy as np
+
+from x22_fleet.Library.ReorderBuffer import ReorderBuffer
+from x22_fleet.Testing.ParserBenchmark import buildComboV3Payload, buildFrame, loadStreamReceiverParser
+
+
+def firsts(released):
+    return [first for first, _, _ in released]
+
+
+def test_reordered_and_duplicate_packets_come_out_in_order():
+    reorder = ReorderBuffer(maxDelay=1.0)
+    assert firsts(reorder.push(0, 10, "a", now=0.0)) == [0]
+    assert reorder.push(20, 10, "c", now=0.1) == []
+    assert reorder.push(20, 10, "c", now=0.2) == []
+    assert reorder.push(0, 10, "a", now=0.3) == []
+    assert reorder.push(10, 10, "b", now=0.4) == [(10, 10, "b"), (20, 10, "c")]
+    assert reorder.duplicatePackets == 2 and reorder.reorderedPackets == 1
+    assert reorder.lostSamples == 0 and reorder.pendingPackets == 0
+
+
+def test_gap_is_given_up_after_delay_or_packet_limit():
+    reorder = ReorderBuffer(maxDelay=0.5, maxPackets=3)
+    reorder.push(0, 10, None, now=0.0)
+    assert reorder.push(20, 10, None, now=1.0) == []
+    # the gap at 10 has been open for 0.5 s
+    assert firsts(reorder.push(30, 10, None, now=1.5)) == [20, 30]
+    assert reorder.lostSamples == 10
+    # the missing packet shows up after all
+    assert reorder.push(10, 10, None, now=1.6) == [] and reorder.latePackets == 1
+
+    for first in (50, 60, 70):
+        assert reorder.push(first, 10, None, now=2.0) == []
+    assert firsts(reorder.push(80, 10, None, now=2.0)) == [50, 60, 70, 80]
+    assert reorder.lostSamples == 20
+
+    reorder.push(100, 10, None, now=2.0)
+    assert firsts(reorder.flush()) == [100] and reorder.lostSamples == 30
+
+
+def test_quiet_sensor_is_released_by_expire():
+    reorder = ReorderBuffer(maxDelay=0.5)
+    reorder.push(0, 10, None, now=0.0)
+    reorder.push(20, 10, None, now=0.1)
+    reorder.push(40, 10, None, now=0.4)
+    assert reorder.expire(now=0.5) == []
+    # the gap at 10 is given up, the one at 30 waits for the packet at 40, held since 0.4
+    assert firsts(reorder.expire(now=0.6)) == [20] and reorder.oldestArrival == 0.4
+    assert reorder.expire(now=0.8) == []
+    assert firsts(reorder.expire(now=0.9)) == [40] and reorder.oldestArrival is None
+    assert reorder.lostSamples == 20 and reorder.expire(now=5.0) == []
+
+
+def test_released_intervals_are_bounded_by_max_rewind():
+    reorder = ReorderBuffer(maxDelay=None, maxPackets=0, maxRewind=1000)
+    # every other packet is lost, each given-up gap leaves an interval behind
+    for first in range(0, 100_000, 20):
+        reorder.push(first, 10, None)
+    assert reorder.lostSamples == 49_990
+    assert len(reorder.released.starts) <= 1000 // 20 + 1
+    assert reorder.push(99_010, 10, None) == [] and reorder.latePackets == 1
+    assert reorder.push(99_980, 10, None) == [] and reorder.duplicatePackets == 1 and reorder.restarts == 0
+
+
+def test_restarted_counter_resets_the_order():
+    reorder = ReorderBuffer(maxDelay=None, maxRewind=1000)
+    reorder.push(50_000, 10, None)
+    reorder.push(50_020, 10, None)
+    assert firsts(reorder.push(0, 10, None)) == [50_020, 0]
+    assert reorder.restarts == 1 and reorder.expected == 10
+
+
+def test_stream_parser_stores_shuffled_packets_in_order():
+    rng = random.Random(24)
+    module = loadStreamReceiverParser()
+    numberOfSamples = 16
+    frames = [
+        buildFrame(module.Parser.DataStreamType.DATA_TYPE_IMU_RAW_COMBO_V3.value, buildComboV3Payload(i * numberOfSamples, i * 32_000, numberOfSamples, rng))
+        for i in range(200)
+    ]
+    # swap neighbours and deliver some frames twice, as a broker redelivering would
+    order = list(range(len(frames)))
+    for i in range(1, len(order) - 1, 7):
+        order[i], order[i + 1] = order[i + 1], order[i]
+    order += rng.sample(range(len(frames)), 20)
+
+    parser = module.Parser(reorderDelay=60.0)
+    for index in order:
+        parser.parseStream(frames[index])
+    parser.flushReorder()
+
+    sampleNumbers = parser.dataBuffer.dataDict["ImuAccRaw"].data[0].view()
+    assert np.array_equal(sampleNumbers, np.arange(200 * numberOfSamples))
+    assert parser.missedSamples == 0 and parser.reorder.duplicatePackets == 20
+    assert parser.dataBuffer.dataDict["TimeSync"].data[1].view().tolist() == list(range(0, 200 * numberOfSamples, numberOfSamples))
+
+
+def test_stream_parser_expires_packets_of_a_quiet_sensor():
+    rng = random.Random(24)
+    module = loadStreamReceiverParser()
+    comboV3 = module.Parser.DataStreamType.DATA_TYPE_IMU_RAW_COMBO_V3.value
+    parser = module.Parser(reorderDelay=0.5)
+    for index in (0, 2):
+        parser.parseStream(buildFrame(comboV3, buildComboV3Payload(index * 16, index * 32_000, 16, rng)))
+    sampleNumbers = parser.dataBuffer.dataDict["ImuAccRaw"].data[0]
+    parser.expireReorder(now=parser.reorder.oldestArrival + 0.1)
+    assert sampleNumbers.appended == 16
+    parser.expireReorder(now=parser.reorder.oldestArrival + 0.5)
+    assert sampleNumbers.view().tolist() == list(range(16)) + list(range(32, 48))
+    assert parser.missedSamples == 1 and parser.reorder.pendingPackets == 0
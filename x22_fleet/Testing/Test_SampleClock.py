@@ -0,0 +1,55 @@
+import random
+
+import numpy as np
+
+from x22_fleet.Library.SampleClock import SampleClock
+from x22_fleet.Testing.ParserBenchmark import buildComboV3Payload, buildFrame, loadStreamReceiverParser
+
+TSF_START = 1_700_000_000_000_000
+
+
+def timeSyncPairs(packets, rate, rng, firstSample=3_000_000_000, jitter=30.0, outlierEvery=None):
+    for packet in range(packets):
+        sampleNumber = firstSample + packet * 64
+        tsf = TSF_START + (sampleNumber - firstSample) * 1e6 / rate + rng.gauss(0, jitter)
+        if outlierEvery and packet % outlierEvery == outlierEvery - 1:
+            tsf += 500_000
+        yield sampleNumber, int(tsf)
+
+
+def test_drift_is_estimated_despite_outliers():
+    rate = 500 * (1 + 50e-6)
+    clock = SampleClock()
+    accepted = clock.updateMany(*zip(*timeSyncPairs(3000, rate, random.Random(16), outlierEvery=97)))
+
+    assert clock.rejected == 3000 - accepted == 30
+    assert abs(clock.driftPpm - 50) < 1
+    assert clock.residualRms < 60
+    sampleNumbers = np.array([3_000_000_000, 3_000_000_000 + 2999 * 64 + 10])
+    expected = TSF_START + (sampleNumbers - 3_000_000_000) * 1e6 / rate
+    assert np.abs(clock.sampleToTime(sampleNumbers) - expected).max() < 100
+    assert np.allclose(clock.timeToSample(clock.sampleToTime(sampleNumbers)), sampleNumbers)
+
+
+def test_restart_after_sample_counter_reset():
+    clock = SampleClock()
+    rng = random.Random(17)
+    clock.updateMany(*zip(*timeSyncPairs(100, 500.0, rng)))
+    rebooted = [(sampleNumber - 3_000_000_000, tsf + 60_000_000) for sampleNumber, tsf in timeSyncPairs(100, 499.9, rng)]
+    clock.updateMany(*zip(*rebooted))
+
+    assert clock.resets == 1
+    assert abs(clock.sampleRate - 499.9) < 0.01
+    assert abs(clock.sampleToTime(0) - (TSF_START + 60_000_000)) < 100
+
+
+def test_stream_parser_feeds_clock_from_time_sync():
+    rng = random.Random(18)
+    stream = bytearray()
+    for sampleNumber, tsf in timeSyncPairs(50, 501.0, rng, firstSample=0, jitter=0.0):
+        stream += buildFrame(0x1E, buildComboV3Payload(sampleNumber, tsf, 64, rng))
+
+    parser = loadStreamReceiverParser().Parser("dev")
+    parser.parseStream(stream)
+    assert parser.clock.ready and parser.clock.updates == 50
+    assert abs(parser.clock.sampleRate - 501.0) < 1e-3
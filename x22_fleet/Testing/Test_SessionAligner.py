@@ -0,0 +1,89 @@
+import random
+
+import numpy as np
+
+from x22_fleet.Library.ColumnStore import ColumnStore
+from x22_fleet.Library.FrameIndex import FrameIndex
+from x22_fleet.Library.SampleClock import SampleClock
+from x22_fleet.Library.SessionAligner import SessionAligner
+from x22_fleet.Testing.ParserBenchmark import buildComboV3Payload, buildFrame, loadStreamReceiverParser
+
+TSF_START = 1_700_000_000_000_000
+
+
+def signal(tsf):
+    return 10000 * np.sin(2 * np.pi * (tsf - TSF_START) / 1e6)
+
+
+def buildSensor(firstSample, rate, tsfOffset, samples, skip=()):
+    """Sensor sampling ``signal`` at ``rate`` Hz from ``TSF_START + tsfOffset``, with its clock fitted per 64 samples."""
+    sampleNumbers = firstSample + np.arange(samples)
+    tsf = TSF_START + tsfOffset + (sampleNumbers - firstSample) * 1e6 / rate
+    keep = ~np.isin(sampleNumbers, list(skip))
+    store = ColumnStore("Lhhh")
+    values = np.round(signal(tsf)).astype(np.int16)
+    store.extend([sampleNumbers[keep], values[keep], -values[keep], np.zeros(keep.sum(), dtype=np.int16)])
+    clock = SampleClock()
+    clock.updateMany(sampleNumbers[::64], tsf[::64].astype(np.int64))
+    return store, clock
+
+
+def test_sensors_are_resampled_onto_common_grid():
+    sensors = {
+        "a": buildSensor(1000, 500 * (1 + 80e-6), 0, 5000),
+        "b": buildSensor(7_000_000, 500 * (1 - 60e-6), 3_300, 5000, skip=range(7_002_000, 7_002_010)),
+    }
+    aligner = SessionAligner(sensors)
+    start, stop = aligner.overlap()
+    assert abs(start - (TSF_START + 3_300)) < 1
+
+    times, values = aligner.resample(*aligner.gridIndexes(start, stop))
+    assert np.all(np.diff(times) == 2000)
+    assert values["a"].dtype == np.float32 and values["a"].shape == (len(times), 3)
+    assert np.nanmax(np.abs(values["a"][:, 0] - signal(times))) < 1.5
+    assert np.nanmax(np.abs(values["b"][:, 1] + signal(times))) < 1.5
+
+    # grid points inside the dropped samples of b are NaN, a is complete
+    missing = np.isnan(values["b"][:, 0])
+    assert 9 <= missing.sum() <= 12
+    assert not np.isnan(values["a"]).any()
+
+
+def test_chunks_and_streaming_match_one_pass():
+    rng = random.Random(17)
+    full = {"a": buildSensor(0, 500.02, 0, 3000), "b": buildSensor(50, 499.97, 1_234, 3000)}
+    aligner = SessionAligner(full)
+    times, values = aligner.resample(*aligner.gridIndexes(*aligner.overlap()))
+
+    chunked = list(aligner.chunks(seconds=0.7))
+    assert len(chunked) > 5
+    assert np.array_equal(np.concatenate([chunkTimes for chunkTimes, _ in chunked]), times)
+    assert np.array_equal(np.concatenate([chunkValues["b"] for _, chunkValues in chunked]), values["b"])
+
+    # rows arrive in packets of varying size, advance() resamples what became available
+    live = {name: (ColumnStore("Lhhh"), clock) for name, (store, clock) in full.items()}
+    streamed = SessionAligner(live)
+    pieces = []
+    while any(live[name][0].length < store.length for name, (store, _) in full.items()):
+        for name, (store, _) in full.items():
+            liveStore = live[name][0]
+            liveStore.extend(store.view(liveStore.length, liveStore.length + rng.choice((32, 64, 96))))
+        piece = streamed.advance()
+        if piece is not None:
+            pieces.append(piece)
+    assert streamed.advance() is None
+    assert np.array_equal(np.concatenate([pieceTimes for pieceTimes, _ in pieces]), times)
+    assert np.array_equal(np.concatenate([pieceValues["a"] for _, pieceValues in pieces]), values["a"])
+
+
+def test_frame_index_fits_clock_of_v3_dump(tmp_path):
+    rng = random.Random(18)
+    stream = bytearray()
+    for packet in range(40):
+        stream += buildFrame(0x1E, buildComboV3Payload(packet * 64, TSF_START + int(packet * 64 * 1e6 / 500.1), 64, rng))
+    path = tmp_path / "Sensor-4_rec.bd"
+    path.write_bytes(bytes(stream))
+
+    clock = FrameIndex.build(str(path), loadStreamReceiverParser().Parser("dev")).clock()
+    assert clock.updates == 40
+    assert abs(clock.sampleRate - 500.1) < 1e-3
@@ -0,0 +1,51 @@
+import random
+import struct
+
+import numpy as np
+
+from x22_fleet.Library.TaskTrace import TaskTraceStore
+from x22_fleet.Library.dataParser import Parser
+from x22_fleet.Testing.ParserBenchmark import buildFrame
+
+
+def traceEntries(rng, count, tasks=6):
+    return [(rng.randrange(tasks), rng.randrange(1 << 32), rng.randrange(200, 4096), rng.randrange(101)) for _ in range(count)]
+
+
+def test_frames_decode_into_record_array_with_one_summary_log():
+    rng = random.Random(21)
+    packets = [traceEntries(rng, rng.randrange(1, 40)) for _ in range(50)]
+    stream = b"".join(buildFrame(Parser.DataStreamType.DATA_TYPE_TASK_TRACE.value, b"".join(struct.pack("<IIII", *entry) for entry in entries)) for entries in packets)
+    logged = []
+    parser = Parser(logf=logged.append)
+    parser.parseStream(stream)
+
+    entries = [entry for packet in packets for entry in packet]
+    taskTrace = parser.dataBuffer.taskTrace
+    assert taskTrace.entries().tolist() == entries
+    # one summary for the first frame instead of a line per entry
+    assert logged[0] == "Task Trace: %d entries of %d tasks" % (len(packets[0]), len({entry[0] for entry in packets[0]}))
+    assert len(logged) == 1 + len({entry[0] for entry in packets[0]})
+
+    summary = taskTrace.summary()
+    for taskId in {entry[0] for entry in entries}:
+        own = [entry for entry in entries if entry[0] == taskId]
+        task = summary[taskId]
+        assert task.entries == len(own)
+        assert (task.firstTimestamp, task.lastTimestamp) == (own[0][1], own[-1][1])
+        assert (task.stackHighWater, task.minStackHighWater) == (own[-1][2], min(entry[2] for entry in own))
+        assert (task.cpuUsage, task.maxCpuUsage) == (own[-1][3], max(entry[3] for entry in own))
+        assert np.isclose(task.meanCpuUsage, np.mean([entry[3] for entry in own]))
+
+
+def test_summary_is_incremental_and_ignores_trailing_bytes():
+    rng = random.Random(22)
+    store = TaskTraceStore()
+    first, second = traceEntries(rng, 30), traceEntries(rng, 25)
+    assert store.extend(b"".join(struct.pack("<IIII", *entry) for entry in first) + b"\x01\x02\x03") == 30
+    store.summary()
+    store.extend(b"\xff" * 8 + b"".join(struct.pack("<IIII", *entry) for entry in second), startIndex=8)
+    summary = store.summary()
+    assert sum(task.entries for task in summary.values()) == 55
+    assert store.summary() is summary and sum(task.entries for task in summary.values()) == 55
+    assert store.logDue(now=1.0) and not store.logDue(now=2.0) and store.logDue(now=6.0)
@@ -0,0 +1,91 @@
+import logging
+import random
+import time
+
+from x22_fleet.Library.Trace import Trace
+from x22_fleet.Testing.ParserBenchmark import buildComboStream, loadStreamReceiverParser
+
+
+class RecordList(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def makeTrace(name, interval=5.0):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.WARNING)
+    logger.propagate = False
+    handler = RecordList()
+    logger.handlers = [handler]
+    return Trace(logger, ("frames", "crc"), interval=interval), handler.records
+
+
+def test_repeated_warnings_are_aggregated():
+    trace, records = makeTrace("TraceTest.aggregate")
+    for _ in range(412):
+        trace.warn("crc", "CRC mismatches")
+    assert len(records) == 1 and records[0].getMessage().startswith("CRC mismatches: 1 in last")
+
+    trace.flush()
+    assert len(records) == 2 and records[1].getMessage().startswith("CRC mismatches: 411 in last")
+    assert records[1].name == "TraceTest.aggregate.crc"
+    trace.flush()
+    assert len(records) == 2
+
+    trace.setLevel("crc", logging.ERROR)
+    trace.warn("crc", "CRC mismatches", 5)
+    trace.flush()
+    assert len(records) == 2
+
+
+def test_expire_logs_counts_after_their_interval():
+    trace, records = makeTrace("TraceTest.expire", interval=0.05)
+    trace.warn("crc", "CRC mismatches")
+    trace.warn("crc", "CRC mismatches", 3)
+    trace.expire()
+    assert len(records) == 1
+    time.sleep(0.06)
+    trace.expire()
+    assert len(records) == 2 and records[1].getMessage().startswith("CRC mismatches: 3 in last")
+    trace.expire()
+    assert len(records) == 2
+
+
+def test_category_levels():
+    trace, records = makeTrace("TraceTest.levels")
+    assert not trace.frames and not trace.crc
+
+    trace.configure("frames=debug")
+    assert trace.frames and not trace.crc
+    trace.debug("frames", "Found packet: type=0x%02X", 0x1C)
+    assert [record.getMessage() for record in records] == ["Found packet: type=0x1C"]
+
+
+def test_stream_parser_reports_scanner_counts_per_parse_call():
+    streamParser = loadStreamReceiverParser()
+    stream = buildComboStream(10, 64, random.Random(15))
+    frameLength = len(stream) // 10
+    broken = bytearray(stream[:frameLength])
+    broken[-1] ^= 0xFF
+    corrupted = bytearray()
+    for frame in range(10):
+        corrupted += stream[frame * frameLength : (frame + 1) * frameLength] + broken
+
+    parser = streamParser.Parser("dev")
+    reported = []
+    parser_trace = streamParser.trace
+    warn = parser_trace.warn
+    parser_trace.warn = lambda category, message, count=1: reported.append((category, message, count))
+    try:
+        assert parser.parseStream(corrupted) == len(corrupted)
+        parser.parseStream(corrupted)
+    finally:
+        parser_trace.warn = warn
+
+    crcReports = [count for category, message, count in reported if message == "CRC mismatches"]
+    assert crcReports == [parser.scanner.crcFailures // 2] * 2
+    assert not parser_trace.frames
@@ -1,17 +1,19 @@
 from dataParser import Parser
+from x22_fleet.Library.ReceiveBuffer import ReceiveBuffer
 
 class DeviceDataBuffer:
     def __init__(self):
-        self.dataBuffer = {}  # Initialize the dictionary of bytearrays
+        self.dataBuffer = {}  # ReceiveBuffer per device
 
     def append_data(self, device_name, data):
         if device_name not in self.dataBuffer:
-            self.dataBuffer[device_name] = bytearray()
+            self.dataBuffer[device_name] = ReceiveBuffer()
         self.dataBuffer[device_name].extend(data)
         return self.dataBuffer[device_name]
     
     def truncate(self,device_name,bytesParsed):
-        self.dataBuffer[device_name] = self.dataBuffer[device_name][bytesParsed:]
+        # bytesParsed is the absolute position returned by parseStream(buffer.data, buffer.offset)
+        self.dataBuffer[device_name].consume(bytesParsed)
 
 
 class DeviceParser:
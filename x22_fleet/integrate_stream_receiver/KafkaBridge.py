@@ -1,11 +1,10 @@
 import ssl
 import re
 import json
-from collections import defaultdict, deque
+from collections import defaultdict
+import signal
 import threading
 import time
-from rich.console import Console
-from rich.table import Table
 
 # Try to import Kafka, but don't fail if not available
 try:
@@ -24,7 +23,13 @@ except ImportError:
     exit(1)
 
 import struct
-import crcmod
+
+from x22_fleet.Library.Checkpoint import Checkpointer
+from x22_fleet.Library.FrameScanner import crc16_mod
+from x22_fleet.Library.GapTracker import GapTracker
+from x22_fleet.Library.ParserMetrics import registry, serveMetrics
+from x22_fleet.Library.ReceiveBuffer import ReceiveBuffer
+from x22_fleet.Library.ReorderBuffer import ReorderBuffer
 
 MQTT_BROKER = "mqtt.dev.artemys.link"
 MQTT_PORT = 443
@@ -32,9 +37,18 @@ MQTT_TOPIC = "stream/+"
 
 MQTT_TLS = True
 
+METRICS_PORT = 9109
+
 KAFKA_BROKER = "localhost:9092"
 KAFKA_TOPIC_TEMPLATE = "imu_data-{}"
 
+# how long a gap in the sample numbers may stay open for late packets
+REORDER_SECONDS = 0.5
+
+# per-sensor buffers and counters, saved periodically and on SIGTERM and restored on start
+CHECKPOINT_PATH = "bridge.checkpoint"
+CHECKPOINT_SECONDS = 10
+
 # ALLOWED_SENSOR_IDS = {"0D_17_56"}  # Uncomment to restrict
 ALLOWED_SENSOR_IDS = None  # None = allow all
 active_sensor_ids = set()
@@ -43,17 +57,20 @@ sensor_byte_counts = defaultdict(int)
 sensor_buffer_sizes = defaultdict(int)
 sensor_bytes_parsed = defaultdict(int)
 sensor_sample_counts = defaultdict(int)
-sensor_sample_window = defaultdict(lambda: deque(maxlen=2))
-sensor_sample_skips = defaultdict(int)
+sensor_sample_gaps = defaultdict(GapTracker)
 sensor_messages_received = defaultdict(int)
 
-crc16_mod = crcmod.mkCrcFun(0x18005, rev=True, initCrc=0x0000, xorOut=0x0000)
-
-# Initialize Kafka producer only if available
+# Kafka producer, connected by connect_kafka when run as a script
 producer = None
-if KAFKA_AVAILABLE:
+
+
+def connect_kafka():
+    """Kafka producer, None if the library or the broker is not available."""
+    if not KAFKA_AVAILABLE:
+        print("Running in MQTT-only mode (Kafka library not available)")
+        return None
     try:
-        producer = KafkaProducer(
+        kafka_producer = KafkaProducer(
             bootstrap_servers=KAFKA_BROKER,
             value_serializer=lambda v: json.dumps(v).encode("utf-8"),
             # Add timeout and retry settings for better reliability
@@ -61,12 +78,11 @@ if KAFKA_AVAILABLE:
             retries=3
         )
         print(f"Successfully connected to Kafka broker at {KAFKA_BROKER}")
+        return kafka_producer
     except Exception as e:
         print(f"Warning: Could not connect to Kafka broker at {KAFKA_BROKER}: {e}")
         print("Running in MQTT-only mode. Data will be parsed and logged but not sent to Kafka.")
-        producer = None
-else:
-    print("Running in MQTT-only mode (Kafka library not available)")
+        return None
 
 class MQTTDataParser:
     def __init__(self):
@@ -87,10 +103,13 @@ class MQTTDataParser:
             + struct.calcsize(self.SAMPLE_V3_MAG_FORMAT)
             + struct.calcsize(self.SAMPLE_V3_TEMP_FORMAT)
         )
+        # packets go to Kafka in sample order, without duplicates
+        self.reorder = defaultdict(lambda: ReorderBuffer(maxDelay=REORDER_SECONDS))
 
-    def parse_from_buffer(self, buffer: bytearray, sensor_id):
+    def parse_from_buffer(self, receive_buffer: ReceiveBuffer, sensor_id):
         results = []
-        i = 0
+        buffer = receive_buffer.data
+        start = i = receive_buffer.offset
         total_len = len(buffer)
         min_len = self.HEADER_LENGTH + self.CRC_LENGTH
 
@@ -130,16 +149,6 @@ class MQTTDataParser:
                 if actual_data_len < expected_data_len:
                     raise ValueError(f"[{sensor_id}] Not enough data for {num_samples} samples: expected {expected_data_len}, got {actual_data_len}")
 
-                if sensor_sample_window[sensor_id]:
-                    last_sample = sensor_sample_window[sensor_id][-1]
-                    if base_sample_number > last_sample:
-                        expected = last_sample + 1
-                        missed = base_sample_number - expected
-                        sensor_sample_skips[sensor_id] += missed
-
-                sensor_sample_window[sensor_id].append(base_sample_number + num_samples - 1)
-                sensor_sample_counts[sensor_id] += num_samples
-
                 samples = []
                 for j in range(num_samples):
                     acc = struct.unpack(self.SAMPLE_V3_ACC_FORMAT, payload_bytes[start_index:start_index + 6])
@@ -159,30 +168,87 @@ class MQTTDataParser:
                         "temp_raw": temp
                     })
 
-                results.append({
+                result = {
                     "sensor_id": sensor_id,
                     "timestamp_us": timestamp_us,
                     "base_sample_number": base_sample_number,
                     "num_samples_in_packet": num_samples,
                     "samples": samples
-                })
+                }
+                results += self.deliver(sensor_id, self.reorder[sensor_id].push(base_sample_number, num_samples, result))
 
                 i += expected_total_length
             except Exception as e:
                 print(f"[{sensor_id}] Exception during parsing at index {i}: {e}")
                 i += 1
 
-        sensor_bytes_parsed[sensor_id] += i
-        del buffer[:i]
+        sensor_bytes_parsed[sensor_id] += i - start
+        receive_buffer.consume(i)
+        return results
+
+    def release_held(self, sensor_id, flush=False):
+        """Results held for reordering whose gap timed out (all of them with ``flush``), in sample order."""
+        reorder = self.reorder[sensor_id]
+        return self.deliver(sensor_id, reorder.flush() if flush else reorder.expire())
+
+    def deliver(self, sensor_id, released):
+        results = []
+        for first, count, result in released:
+            sensor_sample_gaps[sensor_id].add(first, count)
+            sensor_sample_counts[sensor_id] += count
+            results.append(result)
         return results
 
 parser = MQTTDataParser()
-stream_buffers = defaultdict(bytearray)
-console = Console()
+stream_buffers = defaultdict(ReceiveBuffer)
 last_sample_counts = defaultdict(int)
 last_message_counts = defaultdict(int)
+# on_message runs in the MQTT loop, held packets are also released by expire_held_packets
+parser_lock = threading.Lock()
+
+def snapshot_state():
+    """Partial frames, gap accounting and held packets of every sensor, see Checkpointer."""
+    sensors = {}
+    for sensor_id in list(active_sensor_ids):
+        sensors[sensor_id] = {
+            "buffer": stream_buffers[sensor_id].snapshot(),
+            "gaps": sensor_sample_gaps[sensor_id].state(),
+            "reorder": parser.reorder[sensor_id].state(),
+            "samples": sensor_sample_counts[sensor_id],
+        }
+    return {"sensors": sensors}
+
+
+def restore_state(state):
+    for sensor_id, sensor in state["sensors"].items():
+        active_sensor_ids.add(sensor_id)
+        stream_buffers[sensor_id].restore(sensor["buffer"])
+        sensor_sample_gaps[sensor_id].restoreState(sensor["gaps"])
+        parser.reorder[sensor_id].restoreState(sensor["reorder"])
+        sensor_sample_counts[sensor_id] = sensor["samples"]
+        last_sample_counts[sensor_id] = sensor["samples"]
+
+
+checkpointer = Checkpointer(CHECKPOINT_PATH, snapshot_state, CHECKPOINT_SECONDS)
+
+
+def load_checkpoint():
+    try:
+        state = checkpointer.load()
+    except (OSError, ValueError) as e:
+        print(f"Ignoring checkpoint {CHECKPOINT_PATH}: {e}")
+        return
+    if state is not None:
+        restore_state(state)
+        print(f"Restored {len(state['sensors'])} sensors from {CHECKPOINT_PATH}")
+
 
 def print_sensor_stats():
+    # rich is only needed for the console table, the parser can be imported without it
+    from rich.console import Console
+    from rich.table import Table
+
+    console = Console()
     log_file = open("stream_stats.log", "a")
     while True:
         time.sleep(5)
@@ -195,6 +261,9 @@ def print_sensor_stats():
         table.add_column("Bytes Parsed", justify="right")
         table.add_column("Samples/sec", justify="right")
         table.add_column("Skipped Samples", justify="right")
+        table.add_column("Duplicates", justify="right")
+        table.add_column("Out of Order", justify="right")
+        table.add_column("Late", justify="right")
         table.add_column("Kafka Status", justify="center")
 
         sensor_ids_to_show = ALLOWED_SENSOR_IDS if ALLOWED_SENSOR_IDS is not None else active_sensor_ids
@@ -203,7 +272,9 @@ def print_sensor_stats():
             messages_this_period = sensor_messages_received[sensor_id] - last_message_counts[sensor_id]
             sample_rate = samples_this_period / 5.0
             message_rate = messages_this_period / 5.0
-            skipped = sensor_sample_skips[sensor_id]
+            gaps = sensor_sample_gaps[sensor_id]
+            skipped = gaps.missingSamples
+            reorder = parser.reorder[sensor_id]
             
             # Kafka status indicator
             kafka_status = "✅" if producer else "❌"
@@ -216,10 +287,13 @@ def print_sensor_stats():
                 str(sensor_bytes_parsed[sensor_id]),
                 f"{sample_rate:.1f}",
                 str(skipped),
+                str(reorder.duplicatePackets),
+                str(reorder.reorderedPackets),
+                str(reorder.latePackets),
                 kafka_status
             )
             table.add_row(*row)
-            log_file.write(f"[{timestamp}] Sensor {sensor_id}: {sample_rate:.1f} samples/sec, {message_rate:.1f} msgs/sec, {skipped} skipped, Kafka: {'ON' if producer else 'OFF'}\n")
+            log_file.write(f"[{timestamp}] Sensor {sensor_id}: {sample_rate:.1f} samples/sec, {message_rate:.1f} msgs/sec, {skipped} skipped, {reorder.duplicatePackets} duplicates, {reorder.reorderedPackets} out of order, {reorder.latePackets} late, Kafka: {'ON' if producer else 'OFF'}\n")
             last_sample_counts[sensor_id] = sensor_sample_counts[sensor_id]
             last_message_counts[sensor_id] = sensor_messages_received[sensor_id]
 
@@ -227,13 +301,58 @@ def print_sensor_stats():
         console.clear()
         console.print(table)
 
-threading.Thread(target=print_sensor_stats, daemon=True).start()
+
+def bridge_metric(name, help_text, values):
+    return lambda: (name, help_text, [({"sensor": sensor_id}, value) for sensor_id, value in list(values.items())])
+
+
+def gap_metric(name, help_text, attribute):
+    return lambda: (name, help_text, [({"sensor": sensor_id}, getattr(gaps, attribute)) for sensor_id, gaps in list(sensor_sample_gaps.items())])
+
+
+def reorder_metric(name, help_text, attribute):
+    return lambda: (name, help_text, [({"sensor": sensor_id}, getattr(reorder, attribute)) for sensor_id, reorder in list(parser.reorder.items())])
+
+
+# the bridge decodes COMBO_V3 itself, its per-sensor counters are exported as gauges
+registry.addCollector(bridge_metric("x22_bridge_bytes_received", "Bytes received per sensor", sensor_byte_counts))
+registry.addCollector(bridge_metric("x22_bridge_bytes_parsed", "Bytes consumed by the bridge parser per sensor", sensor_bytes_parsed))
+registry.addCollector(bridge_metric("x22_bridge_samples", "Samples decoded per sensor", sensor_sample_counts))
+registry.addCollector(gap_metric("x22_bridge_sample_skips", "Samples missing between packets per sensor", "missingSamples"))
+registry.addCollector(reorder_metric("x22_bridge_duplicate_packets", "Packets dropped as duplicates per sensor", "duplicatePackets"))
+registry.addCollector(reorder_metric("x22_bridge_out_of_order_packets", "Packets put back in sample order per sensor", "reorderedPackets"))
+registry.addCollector(reorder_metric("x22_bridge_late_packets", "Packets dropped after their gap was given up per sensor", "latePackets"))
+registry.addCollector(reorder_metric("x22_bridge_reorder_pending_packets", "Packets held for a gap to fill per sensor", "pendingPackets"))
 
 def on_connect(client, userdata, flags, rc):
     print("Connected to MQTT broker with result code " + str(rc))
     client.subscribe(MQTT_TOPIC)
     print(f"Subscribed to topic: {MQTT_TOPIC}")
 
+def send_to_kafka(sensor_id, payloads):
+    # Send to Kafka only if producer is available
+    if producer:
+        kafka_topic = KAFKA_TOPIC_TEMPLATE.format(sensor_id)
+        for payload in payloads:
+            try:
+                producer.send(kafka_topic, value=payload)
+            except Exception as e:
+                print(f"Error sending to Kafka: {e}")
+
+
+def release_held_packets(flush=False):
+    """Send the packets whose reorder window ran out (all held ones with ``flush``), also for sensors that went quiet."""
+    with parser_lock:
+        for sensor_id in list(parser.reorder):
+            send_to_kafka(sensor_id, parser.release_held(sensor_id, flush))
+
+
+def expire_held_packets():
+    while True:
+        time.sleep(REORDER_SECONDS)
+        release_held_packets()
+
+
 def on_message(client, userdata, msg):
     try:
         sensor_id_match = re.match(r"stream/(.+)", msg.topic)
@@ -248,19 +367,12 @@ def on_message(client, userdata, msg):
         active_sensor_ids.add(sensor_id)
         sensor_messages_received[sensor_id] += 1
 
-        stream_buffers[sensor_id].extend(msg.payload)
-        sensor_byte_counts[sensor_id] += len(msg.payload)
-        parsed_payloads = parser.parse_from_buffer(stream_buffers[sensor_id], sensor_id)
-
-        # Send to Kafka only if producer is available
-        if producer:
-            kafka_topic = KAFKA_TOPIC_TEMPLATE.format(sensor_id)
-            for payload in parsed_payloads:
-                try:
-                    producer.send(kafka_topic, value=payload)
-                except Exception as e:
-                    print(f"Error sending to Kafka: {e}")
-        # Removed verbose parsing messages when Kafka not available
+        with parser_lock:
+            stream_buffers[sensor_id].extend(msg.payload)
+            sensor_byte_counts[sensor_id] += len(msg.payload)
+            parsed_payloads = parser.parse_from_buffer(stream_buffers[sensor_id], sensor_id)
+            send_to_kafka(sensor_id, parsed_payloads)
+            checkpointer.maybeSave()
 
     except Exception as e:
         print(f"Error parsing message: {e}")
@@ -271,14 +383,21 @@ if __name__ == '__main__':
         exit(1)
     
     print("Starting MQTT Stream Bridge...")
+    load_checkpoint()
+    producer = connect_kafka()
+    threading.Thread(target=print_sensor_stats, daemon=True).start()
+    threading.Thread(target=expire_held_packets, daemon=True).start()
     if producer:
         print(f"✅ Kafka mode: Connected to {KAFKA_BROKER}")
     else:
         print("⚠️  MQTT-only mode: No Kafka broker available")
     
+    serveMetrics(METRICS_PORT)
     client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1)
     client.on_connect = on_connect
     client.on_message = on_message
+    # leave loop_forever between two messages, the checkpoint is written below
+    signal.signal(signal.SIGTERM, lambda signum, frame: client.disconnect())
 
     if MQTT_TLS:
         client.tls_set(cert_reqs=ssl.CERT_REQUIRED)
@@ -287,6 +406,11 @@ if __name__ == '__main__':
         client.connect(MQTT_BROKER, MQTT_PORT)
         print(f"Connecting to MQTT broker: {MQTT_BROKER}:{MQTT_PORT}")
         client.loop_forever()
+        # the held packets go to Kafka now, the checkpoint then starts behind them
+        release_held_packets(flush=True)
+        if producer:
+            producer.flush()
+        checkpointer.save()
     except Exception as e:
         print(f"Error connecting to MQTT broker: {e}")
         exit(1)
@@ -5,6 +5,7 @@ import sys
 import json
 import signal
 from DeviceHelper import Parser
+from dataParser import trace
 from FsrConstants import FullScaleRangeConstants as fsrx22
 from paho.mqtt import client as mqtt_client
 import os
@@ -13,6 +14,10 @@ import numpy as np
 from DeviceStats import DevStats
 from multiprocessing import Process, Queue
 from x22_fleet.Library.BaseLogger import BaseLogger
+from x22_fleet.Library.Checkpoint import Checkpointer
+from x22_fleet.Library.ColumnStore import Retention
+from x22_fleet.Library.ParserMetrics import registry, serveMetrics
+from x22_fleet.Library.ReceiveBuffer import ReceiveBuffer
 import threading
 import ssl
 from PySide6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QLabel, QGridLayout, QScrollArea
@@ -40,6 +45,16 @@ broker = '167.235.159.207'
 
 mqtt_port = 1883
 
+# Samples kept in memory per sensor and stream, older ones are spilled to <data_dir>/spill
+RETENTION_SECONDS = 600
+# how long a gap in the COMBO_V3 sample numbers may stay open for late packets
+REORDER_SECONDS = 0.5
+# Prometheus text of all sensor parsers on http://127.0.0.1:<port>/metrics
+METRICS_PORT = 9108
+# parser state and partial frames per sensor, saved periodically and on exit and restored on start
+CHECKPOINT_PATH = os.path.join("data", "receiver.checkpoint")
+CHECKPOINT_SECONDS = 10
+
 # Global flag for running state
 Running = True
 
@@ -52,16 +67,17 @@ signal.signal(signal.SIGTERM, sigterm_handler)
 
 class DeviceDataBuffer:
     def __init__(self):
-        self.dataBuffer = {}  # Initialize the dictionary of bytearrays
+        self.dataBuffer = {}  # ReceiveBuffer per device
 
     def append_data(self, device_name, data):
         if device_name not in self.dataBuffer:
-            self.dataBuffer[device_name] = bytearray()
+            self.dataBuffer[device_name] = ReceiveBuffer()
         self.dataBuffer[device_name].extend(data)
         return self.dataBuffer[device_name]
     
     def truncate(self,device_name,bytesParsed):
-        self.dataBuffer[device_name] = self.dataBuffer[device_name][bytesParsed:]
+        # bytesParsed is the absolute position returned by parseStream(buffer.data, buffer.offset)
+        self.dataBuffer[device_name].consume(bytesParsed)
 
 def logThis(logmessage):
     # Reduce verbose logging - only log errors or important messages
@@ -69,14 +85,17 @@ def logThis(logmessage):
         print(logmessage)
 
 class DeviceParser:
-    def __init__(self,dataCallBack):
+    def __init__(self,dataCallBack,retention=None):
         self.parsers = {}  
         self.dataCallBack = dataCallBack
+        self.retention = retention
+        registry.addParsers(self.parsers, receiver="aiving")
 
     def getParser(self, device_name):
         if device_name not in self.parsers:
-           self.parsers[device_name] = Parser(deviceName = device_name,logf=logThis)     
-           self.parsers[device_name].dataCallback = self.dataCallBack
+           self.parsers[device_name] = Parser(deviceName = device_name,logf=logThis,retention=self.retention,reorderDelay=REORDER_SECONDS)     
+           # only stream tokens are handled per frame, all other frames go without a callback
+           self.parsers[device_name].subscribe(Parser.DataStreamType.DATA_TYPE_STREAM_TOKEN, self.dataCallBack)
         return self.parsers[device_name]       
     
     
@@ -118,6 +137,8 @@ class RealtimePlotter(QMainWindow):
         
         # Common settings
         self.max_points = 1000
+        # samples shown per device, windows longer than max_points are decimated
+        self.window_samples = 1000
         self.labels = [
             "Acc X", "Acc Y", "Acc Z",
             "Gyr X", "Gyr Y", "Gyr Z",
@@ -207,40 +228,26 @@ class RealtimePlotter(QMainWindow):
             # Ensure we have a chart for this device
             chart, series_list = self.ensure_device_chart(device_name)
 
-            # Get IMU data from device buffer
-            acc_data = device_buffer.dataDict["ImuAccRaw"].data
-            gyr_data = device_buffer.dataDict["ImuGyrRaw"].data
-            mag_data = device_buffer.dataDict["ImuMagRaw"].data
-
-            # Get the current buffer lengths
-            acc_len = len(acc_data[1])
-            gyr_len = len(gyr_data[1])
-            mag_len = len(mag_data[1])
+            # The newest window_samples rows of each stream, as at most max_points bucket means
+            means = []
+            for stream in ("ImuAccRaw", "ImuGyrRaw", "ImuMagRaw"):
+                _, _, _, _, mean = device_buffer.pyramids[stream].tail(self.window_samples, self.max_points)
+                means.append(mean)
 
             # Find the minimum length to ensure we have matching data points
-            min_len = min(acc_len, gyr_len, mag_len)
+            min_len = min(len(mean) for mean in means)
             if min_len == 0:
                 return
 
-            # Take only the last max_points of data
-            start_idx = max(0, min_len - self.max_points)
-            
             # Create points for each series
             for series_idx, series in enumerate(series_list):
-                points = []
                 # Get the right data array based on series index
-                if series_idx < 3:
-                    data = acc_data[series_idx + 1][start_idx:]
-                elif series_idx < 6:
-                    data = gyr_data[(series_idx - 3) + 1][start_idx:]
-                else:
-                    data = mag_data[(series_idx - 6) + 1][start_idx:]
-                
+                data = means[series_idx // 3][-min_len:, series_idx % 3].tolist()
+
                 # Create points with x values from 0 to max_points
-                for i, value in enumerate(data):
-                    x = i * (self.max_points / len(data))
-                    points.append(QPointF(x, value))
-                
+                step = self.max_points / len(data)
+                points = [QPointF(i * step, value) for i, value in enumerate(data)]
+
                 # Replace all points in the series
                 series.replace(points)
 
@@ -278,7 +285,12 @@ class DeviceHandler:
         os.makedirs(self.data_dir, exist_ok=True)
         
         self.device_buffer = DeviceDataBuffer()
-        self.device_parser = DeviceParser(dataCallBack=self.parsedData)
+        retention = Retention(seconds=RETENTION_SECONDS, spillDir=os.path.join(self.data_dir, "spill"))
+        self.device_parser = DeviceParser(dataCallBack=self.parsedData, retention=retention)
+        # parsing runs in the MQTT thread, releasing held packets in the Qt timers
+        self.parse_lock = threading.Lock()
+        # set by sigterm_handler, main then calls shutdown once the Qt loop returned
+        self.stopping = False
         self.useTLS = useTLS
         self.dataQueue = dataQueue
         self.deviceName = ""
@@ -308,6 +320,8 @@ class DeviceHandler:
         self.mqtt_client.on_subscribe = self.on_subscribe
         self.mqtt_client.on_connect = self.on_connect
         self.logger = BaseLogger(log_file_path=f"DeviceHandler.log", log_to_console=False).get_logger()  # Reduce console logging
+        self.checkpointer = Checkpointer(CHECKPOINT_PATH, self.snapshot, CHECKPOINT_SECONDS)
+        self.restore_checkpoint()
         try:
             self.mqtt_client.connect(broker, mqtt_port)
             self.logger.info("MQTT client successfully connected.")
@@ -334,15 +348,65 @@ class DeviceHandler:
             time.sleep(10)  # Check every 10 seconds
     
     def sigterm_handler(self, signum, frame):
+        # a Qt timer may hold parse_lock right now, the data is saved after the event loop returned
         print("\nReceived signal to terminate. Saving data...")
+        self.stopping = True
+        QApplication.quit()
+
+    def shutdown(self):
+        # no message may be parsed while the checkpoint is taken
+        self.mqtt_client.loop_stop()
         self.export_all_data()
+        # after the export stored the held packets, the checkpoint starts behind them
+        self.checkpointer.save()
+        self.log_parser_warnings(flush=True)
         print("Data saved. Cleaning up and exiting.")
-        sys.exit(0)
+
+    def snapshot(self):
+        """Parser state and partial frame of every sensor, see Checkpointer."""
+        devices = {}
+        for device_name, parser in self.device_parser.parsers.items():
+            buffer = self.device_buffer.dataBuffer.get(device_name)
+            devices[device_name] = {"parser": parser.snapshot(), "buffer": b"" if buffer is None else buffer.snapshot()}
+        return {"devices": devices}
+
+    def restore_checkpoint(self):
+        try:
+            state = self.checkpointer.load()
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Ignoring checkpoint {CHECKPOINT_PATH}: {e}")
+            return
+        if state is None:
+            return
+        for device_name, device in state["devices"].items():
+            self.device_parser.getParser(device_name).restore(device["parser"])
+            self.device_buffer.append_data(device_name, b"").restore(device["buffer"])
+        self.logger.info(f"Restored {len(state['devices'])} sensors from {CHECKPOINT_PATH}")
+
+    def release_held_packets(self, flush=False):
+        """Store COMBO_V3 packets whose reorder window ran out (all held ones with ``flush``), also for sensors that went quiet."""
+        with self.parse_lock:
+            for parser in list(self.device_parser.parsers.values()):
+                if flush:
+                    parser.flushReorder()
+                else:
+                    parser.expireReorder()
+
+    def log_parser_warnings(self, flush=False):
+        """Log the parser warning counts whose interval ended (all of them with ``flush``), the parser only logs on the next warning."""
+        with self.parse_lock:
+            if flush:
+                trace.flush()
+            else:
+                trace.expire()
 
     def export_all_data(self):
-        """Export all accumulated data to files"""
+        """Export the retained data to files, older samples are completed in the spill directory"""
+        self.release_held_packets(flush=True)
         for device_name, parser in self.device_parser.parsers.items():
             try:
+                parser.dataBuffer.spillEvicted()
+
                 # Create files
                 clean_name = device_name.replace('stream/', '')
                 data_path = os.path.join(self.data_dir, f"{clean_name}.csv")
@@ -359,13 +423,11 @@ class DeviceHandler:
                     mag_data = parser.dataBuffer.dataDict["ImuMagRaw"].data
                     
                     # Find the length of data to write
-                    min_len = min(len(acc_data[1]), len(gyr_data[1]), len(mag_data[1]))
+                    min_len = min(acc_data.length, gyr_data.length, mag_data.length)
                     
-                    # Write all data points
-                    for i in range(min_len):
-                        data_file.write(f"{acc_data[0][i]},{acc_data[1][i]},{acc_data[2][i]},{acc_data[3][i]},"
-                                      f"{gyr_data[1][i]},{gyr_data[2][i]},{gyr_data[3][i]},"
-                                      f"{mag_data[1][i]},{mag_data[2][i]},{mag_data[3][i]}\n")
+                    # Write all data points in one go from views on the column stores
+                    rows = np.column_stack(acc_data.view(0, min_len) + gyr_data.view(0, min_len)[1:] + mag_data.view(0, min_len)[1:])
+                    np.savetxt(data_file, rows, fmt="%d", delimiter=",")
                 
                 # Export TimeSync data
                 if "TimeSync" in parser.dataBuffer.dataDict:
@@ -378,8 +440,7 @@ class DeviceHandler:
                         ts_data = parser.dataBuffer.dataDict["TimeSync"].data[1]
                         
                         # Write all TimeSync data points
-                        for tsf, ts in zip(tsf_data, ts_data):
-                            timesync_file.write(f"{tsf},{ts}\n")
+                        np.savetxt(timesync_file, np.column_stack((tsf_data.view(), ts_data.view())), fmt="%d", delimiter=",")
                 
                 print(f"Exported data for device {clean_name}")
                 
@@ -448,18 +509,20 @@ class DeviceHandler:
         if "stream" in topic:  # Accept any topic containing "stream"
             sensorName = topic.replace("stream-", "")
             # Remove verbose processing logs
-            buffer = self.device_buffer.append_data(sensorName, data)
-            bytesParsed = self.device_parser.getParser(sensorName).parseStream(buffer)
-            # Only log parsing errors or significant events
-            if bytesParsed == 0 and len(data) > 0:
-                self.logger.warning(f"No bytes parsed for {sensorName}, data length: {len(data)}")
-            self.device_buffer.truncate(sensorName, bytesParsed)
-
-    def parsedData(self, type, sensorName):
+            with self.parse_lock:
+                buffer = self.device_buffer.append_data(sensorName, data)
+                bytesParsed = self.device_parser.getParser(sensorName).parseStream(buffer.data, buffer.offset)
+                # Only log parsing errors or significant events
+                if bytesParsed == buffer.offset and len(data) > 0:
+                    self.logger.warning(f"No bytes parsed for {sensorName}, data length: {len(data)}")
+                self.device_buffer.truncate(sensorName, bytesParsed)
+                self.checkpointer.maybeSave()
+
+    def parsedData(self, datatype, sensorName):
         parser = self.device_parser.getParser(sensorName)
         
-        # Handle stream token events
-        if type == parser.DataStreamType.DATA_TYPE_STREAM_TOKEN:
+        # Handle stream token events, the parser reports raw type bytes
+        if datatype == parser.DataStreamType.DATA_TYPE_STREAM_TOKEN.value:
             stream_tokens = parser.dataBuffer.dataDict["StreamToken"]
             if len(stream_tokens.data[0]) > 0:  # Check if we have stream token data
                 action = stream_tokens.data[0][-1]  # Get the latest action
@@ -491,17 +554,15 @@ class DeviceHandler:
         pass
 
 class TsfSync:
+    """Effective sample rate per device, read from the SampleClock its parser fits to every TimeSync frame."""
     def __init__(self):
-        pass
-    
-    def calcFs(self,device_buffer):
-        tsf = device_buffer.dataDict["TimeSync"].data[0]
-        ts = device_buffer.dataDict["TimeSync"].data[1]
-        dtsf = np.diff(tsf)
-        dts = np.diff(ts)
-        ratio = dtsf / dts
-        fs = 1e6 / ratio
-        #print (fs)
+        self.fs = {}
+
+    def calcFs(self, device_name, parser):
+        clock = parser.clock
+        if clock.ready:
+            self.fs[device_name] = clock.sampleRate
+        return self.fs.get(device_name)
 
 def print_stats_table(devicehandler, stats):
     """Print a nice CLI table with device stats"""
@@ -548,6 +609,7 @@ def main():
     # Create data queue and device handler
     dataQueue = Queue()
     devicehandler = DeviceHandler(dataQueue)
+    serveMetrics(METRICS_PORT)
     stats = DevStats(devicehandler.device_parser, log_to_console=False)  # Reduce console logging
     tsf = TsfSync()
 
@@ -571,6 +633,8 @@ def main():
     
     # Cleanup
     Running = False
+    if devicehandler.stopping:
+        devicehandler.shutdown()
     devicehandler.mqtt_client.loop_stop()
     devicehandler.mqtt_client.disconnect()
 
@@ -587,6 +651,8 @@ def process_device_updates(devicehandler, stats, tsf):
 
 def update_stats(devicehandler, stats, tsf):
     try:
+        devicehandler.release_held_packets()
+        devicehandler.log_parser_warnings()
         devCopy = list(devicehandler.device_parser.getDeviceNames()) 
         for dev in devCopy:
             stats.calcStats()
@@ -595,7 +661,7 @@ def update_stats(devicehandler, stats, tsf):
                 dev_stats = stats.getStats(dev)
                 devicehandler.plotter.update_stats_display(dev, dev_stats)
             devBuffer = devicehandler.device_parser.getParser(dev).dataBuffer
-            tsf.calcFs(devBuffer)
+            tsf.calcFs(dev, devicehandler.device_parser.getParser(dev))
     except Exception as e:
         logger.error(f"Error in update_stats: {str(e)}")
 
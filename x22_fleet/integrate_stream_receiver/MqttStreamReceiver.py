@@ -4,6 +4,7 @@ from oscpy.server import OSCThreadServer
 from oscpy.client import OSCClient
 from time import sleep
 from DeviceHelper import *
+from dataParser import trace
 import sys
 import json
 import pickle
@@ -19,6 +20,11 @@ import numpy as np
 from DeviceStats import DevStats
 from multiprocessing import Process, Queue
 from x22_fleet.Library.BaseLogger import BaseLogger
+from x22_fleet.Library.Checkpoint import Checkpointer
+from x22_fleet.Library.ColumnStore import Retention
+from x22_fleet.Library.ParserMetrics import registry, serveMetrics
+from x22_fleet.Library.ReceiveBuffer import ReceiveBuffer
+from x22_fleet.Library.SessionAligner import SessionAligner
 import plotly.graph_objects as go
 import threading
 import ssl
@@ -26,29 +32,43 @@ import ssl
 broker = 'mqtt.dev.artemys.link'
 mqtt_port = 443
 
+# Samples kept in memory per sensor and stream, older ones are spilled to disk
+RETENTION_SECONDS = 600
+# how long a gap in the COMBO_V3 sample numbers may stay open for late packets
+REORDER_SECONDS = 0.5
+SPILL_DIR = "spill"
+# parser state and partial frames per sensor, saved periodically and on SIGTERM and restored on start
+CHECKPOINT_PATH = "receiver.checkpoint"
+CHECKPOINT_SECONDS = 10
+# Prometheus text of all sensor parsers on http://127.0.0.1:<port>/metrics
+METRICS_PORT = 9108
+
 class DeviceDataBuffer:
     def __init__(self):
-        self.dataBuffer = {}  # Initialize the dictionary of bytearrays
+        self.dataBuffer = {}  # ReceiveBuffer per device
 
     def append_data(self, device_name, data):
         if device_name not in self.dataBuffer:
-            self.dataBuffer[device_name] = bytearray()
+            self.dataBuffer[device_name] = ReceiveBuffer()
         self.dataBuffer[device_name].extend(data)
         return self.dataBuffer[device_name]
     
     def truncate(self,device_name,bytesParsed):
-        self.dataBuffer[device_name] = self.dataBuffer[device_name][bytesParsed:]
+        # bytesParsed is the absolute position returned by parseStream(buffer.data, buffer.offset)
+        self.dataBuffer[device_name].consume(bytesParsed)
 
 def logThis(logmessage):
     print(logmessage)
 class DeviceParser:
-    def __init__(self,dataCallBack):
+    def __init__(self,dataCallBack,retention=None):
         self.parsers = {}  
         self.dataCallBack = dataCallBack
+        self.retention = retention
+        registry.addParsers(self.parsers, receiver="mqtt")
 
     def getParser(self, device_name):
         if device_name not in self.parsers:
-           self.parsers[device_name] = Parser(deviceName = device_name,logf=logThis)     
+           self.parsers[device_name] = Parser(deviceName = device_name,logf=logThis,retention=self.retention,reorderDelay=REORDER_SECONDS)     
            self.parsers[device_name].dataCallback = self.dataCallBack
         return self.parsers[device_name]       
     
@@ -60,7 +80,11 @@ class DeviceParser:
 class DeviceHandler:
     def __init__(self,dataQueue,log_to_console = True):
         self.device_buffer = DeviceDataBuffer()
-        self.device_parser = DeviceParser(dataCallBack=self.parsedData)
+        self.device_parser = DeviceParser(dataCallBack=self.parsedData, retention=Retention(seconds=RETENTION_SECONDS, spillDir=SPILL_DIR))
+        # parsing runs in the MQTT thread, releasing held packets in the main loop
+        self.parse_lock = threading.Lock()
+        # set by sigterm_handler, the main loop then calls shutdown
+        self.stopping = False
         self.dataQueue = dataQueue
         self.deviceName = ""
         self.samplerate = 0
@@ -74,6 +98,8 @@ class DeviceHandler:
         self.mqtt_client.on_subscribe = self.on_subscribe
         self.mqtt_client.on_connect = self.on_connect
         self.logger = BaseLogger(log_file_path=f"DeviceHandler.log", log_to_console=log_to_console).get_logger()
+        self.checkpointer = Checkpointer(CHECKPOINT_PATH, self.snapshot, CHECKPOINT_SECONDS)
+        self.restore_checkpoint()
         try:
             self.mqtt_client.connect(broker, mqtt_port)
             self.logger.info("MQTT client successfully connected.")
@@ -100,9 +126,56 @@ class DeviceHandler:
         
             time.sleep(10)  # Check every 10 seconds
     
-    def sigterm_handler(signum, dummy1,dummy2):
+    def sigterm_handler(self, signum, frame):
+        # the main thread may hold parse_lock right now, shutdown runs when its loop comes around
         print("Device Process Received SIGTERM. Cleaning up and exiting.")
-        shutdown()
+        self.stopping = True
+
+    def shutdown(self):
+        # no message may be parsed while the checkpoint is taken
+        self.mqtt_client.loop_stop()
+        # held packets are stored now, the checkpoint then starts behind them
+        self.release_held_packets(flush=True)
+        self.checkpointer.save()
+        self.log_parser_warnings(flush=True)
+
+    def release_held_packets(self, flush=False):
+        """Store COMBO_V3 packets whose reorder window ran out (all held ones with ``flush``), also for sensors that went quiet."""
+        with self.parse_lock:
+            for parser in list(self.device_parser.parsers.values()):
+                if flush:
+                    parser.flushReorder()
+                else:
+                    parser.expireReorder()
+
+    def log_parser_warnings(self, flush=False):
+        """Log the parser warning counts whose interval ended (all of them with ``flush``), the parser only logs on the next warning."""
+        with self.parse_lock:
+            if flush:
+                trace.flush()
+            else:
+                trace.expire()
+
+    def snapshot(self):
+        """Parser state and partial frame of every sensor, see Checkpointer."""
+        devices = {}
+        for device_name, parser in self.device_parser.parsers.items():
+            buffer = self.device_buffer.dataBuffer.get(device_name)
+            devices[device_name] = {"parser": parser.snapshot(), "buffer": b"" if buffer is None else buffer.snapshot()}
+        return {"devices": devices}
+
+    def restore_checkpoint(self):
+        try:
+            state = self.checkpointer.load()
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Ignoring checkpoint {CHECKPOINT_PATH}: {e}")
+            return
+        if state is None:
+            return
+        for device_name, device in state["devices"].items():
+            self.device_parser.getParser(device_name).restore(device["parser"])
+            self.device_buffer.append_data(device_name, b"").restore(device["buffer"])
+        self.logger.info(f"Restored {len(state['devices'])} sensors from {CHECKPOINT_PATH}")
     
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
@@ -123,12 +196,15 @@ class DeviceHandler:
 
         if "stream" in topic:
             sensorName = topic.replace("stream-", "")
-            buffer = self.device_buffer.append_data(sensorName, data)
-            bytesParsed = self.device_parser.getParser(sensorName).parseStream(buffer)
-            self.device_buffer.truncate(sensorName, bytesParsed)
+            with self.parse_lock:
+                buffer = self.device_buffer.append_data(sensorName, data)
+                bytesParsed = self.device_parser.getParser(sensorName).parseStream(buffer.data, buffer.offset)
+                self.device_buffer.truncate(sensorName, bytesParsed)
+                self.checkpointer.maybeSave()
 
-    def parsedData(self, type,sensorName):
-        parser = self.device_parser.getParser(sensorName)
+    def parsedData(self, summary):
+        # called once per parseStream with a ParseSummary of the frames and samples added
+        parser = self.device_parser.getParser(summary.deviceName)
 
 
 import matplotlib.pyplot as plt
@@ -141,6 +217,7 @@ class IMUPlotter:
         self.fig, self.ax = plt.subplots()  # Create figure and axis
         self.lines = None  # Store line objects for updating
         self.max_samples = 200  # Limit the plot to the last 1000 samples
+        self.plot_width = 1000  # points per line, longer windows are decimated
 
 
     def plot_tsf(self, rootParser):
@@ -163,8 +240,8 @@ class IMUPlotter:
             if "TimeSync" in data_dict_keys:
                 data = devBuffer.dataDict["TimeSync"].data
                 if len(data) >= 2:  # Ensure both tsf and ts exist
-                    tsf = list(data[0])[-self.max_samples:]
-                    ts = list(data[1])[-self.max_samples:]
+                    tsf = data[0][-self.max_samples:].tolist()
+                    ts = data[1][-self.max_samples:].tolist()
 
                     # Normalize ts by subtracting the first element
                     if ts:  # Ensure ts is not empty
@@ -210,72 +287,24 @@ class IMUPlotter:
         plt.pause(0.01)
         
     def plot_acceleration(self, device_name, device_buffer):
-        timestamps = list(device_buffer.dataDict["ImuAccRaw"].data[0])
-        accX = list(device_buffer.dataDict["ImuAccRaw"].data[1])
-        accY = list(device_buffer.dataDict["ImuAccRaw"].data[2])
-        accZ = list(device_buffer.dataDict["ImuAccRaw"].data[3])
-
-        gyrX = list(device_buffer.dataDict["ImuGyrRaw"].data[1])
-        gyrY = list(device_buffer.dataDict["ImuGyrRaw"].data[2])
-        gyrZ = list(device_buffer.dataDict["ImuGyrRaw"].data[3])
-
-
-        magX = list(device_buffer.dataDict["ImuMagRaw"].data[1])
-        magY = list(device_buffer.dataDict["ImuMagRaw"].data[2])
-        magZ = list(device_buffer.dataDict["ImuMagRaw"].data[3])
-
-        # Keep only the last `max_samples` data points
-        timestamps = timestamps[-self.max_samples:]
-        accX = accX[-self.max_samples:]
-        accY = accY[-self.max_samples:]
-        accZ = accZ[-self.max_samples:]
-
-        gyrX = gyrX[-self.max_samples:]
-        gyrY = gyrY[-self.max_samples:]
-        gyrZ = gyrZ[-self.max_samples:]
-
-        magX = magX[-self.max_samples:]
-        magY = magY[-self.max_samples:]
-        magZ = magZ[-self.max_samples:]
+        # The last `max_samples` data points, as at most plot_width bucket means per line
+        streams = []
+        for stream in ("ImuAccRaw", "ImuGyrRaw", "ImuMagRaw"):
+            _, timestamps, _, _, mean = device_buffer.pyramids[stream].tail(self.max_samples, self.plot_width)
+            streams.extend((timestamps, mean[:, axis]) for axis in range(3))
 
         if self.lines is None:
             # First time: Create line plots
-            self.lines = [
-                self.ax.plot(timestamps, accX, label="Acc X")[0],
-                self.ax.plot(timestamps, accY, label="Acc Y")[0],
-                self.ax.plot(timestamps, accZ, label="Acc Z")[0],
-                self.ax.plot(timestamps, gyrX, label="Gyr X")[0],
-                self.ax.plot(timestamps, gyrY, label="Gyr Y")[0],
-                self.ax.plot(timestamps, gyrZ, label="Gyr Z")[0],
-                self.ax.plot(timestamps, magX, label="Mag X")[0],
-                self.ax.plot(timestamps, magY, label="Mag Y")[0],
-                self.ax.plot(timestamps, magZ, label="Mag Z")[0]                
-
-            ]
+            labels = ["Acc X", "Acc Y", "Acc Z", "Gyr X", "Gyr Y", "Gyr Z", "Mag X", "Mag Y", "Mag Z"]
+            self.lines = [self.ax.plot(timestamps, values, label=label)[0] for (timestamps, values), label in zip(streams, labels)]
             self.ax.set_title(f"IMU Acceleration Data (Last {self.max_samples} Samples)")
             self.ax.set_xlabel("Timestamp")
             self.ax.set_ylabel("Acceleration")
             self.ax.legend()
         else:
             # Update existing lines with new data
-            self.lines[0].set_xdata(timestamps)
-            self.lines[0].set_ydata(accX)
-            self.lines[1].set_xdata(timestamps)
-            self.lines[1].set_ydata(accY)
-            self.lines[2].set_xdata(timestamps)
-            self.lines[2].set_ydata(accZ)
-            self.lines[3].set_xdata(timestamps)
-            self.lines[3].set_ydata(gyrX)
-            self.lines[4].set_xdata(timestamps)
-            self.lines[4].set_ydata(gyrY)
-            self.lines[5].set_xdata(timestamps)
-            self.lines[5].set_ydata(gyrZ)   
-            self.lines[6].set_xdata(timestamps)
-            self.lines[6].set_ydata(magX)
-            self.lines[7].set_xdata(timestamps)
-            self.lines[7].set_ydata(magY)
-            self.lines[8].set_xdata(timestamps)
-            self.lines[8].set_ydata(magZ)                                   
+            for line, (timestamps, values) in zip(self.lines, streams):
+                line.set_data(timestamps, values)
             self.ax.relim()  # Recalculate limits
             self.ax.autoscale_view()  # Rescale view
 
@@ -292,30 +321,28 @@ class IMUPlotter:
             # Make sure to iterate safely over device dictionary keys
             devs_copy = list(devs)  
 
+            # devices without a fitted clock yet are left empty
+            sensors = {}
             for dev in devs_copy:  
-                devBuffer = rootParser.getParser(dev).dataBuffer
-
-                # Ensure both "TimeSync" and "ImuAccRaw" exist in the data dictionary
-                if "TimeSync" in devBuffer.dataDict and "ImuAccRaw" in devBuffer.dataDict:
-                    time_data = devBuffer.dataDict["TimeSync"].data
-                    acc_data = devBuffer.dataDict["ImuAccRaw"].data
-
-                    if len(time_data) >= 2 and len(acc_data) >= 2:  
-                        ts = list(time_data[1])[-self.max_samples:]  # Time-sync timestamps
-                        accX = list(acc_data[1])[-self.max_samples:]  # Acceleration X
-
-                        # Normalize ts (subtract first timestamp to align)
-                        if ts:
-                            ts = [t - ts[0] for t in ts]
-
-                        ts_list.append(ts)
-                        accX_list.append(accX)
-                    else:
-                        print(f"Warning: Insufficient data in {dev}.")
-                        ts_list.append([])
-                        accX_list.append([])
+                parser = rootParser.getParser(dev)
+                if parser.clock.ready:
+                    sensors[dev] = (parser.dataBuffer.dataDict["ImuAccRaw"].data, parser.clock)
+                else:
+                    print(f"Warning: Insufficient TimeSync data in {dev}.")
+
+            # the newest max_samples points of the common TSF grid, relative seconds
+            aligner = SessionAligner(sensors)
+            overlap = aligner.overlap() if sensors else None
+            resampled = {}
+            if overlap is not None:
+                first, stop = aligner.gridIndexes(*overlap)
+                times, resampled = aligner.resample(max(first, stop - self.max_samples), stop)
+                times = ((times - times[0]) / 1e6).tolist()
+            for dev in devs_copy:
+                if dev in resampled:
+                    ts_list.append(times)
+                    accX_list.append(resampled[dev][:, 0].tolist())  # Acceleration X
                 else:
-                    print(f"Warning: Missing required keys in {dev}.")
                     ts_list.append([])
                     accX_list.append([])
 
@@ -342,7 +369,7 @@ class IMUPlotter:
             self.lines = self.lines[:n_devices]
 
             self.ax.set_title("Acceleration X with Synced Time")
-            self.ax.set_xlabel("Time (relative)")
+            self.ax.set_xlabel("Time (s)")
             self.ax.set_ylabel("Acceleration X")
             self.ax.legend()
 
@@ -353,17 +380,15 @@ class IMUPlotter:
             plt.pause(0.01)
 
 class TsfSync:
+    """Effective sample rate per device, read from the SampleClock its parser fits to every TimeSync frame."""
     def __init__(self):
-        pass
-    
-    def calcFs(self,device_buffer):
-        tsf = device_buffer.dataDict["TimeSync"].data[0]
-        ts = device_buffer.dataDict["TimeSync"].data[1]
-        dtsf = np.diff(tsf)
-        dts = np.diff(ts)
-        ratio = dtsf / dts
-        fs = 1e6 / ratio
-        #print (fs)
+        self.fs = {}
+
+    def calcFs(self, device_name, parser):
+        clock = parser.clock
+        if clock.ready:
+            self.fs[device_name] = clock.sampleRate
+        return self.fs.get(device_name)
 
         
 
@@ -373,26 +398,30 @@ def mainDeviceProcess(dataQueue):
     global Running
     
     devicehandler = DeviceHandler(dataQueue)
+    serveMetrics(METRICS_PORT)
     stats = DevStats(devicehandler.device_parser)
     Running = True
     plotter = IMUPlotter()
     tsf = TsfSync()
 
-    while(Running):
+    while(Running and not devicehandler.stopping):
 #        try:
 
         #plotter.plot_tsf(devicehandler.device_parser)
         #plotter.plot_synced_acceleration(devicehandler.device_parser)
         
+        devicehandler.release_held_packets()
+        devicehandler.log_parser_warnings()
         devCopy = list(devicehandler.device_parser.getDeviceNames()) 
         for dev in devCopy:
             stats.calcStats()
             stats.printStats()
             devBuffer = devicehandler.device_parser.getParser(dev).dataBuffer
             plotter.plot_acceleration(dev,devBuffer)
-            tsf.calcFs(devBuffer)
+            tsf.calcFs(dev, devicehandler.device_parser.getParser(dev))
             time.sleep(1)
 #       time.sleep(.1)
+    devicehandler.shutdown()
 
 
 if __name__ == '__main__':
@@ -7,6 +7,11 @@ from datetime import datetime
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+from x22_fleet.Library.Decimation import minMaxDecimate
+
+# points per trace, longer series keep the min and max of each bucket
+PLOT_WIDTH = 2000
+
 def find_latest_data_dir():
     # Look for the data directory in the current working directory
     data_dir = "data"
@@ -63,12 +68,16 @@ def plot_data(sensor_data):
         # Calculate timestamp differences
         timestamp_diffs = np.diff(timestamps)
         diff_indices = np.arange(len(timestamp_diffs))
+
+        acc_x, acc_mag = minMaxDecimate(timestamps.to_numpy(), df['acc_mag'].to_numpy(), PLOT_WIDTH)
+        sample_indices, timestamps = minMaxDecimate(sample_indices, timestamps.to_numpy(), PLOT_WIDTH)
+        diff_indices, timestamp_diffs = minMaxDecimate(diff_indices, timestamp_diffs, PLOT_WIDTH)
         
         # Plot 1: Accelerometer magnitude
         fig.add_trace(
             go.Scatter(
-                x=timestamps,
-                y=df['acc_mag'],
+                x=acc_x,
+                y=acc_mag,
                 name=f"{sensor_name} - Acc Mag",
                 mode='lines',
                 line=dict(color=color),
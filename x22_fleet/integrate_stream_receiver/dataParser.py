@@ -4,12 +4,22 @@ import argparse
 import struct
 from enum import Enum
 import time
-import array as arr
-import crcmod
 import binascii
+from functools import partial
 import logging
 
-crc16_mod = crcmod.mkCrcFun(0x18005, rev=True, initCrc=0x0000, xorOut=0x0000)
+from x22_fleet.Library.BlockDecoder import appendComboSamples, decodeComboSamples
+from x22_fleet.Library.Checkpoint import packState, unpackState
+from x22_fleet.Library.ColumnStore import ColumnStore, iterNewRows
+from x22_fleet.Library.Decimation import DecimationPyramids
+from x22_fleet.Library.FrameScanner import FrameScanner, crc16_mod, dispatchTable, projectedTable
+from x22_fleet.Library.GapTracker import GapTracker
+from x22_fleet.Library.ParseSummary import ParseSummary
+from x22_fleet.Library.ParserMetrics import ParserMetrics
+from x22_fleet.Library.PhysicalUnits import PhysicalUnits
+from x22_fleet.Library.ReorderBuffer import ReorderBuffer
+from x22_fleet.Library.SampleClock import SampleClock
+from x22_fleet.Library.Trace import Trace
 
 # Set up logging for parser warnings
 parser_logger = logging.getLogger('DataParser')
@@ -17,137 +27,236 @@ parser_logger.setLevel(logging.WARNING)
 parser_logger.propagate = False  # Prevent propagation to console
 if not parser_logger.handlers:
     file_handler = logging.FileHandler('data_parser_warnings.log')
-    file_handler.setLevel(logging.WARNING)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    # levels are set per trace category, the handler writes whatever they let through
+    file_handler.setLevel(logging.DEBUG)
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     file_handler.setFormatter(formatter)
     parser_logger.addHandler(file_handler)
 
+# Hot path tracing, categories log to DataParser.<category>. Enable e.g. with
+# X22_PARSER_TRACE="frames=DEBUG,token=DEBUG" or trace.setLevel("frames", logging.DEBUG).
+trace = Trace(parser_logger, ("frames", "crc", "decode", "token"))
+trace.configure(os.environ.get("X22_PARSER_TRACE", ""))
+
 class DeviceDataBuffer:
-    def __init__(self):
+    def __init__(self, maxlen=None, spill=None):
+        # maxlen: keep only the newest maxlen samples per stream (None keeps everything),
+        # spill: SpillSink receiving the samples that fall out of that window
+        self.maxlen = maxlen
+        self.spill = spill
         self.clearSets()
 
     def clearSets(self):
         self.dataDict = {
             "TimeSync": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_TIME_SYNC,
-                [arr.array("Q"), arr.array("L")],
+                ColumnStore("QL", maxlen=self.maxlen),
             ),
             "ImuAcc": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_ACC,
-                [arr.array("L"), arr.array("f"), arr.array("f"), arr.array("f")],
+                ColumnStore("Lfff", maxlen=self.maxlen),
             ),
             "ImuGyr": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_GYR,
-                [arr.array("L"), arr.array("f"), arr.array("f"), arr.array("f")],
+                ColumnStore("Lfff", maxlen=self.maxlen),
             ),
             "ImuTemp": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_RAW_TEMP,
-                [arr.array("L"), arr.array("f")],
+                ColumnStore("Lf", maxlen=self.maxlen),
             ),            
             "ImuMag": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_MAG,
-                [arr.array("L"), arr.array("f"), arr.array("f"), arr.array("f")],
+                ColumnStore("Lfff", maxlen=self.maxlen),
             ),
             "Quat": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_QUAT,
-                [
-                    arr.array("L"),
-                    arr.array("f"),
-                    arr.array("f"),
-                    arr.array("f"),
-                    arr.array("f"),
-                ],
+                ColumnStore("Lffff", maxlen=self.maxlen),
             ),
             "ImuAccRaw": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_RAW_ACC,
-                [arr.array("L"), arr.array("h"), arr.array("h"), arr.array("h")],
+                ColumnStore("Lhhh", maxlen=self.maxlen),
             ),
             "ImuGyrRaw": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_RAW_GYR,
-                [arr.array("L"), arr.array("h"), arr.array("h"), arr.array("h")],
+                ColumnStore("Lhhh", maxlen=self.maxlen),
             ),
             "ImuMagRaw": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_RAW_MAG,
-                [arr.array("L"), arr.array("h"), arr.array("h"), arr.array("h")],
+                ColumnStore("Lhhh", maxlen=self.maxlen),
             ),
             "ImuRawCombo": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_RAW_MAG,
-                [
-                    arr.array("L"),
-                    arr.array("h"),
-                    arr.array("h"),
-                    arr.array("h"),
-                    arr.array("h"),
-                    arr.array("h"),
-                    arr.array("h"),
-                    arr.array("h"),
-                ],
+                ColumnStore("Lhhhhhhh", maxlen=self.maxlen),
             ),
             "Steps": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_IMU_STEP,
-                [arr.array("L"), arr.array("Q")],
+                ColumnStore("LQ", maxlen=self.maxlen),
             ),
             "Barometer": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_BAR,
-                [arr.array('L'), arr.array('l'), arr.array('l')]
+                ColumnStore("Lll", maxlen=self.maxlen)
             ),
             "Battery": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_SYS_BATTERY,
-                [arr.array("I"), arr.array("h"), arr.array("H"), arr.array("B")],
+                ColumnStore("IhHB", maxlen=self.maxlen),
             ),
             "Ping": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_SYS_PING,
-                [
-                    arr.array("L"),
-                    arr.array("Q"),
-                    arr.array("Q"),
-                    arr.array("Q"),
-                    arr.array("H"),
-                ],
+                ColumnStore("LQQQH", maxlen=self.maxlen),
             ),
             "PingV2": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_SYS_PING_V2,
-                [arr.array("L"), arr.array("Q"), arr.array("Q")],
+                ColumnStore("LQQ", maxlen=self.maxlen),
             ),
             "StreamToken": Parser.ParsedData(
                 Parser.DataStreamType.DATA_TYPE_STREAM_TOKEN,
-                [arr.array("B"), arr.array("Q")],  # action, timestamp
+                ColumnStore("BQ", maxlen=self.maxlen),  # action, timestamp
+            ),
+            "ImuConfig": Parser.ParsedData(
+                Parser.DataStreamType.DATA_TYPE_IMU_CONFIG,
+                ColumnStore("LIIII", maxlen=self.maxlen),  # data rate, acc / gyr FSR, features
             ),
             # "States":       Parser.ParsedData(Parser.DatabinasciiStreamType.DATA_TYPE_SYS_STATES,
-            #                                   [arr.array('L'), arr.array('L'), arr.array('B'), arr.array('B'), arr.array('L'), arr.array('Q'), arr.array('Q')]),
+            #                                   ColumnStore("LLBBLQQ", maxlen=self.maxlen)),
             "gatt": {},
         }
+        self.streams = {key: entry.data for key, entry in self.dataDict.items() if key != "gatt"}
+        self.stores = list(self.streams.values())
+        if self.spill is not None:
+            for key, entry in self.dataDict.items():
+                if key != "gatt":
+                    entry.data.spillTo(partial(self.spill.write, key))
+        # min / max / mean levels of the streams for plotting, built on first use
+        self.pyramids = DecimationPyramids(self)
 
         self.imei = ""
 
+    # totLen/maxLen count every sample parsed so far, including the ones a
+    # bounded buffer no longer holds, so rates computed from them stay valid
+
     def totLen(self):
         dataLen = 0
-        for key in self.dataDict.keys():
-            if key == "gatt":
-                continue
-            dataLen += len(self.dataDict[key].data[0])
+        for store in self.stores:
+            dataLen += store.appended
         return dataLen
 
     def maxLen(self):
         maxVal = 0
-        for key in self.dataDict.keys():
-            if key == "gatt":
-                continue
-            entryLen = len(self.dataDict[key].data[0])
-            if entryLen > maxVal:
-                maxVal = entryLen
+        for store in self.stores:
+            if store.appended > maxVal:
+                maxVal = store.appended
         return maxVal
 
+    def spillEvicted(self):
+        for store in self.stores:
+            store.spillEvicted()
+
 
 class Parser:
-    def __init__(self, deviceName="", logf=lambda *args, **kwargs: None):
+    def __init__(self, deviceName="", logf=lambda *args, **kwargs: None, retention=None, types=None, skipCrc=False, reorderDelay=None):
+        """
+        ``types`` (DataStreamTypes or type bytes) restricts decoding to those
+        frame types, all others are only skipped. With ``skipCrc`` frames
+        that are not decoded are not CRC-checked either. With
+        ``reorderDelay`` (seconds) COMBO_V3 packets pass a ReorderBuffer
+        before they are stored: duplicates are dropped and late packets put
+        back in order, waiting at most that long for a gap to fill.
+        """
         self.logf = logf
         self.dataCallback = None
-        self.dataBuffer = DeviceDataBuffer()
+        if retention is None:
+            self.dataBuffer = DeviceDataBuffer()
+        else:
+            self.dataBuffer = DeviceDataBuffer(maxlen=retention.maxlen, spill=retention.sink(deviceName))
         self.deviceName = deviceName
         self.missedSamples = 0
+        # received combo sample numbers, gaps, duplicates and out-of-order packets
+        self.gaps = GapTracker()
+        # float32 g / dps / gauss / degree C views of the raw IMU streams, scaled by IMU_CONFIG
+        self.units = PhysicalUnits(self.dataBuffer)
+        # sample number -> TSF time, fitted to every TimeSync pair
+        self.clock = SampleClock()
+        # held packets view the receive buffer, which is reused once they are parsed
+        self.reorder = None
+        if reorderDelay is not None:
+            self.reorder = ReorderBuffer(maxDelay=reorderDelay, hold=lambda packet: (packet[0], packet[1].copy()))
+        self.scanner = FrameScanner(
+            [datatype.value for datatype in self.DataStreamType],
+            headerId=self.HEADER_ID_COMMAND,
+            headerLength=self.HEADER_LENGTH,
+            crcLength=self.CRC_LENGTH,
+            maxPacketLen=self.MAX_PACKET_LEN,
+        )
+        # scanner counters already reported to the trace (see traceScanner)
+        self.tracedCrcFailures = 0
+        self.tracedOversizedFrames = 0
+        self.metrics = ParserMetrics(self)
+        # per type byte: callbacks called after each decoded frame (see subscribe)
+        self.subscribers = [None] * 256
+        # frames handed to a decoder / skipped, per type byte (see frameCounts)
+        self.decodedFrames = [0] * 256
+        self.skippedFrames = [0] * 256
+        if types is not None:
+            self.dispatch = projectedTable(self.dispatch, types)
+        if skipCrc:
+            self.scanner.skipCrcFor(datatype for datatype in range(256) if not self.dispatch[datatype])
         pass
 
+    def frameCounts(self):
+        """``{DataStreamType name: (decoded, skipped)}`` of all frame types seen so far."""
+        counts = {}
+        for datatype in range(256):
+            if self.decodedFrames[datatype] or self.skippedFrames[datatype]:
+                counts[self.DataStreamType(datatype).name] = (self.decodedFrames[datatype], self.skippedFrames[datatype])
+        return counts
+
+    # FrameScanner counters carried over by snapshot
+    SCANNER_STATE = ("frames", "skippedBytes", "crcFailures", "oversizedFrames", "unknownTypes")
+
+    def snapshot(self):
+        """
+        Compact binary checkpoint of the per-sensor stream state: gap
+        accounting, the TimeSync clock model, COMBO_V3 packets held for
+        reordering and the frame counters. Decoded samples are not part of
+        it, older ones are in the retention spill. Partial frames are in the
+        caller's ReceiveBuffer, which has its own ``snapshot``.
+        """
+        return packState(
+            {
+                "deviceName": self.deviceName,
+                "missedSamples": self.missedSamples,
+                "gaps": self.gaps.state(),
+                "clock": self.clock.state(),
+                "reorder": None if self.reorder is None else self.reorder.state(),
+                "decodedFrames": self.decodedFrames,
+                "skippedFrames": self.skippedFrames,
+                "scanner": {name: getattr(self.scanner, name) for name in self.SCANNER_STATE},
+            }
+        )
+
+    def restore(self, data):
+        """Continue from a ``snapshot``, e.g. of the same sensor before a receiver restart."""
+        state = unpackState(data)
+        self.deviceName = self.deviceName or state["deviceName"]
+        self.missedSamples = state["missedSamples"]
+        self.gaps.restoreState(state["gaps"])
+        self.clock.restoreState(state["clock"])
+        self.decodedFrames = state["decodedFrames"]
+        self.skippedFrames = state["skippedFrames"]
+        for name in self.SCANNER_STATE:
+            setattr(self.scanner, name, state["scanner"][name])
+        self.tracedCrcFailures = self.scanner.crcFailures
+        self.tracedOversizedFrames = self.scanner.oversizedFrames
+        if state["reorder"] is not None:
+            if self.reorder is not None:
+                self.reorder.restoreState(state["reorder"])
+            else:
+                # reordering is off now, store what was held
+                reorder = ReorderBuffer()
+                reorder.restoreState(state["reorder"])
+                for first, _, (tsf, samples) in reorder.flush():
+                    self.storeComboV3(first, tsf, samples)
+
     HEADER_ID_COMMAND = 0x7C  # --> |
     HEADER_ID_PARAMETERS = 0x7D  # --> }
     CRC_LENGTH = 2
@@ -232,21 +341,19 @@ class Parser:
     logf = lambda *args, **kwargs: None
 
     def setDataCallBack(self, dataCallback):
+        """``dataCallback(summary)`` is called once per parseStream call that decoded frames, with a ParseSummary."""
         self.dataCallback = dataCallback
 
+    def subscribe(self, datatype, callback):
+        """Call ``callback(datatype, deviceName)`` after every decoded frame of ``datatype`` (DataStreamType or type byte)."""
+        datatype = getattr(datatype, "value", datatype)
+        self.subscribers[datatype] = (self.subscribers[datatype] or ()) + (callback,)
+
     @classmethod
     def int2DataStreamType(cls, val):
         try:
-            result = cls.DataStreamType(val)
-            # Add debugging for stream token
-            if val == 0x9A:
-                print(f"DEBUG: Successfully converted stream token type {val} to {result}")
-                cls.logf(f"DEBUG: Successfully converted stream token type {val} to {result}")
-            return result
+            return cls.DataStreamType(val)
         except Exception as e:
-            print(f"ERROR: type {val} invalid: {str(e)}")
-            # Add debugging to show all enum values
-            print(f"DEBUG: Available enum values: {list(cls.DataStreamType)}")
             parser_logger.error(f"Type {val} invalid: {str(e)}")
             return None
 
@@ -257,6 +364,7 @@ class Parser:
             .decode("utf-8")
             .rstrip("\x00")
         )
+        return startIndex + sampleLength
 
     def parseBatteryData(self, buffer, startIndex, sampleLength, timeStamp):
         (ts,consumption, voltageLevel, currentPercentage) = struct.unpack(
@@ -266,12 +374,13 @@ class Parser:
         self.dataBuffer.dataDict["Battery"].data[1].append(consumption)
         self.dataBuffer.dataDict["Battery"].data[2].append(voltageLevel)
         self.dataBuffer.dataDict["Battery"].data[3].append(currentPercentage)
+        return startIndex + sampleLength
     
     def parseIMURawComboV2(self, buffer, startIndex, sampleLength, timeStamp):
             # Validate packet length matches expected size for 64 samples
             expected_length = 4 + 2 + (64 * 20)  # timestamp + numSamples + (64 * sample_size)
             if sampleLength != expected_length:
-                parser_logger.warning(f"Invalid packet length {sampleLength}, expected {expected_length}")
+                trace.warn("decode", f"Combo V2 packets with length other than {expected_length}")
                 return startIndex
 
             (timeStamp,) = struct.unpack("I", buffer[startIndex : startIndex + 4])
@@ -281,56 +390,21 @@ class Parser:
 
             # Validate number of samples
             if numberOfSamples != 64:
-                parser_logger.warning(f"Invalid number of samples {numberOfSamples}, expected 64")
+                trace.warn("decode", "Combo V2 packets with other than 64 samples")
                 return startIndex
 
-            self.logf(f"numberOfSamplesInPacket: {numberOfSamples}")
+            if trace.frames:
+                trace.debug("frames", "numberOfSamplesInPacket: %d", numberOfSamples)
             
             # Calculate end index to ensure we don't read past packet boundary
             end_index = startIndex + (numberOfSamples * 20)  # 20 bytes per sample
             if end_index > len(buffer):
-                parser_logger.warning(f"Packet would read past buffer end")
+                trace.warn("decode", "Packets reading past buffer end")
                 return startIndex
 
-            for i in range(numberOfSamples):
-                sample_start = startIndex + (i * 20)
-                
-                # Read accelerometer data
-                (accXValRaw, accYValRaw, accZValRaw) = struct.unpack(
-                    ">hhh", buffer[sample_start : sample_start + 6]
-                )
-                
-                # Read gyroscope data
-                (gyrXValRaw, gyrYValRaw, gyrZValRaw) = struct.unpack(
-                    ">hhh", buffer[sample_start + 6 : sample_start + 12]
-                )
-                
-                # Read magnetometer data
-                (magXValRaw, magYValRaw, magZValRaw) = struct.unpack(
-                    "<hhh", buffer[sample_start + 12 : sample_start + 18]
-                )
-                
-                # Read temperature
-                (temperature,) = struct.unpack(">h", buffer[sample_start + 18 : sample_start + 20])
-
-                # Store the data
-                self.dataBuffer.dataDict["ImuAccRaw"].data[0].append(timeStamp + i)
-                self.dataBuffer.dataDict["ImuAccRaw"].data[1].append(accXValRaw)
-                self.dataBuffer.dataDict["ImuAccRaw"].data[2].append(accYValRaw)
-                self.dataBuffer.dataDict["ImuAccRaw"].data[3].append(accZValRaw)
-
-                self.dataBuffer.dataDict["ImuGyrRaw"].data[0].append(timeStamp + i)
-                self.dataBuffer.dataDict["ImuGyrRaw"].data[1].append(gyrXValRaw)
-                self.dataBuffer.dataDict["ImuGyrRaw"].data[2].append(gyrYValRaw)
-                self.dataBuffer.dataDict["ImuGyrRaw"].data[3].append(gyrZValRaw)
-
-                self.dataBuffer.dataDict["ImuMagRaw"].data[0].append(timeStamp + i)
-                self.dataBuffer.dataDict["ImuMagRaw"].data[1].append(magXValRaw)
-                self.dataBuffer.dataDict["ImuMagRaw"].data[2].append(magYValRaw)
-                self.dataBuffer.dataDict["ImuMagRaw"].data[3].append(magZValRaw)
-
-                self.dataBuffer.dataDict["ImuTemp"].data[0].append(timeStamp + i)
-                self.dataBuffer.dataDict["ImuTemp"].data[1].append(temperature)
+            self.gaps.add(timeStamp, numberOfSamples)
+            samples = decodeComboSamples(buffer, startIndex, numberOfSamples)
+            appendComboSamples(self.dataBuffer.dataDict, timeStamp, samples)
 
             startIndex = end_index
             return startIndex
@@ -343,49 +417,39 @@ class Parser:
         (numberOfSamples,) = struct.unpack("H", buffer[startIndex : startIndex + 2])
         startIndex += 2
 
+        samples = decodeComboSamples(buffer, startIndex, numberOfSamples)
+        if self.reorder is None:
+            self.storeComboV3(timeStamp, tsf, samples)
+        else:
+            for first, _, (packetTsf, packetSamples) in self.reorder.push(timeStamp, numberOfSamples, (tsf, samples)):
+                self.storeComboV3(first, packetTsf, packetSamples)
+        return startIndex + numberOfSamples * samples.itemsize
+
+    def storeComboV3(self, timeStamp, tsf, samples):
         self.dataBuffer.dataDict["TimeSync"].data[0].append(tsf)
         self.dataBuffer.dataDict["TimeSync"].data[1].append(timeStamp)
+        self.clock.update(timeStamp, tsf)
 
-        for i in range(numberOfSamples):
-            (accXValRaw, accYValRaw, accZValRaw) = struct.unpack( 
-                ">hhh", buffer[startIndex : startIndex + 6]
-            )
-            startIndex += 6
-            (gyrXValRaw, gyrYValRaw, gyrZValRaw) = struct.unpack(
-                ">hhh", buffer[startIndex : startIndex + 6]
-            )
-            startIndex += 6
-            (magXValRaw, magYValRaw, magZValRaw) = struct.unpack(
-                "<hhh", buffer[startIndex : startIndex + 6]
-            )
-            startIndex += 6
-            (temperature,) = struct.unpack(">h", buffer[startIndex : startIndex + 2])
-            startIndex += 2
-            ts = timeStamp + i
-            if len(self.dataBuffer.dataDict["ImuAccRaw"].data[0]) > 10:
-                lastTs = self.dataBuffer.dataDict["ImuAccRaw"].data[0][-1]
-                if abs(lastTs - ts) != 1:
-                    self.missedSamples += 1
-
-            self.dataBuffer.dataDict["ImuAccRaw"].data[0].append(ts)
-            self.dataBuffer.dataDict["ImuAccRaw"].data[1].append(accXValRaw)
-            self.dataBuffer.dataDict["ImuAccRaw"].data[2].append(accYValRaw)
-            self.dataBuffer.dataDict["ImuAccRaw"].data[3].append(accZValRaw)
-
-            self.dataBuffer.dataDict["ImuGyrRaw"].data[0].append(timeStamp + i)
-            self.dataBuffer.dataDict["ImuGyrRaw"].data[1].append(gyrXValRaw)
-            self.dataBuffer.dataDict["ImuGyrRaw"].data[2].append(gyrYValRaw)
-            self.dataBuffer.dataDict["ImuGyrRaw"].data[3].append(gyrZValRaw)
-
-            self.dataBuffer.dataDict["ImuMagRaw"].data[0].append(timeStamp + i)
-            self.dataBuffer.dataDict["ImuMagRaw"].data[1].append(magXValRaw)
-            self.dataBuffer.dataDict["ImuMagRaw"].data[2].append(magYValRaw)
-            self.dataBuffer.dataDict["ImuMagRaw"].data[3].append(magZValRaw)
-
-            self.dataBuffer.dataDict["ImuTemp"].data[0].append(timeStamp + i)
-            self.dataBuffer.dataDict["ImuTemp"].data[1].append(temperature)
+        # samples inside a packet are consecutive, only its first one can jump
+        if self.gaps.add(timeStamp, len(samples)):
+            self.missedSamples += 1
+
+        appendComboSamples(self.dataBuffer.dataDict, timeStamp, samples)
+
+    def expireReorder(self, now=None):
+        """Store the held COMBO_V3 packets whose gap timed out, called periodically so a quiet sensor's packets are not held forever."""
+        if self.reorder is not None:
+            for first, _, (tsf, samples) in self.reorder.expire(now):
+                self.storeComboV3(first, tsf, samples)
+
+    def flushReorder(self):
+        """Store the COMBO_V3 packets still held by the reorder stage, e.g. at the end of a stream."""
+        if self.reorder is not None:
+            for first, _, (tsf, samples) in self.reorder.flush():
+                self.storeComboV3(first, tsf, samples)
 
     def parsePingV2Data(self, buffer, startIndex, sampleLength, timeStamp):
+        endIndex = startIndex + sampleLength
         (timeStamp,) = struct.unpack("I", buffer[startIndex : startIndex + 4])
         startIndex += 4
 
@@ -400,48 +464,53 @@ class Parser:
         self.dataBuffer.dataDict["PingV2"].data[0].append(timeStamp)
         self.dataBuffer.dataDict["PingV2"].data[1].append(ticksSinceStart)
         self.dataBuffer.dataDict["PingV2"].data[2].append(usSinceEpoch)
+        return endIndex
 
     def parseIMUConfig(self, buffer, startIndex, sampleLength, timeStamp):
-        imuConfig = struct.unpack('I', buffer[startIndex:startIndex + 4])[0]
-        dataRate = imuConfig & self.maskImuDataRate
-        accelerometerFSR = imuConfig & self.maskImuAccFsr
-        gyroscopeFSR = imuConfig & self.maskImuGyrFsr
-        features = imuConfig & self.maskImuFeatures
-
-        values = [[dataRate, accelerometerFSR, gyroscopeFSR, features]]
-        data = self.ParsedData(self.DataStreamType.DATA_TYPE_IMU_CONFIG, values)
-        # TODO NEEDS STORAGE
+        imuConfig = struct.unpack_from('I', buffer, startIndex)[0]
+        self.units.configure(imuConfig)
+        self.dataBuffer.dataDict["ImuConfig"].data.append(
+            (
+                timeStamp,
+                imuConfig & self.maskImuDataRate,
+                imuConfig & self.maskImuAccFsr,
+                imuConfig & self.maskImuGyrFsr,
+                imuConfig & self.maskImuFeatures,
+            )
+        )
+        return startIndex + sampleLength
 
     def parseFileInfo(self, buffer, startIndex, sampleLength, timeStamp):
         fSize = struct.unpack("<I", buffer[:4])[0]
-        fName = buffer[startIndex:sampleLength].decode("ascii")
+        fName = bytes(buffer[startIndex:sampleLength]).decode("ascii")
         self.logf(f"Fname: {fName}, fSize: {fSize}")
         # return fSize, fName
+        return startIndex + sampleLength
 
     def parseFilePart(self, buffer, startIndex, sampleLength, timeStamp):
         chunkNo = struct.unpack("<H", buffer[:2])[0]
         chunkData = buffer[startIndex:sampleLength]
         # return chunkNo, chunkData
+        return startIndex + sampleLength
 
     def parseStreamToken(self, buffer, startIndex, sampleLength, timeStamp):
         """Parse stream start/stop token"""
-        print(f"DEBUG: parseStreamToken called with length={sampleLength}")
         try:
             if sampleLength != 9:  # 1 byte action + 8 bytes timestamp
-                parser_logger.warning(f"Invalid stream token length {sampleLength}, expected 9")
+                trace.warn("token", "Stream tokens with length other than 9")
                 return startIndex + sampleLength  # Skip the invalid data
                 
             (action,) = struct.unpack("B", buffer[startIndex : startIndex + 1])
             (timestamp,) = struct.unpack("<Q", buffer[startIndex + 1 : startIndex + 9])  # Use little-endian format
             
-            print(f"DEBUG: Parsed stream token - action={action}, timestamp={timestamp}")
+            if trace.token:
+                trace.debug("token", "Parsed stream token - action=%d, timestamp=%d", action, timestamp)
             
             self.dataBuffer.dataDict["StreamToken"].data[0].append(action)
             self.dataBuffer.dataDict["StreamToken"].data[1].append(timestamp)
             
             # Log the stream token
             action_str = "START" if action == 1 else "STOP"
-            print(f"🚀 STREAM {action_str} TOKEN received - Device: {self.deviceName}, Timestamp: {timestamp}")
             self.logf(f"🚀 STREAM {action_str} TOKEN received - Device: {self.deviceName}, Timestamp: {timestamp}")
             
             return startIndex + 9
@@ -462,6 +531,8 @@ class Parser:
         DataStreamType.DATA_TYPE_FILEPART:                  parseFilePart,
         DataStreamType.DATA_TYPE_STREAM_TOKEN:              parseStreamToken,
     }
+    # parse functions by raw type byte, DataStreamType objects are only built on request
+    dispatch = dispatchTable(parsers)
 
     def crcValid(self, data, start, length):
         crcStart = start + length + self.HEADER_LENGTH
@@ -477,108 +548,114 @@ class Parser:
     def crc16(data, start, size):
         return crc16_mod(memoryview(data)[start : start + size])
 
-    def parseStream(self, buffer):
+    def parseStream(self, buffer, start=0):
+        """
+        Parse all complete frames in ``buffer[start:]`` (bytes, bytearray or memoryview).
+
+        Returns the absolute index in ``buffer`` where parsing has to resume.
+        ``dataCallback`` gets one ParseSummary per call, not one call per frame.
+        """
+        started = time.perf_counter()
+        if self.dataCallback is None:
+            resumeIndex = self.drainFrames(buffer, start)
+        else:
+            resumeIndex, summary = ParseSummary.drain(self, self.parseFrames(buffer, start))
+            if summary:
+                self.dataCallback(summary)
+        self.metrics.observe(time.perf_counter() - started, resumeIndex - start)
+        self.traceScanner()
+        return resumeIndex
+
+    def traceScanner(self):
+        """Report CRC mismatches and oversized frames counted by the scanner since the last call."""
+        scanner = self.scanner
+        if scanner.crcFailures != self.tracedCrcFailures:
+            trace.warn("crc", "CRC mismatches", scanner.crcFailures - self.tracedCrcFailures)
+            self.tracedCrcFailures = scanner.crcFailures
+        if scanner.oversizedFrames != self.tracedOversizedFrames:
+            trace.warn("crc", "Frames over the maximum length", scanner.oversizedFrames - self.tracedOversizedFrames)
+            self.tracedOversizedFrames = scanner.oversizedFrames
+
+    def drainFrames(self, buffer, start=0):
+        frames = self.parseFrames(buffer, start)
+        try:
+            while True:
+                next(frames)
+        except StopIteration as done:
+            return done.value
+
+    def iter_batches(self, buffer, start=0):
+        """
+        Parse ``buffer[start:]`` and yield ``(stream, columns)`` as frames are decoded.
+
+        ``stream`` is the dataDict key (e.g. ``"ImuAccRaw"``), ``columns`` are
+        zero-copy arrays of the rows the frame added, one per column. The rows
+        are kept in dataBuffer as with parseStream. Once exhausted, the index
+        where parsing has to resume is in ``resumeIndex``.
+        """
+        self.resumeIndex = yield from iterNewRows(self.dataBuffer.streams, self.parseFrames(buffer, start))
+
+    def parseFrames(self, buffer, start=0):
+        """Generator behind parseStream: decodes one frame per step into dataBuffer and yields its type byte."""
         bufferLength = len(buffer)
-        i = 0
+        i = start
         timestamp = 0
         
-        # Minimum valid packet size: header(4) + min_data(1) + crc(2)
-        MIN_PACKET_SIZE = self.HEADER_LENGTH + 1 + self.CRC_LENGTH
-        
-        while i < bufferLength:
-            # Ensure we have enough bytes for a minimum packet
-            if (bufferLength - i) < MIN_PACKET_SIZE:
+        while True:
+            # Skip to the next frame with a plausible header and a valid CRC
+            i, datatype, sampleLength = self.scanner.nextFrame(buffer, i, bufferLength)
+            if datatype is None:
                 return i
 
-            # Look for packet header marker
-            if buffer[i] != self.HEADER_ID_COMMAND:
-                i += 1
-                continue
-
-            # Read packet header
-            try:
-                (datatype,) = struct.unpack("xB", buffer[i : i + 2])
-                (sampleLength,) = struct.unpack("<H", buffer[i + 2 : i + 4])
-                # Add debugging for all packet types
-                if datatype == 0x9A:
-                    print(f"DEBUG: Found stream token packet header: type=0x{datatype:02X}, length={sampleLength}")
-                self.logf(f"Found packet: type={datatype} (0x{datatype:02X}), length={sampleLength}")
-            except struct.error:
-                i += 1
-                continue
+            if trace.frames:
+                trace.debug("frames", "Found packet: type=0x%02X, length=%d", datatype, sampleLength)
 
             # Calculate total packet length
             packetLength = self.HEADER_LENGTH + sampleLength + self.CRC_LENGTH
 
-            # Validate packet length
-            if packetLength > self.MAX_PACKET_LEN:
-                parser_logger.warning(f"Packet length {packetLength} exceeds maximum {self.MAX_PACKET_LEN}")
-                i += 1
-                continue
-
-            # Ensure we have the complete packet
-            if (bufferLength - i) < packetLength:
-                return i
-
-            # Validate CRC
-            if not self.crcValid(buffer, i, sampleLength):
-                parser_logger.warning(f"CRC mismatch for packet at offset {i}")
-                i += 1
-                continue
-
-            # Get packet type
-            datatypeEnum = self.int2DataStreamType(datatype)
-            if datatypeEnum is None:
-                parser_logger.warning(f"Unknown packet type {datatype} (0x{datatype:02X})")
-                i += packetLength
-                continue
-
-            # Add debugging for stream token
-            if datatype == 0x9A:
-                print(f"DEBUG: Found stream token packet, enum: {datatypeEnum}")
-                self.logf(f"DEBUG: Found stream token packet, enum: {datatypeEnum}")
-
             # Find parser for this packet type
-            parserFunc = self.parsers.get(datatypeEnum, None)
+            parserFunc = self.dispatch[datatype]
             if parserFunc:
-                # Add debugging for stream token
-                if datatype == 0x9A:
-                    print(f"DEBUG: Found stream token parser function: {parserFunc}")
-                    self.logf(f"DEBUG: Found stream token parser function: {parserFunc}")
-                
+                self.decodedFrames[datatype] += 1
                 try:
-                    # Extract packet number for IMU data
-                    if datatypeEnum == self.DataStreamType.DATA_TYPE_IMU_RAW_COMBO_V2 and i >= 4:
-                        try:
-                            (packetNumber,) = struct.unpack("I", buffer[i - 4 : i])
-                            self.logf(f"found packetNumber: {packetNumber} type {datatypeEnum} len {sampleLength}")
-                        except struct.error:
-                            pass
+                    # Trace the packet number stored in front of IMU data
+                    if trace.frames and datatype == self.DataStreamType.DATA_TYPE_IMU_RAW_COMBO_V2.value and i >= 4:
+                        (packetNumber,) = struct.unpack("I", buffer[i - 4 : i])
+                        trace.debug("frames", "found packetNumber: %d type 0x%02X len %d", packetNumber, datatype, sampleLength)
 
                     # Parse packet data
                     bytes_parsed = parserFunc(self, buffer, i + self.HEADER_LENGTH, sampleLength, timestamp)
-                    
+                    if bytes_parsed is None:
+                        # decoders without a return value consumed the whole payload
+                        bytes_parsed = i + self.HEADER_LENGTH + sampleLength
+
                     # Verify parsing progress
                     if bytes_parsed <= i:
-                        parser_logger.warning(f"Parser made no progress, skipping packet")
+                        trace.warn("decode", "Packets skipped without parser progress")
                         i += packetLength
+                        yield datatype
                         continue
-                        
-                    i = bytes_parsed
+
+                    # parsers report where their payload ended, the CRC follows it
+                    i = max(bytes_parsed, i + packetLength)
 
                 except Exception as e:
-                    parser_logger.error(f"Error parsing packet: {str(e)}")
+                    trace.warn("decode", f"Errors parsing packets ({type(e).__name__})")
                     i += packetLength
+                    yield datatype
                     continue
 
-                if self.dataCallback:
-                    self.dataCallback(datatype, self.deviceName)
+                callbacks = self.subscribers[datatype]
+                if callbacks:
+                    for callback in callbacks:
+                        callback(datatype, self.deviceName)
+                yield datatype
             else:
-                parser_logger.warning(f"No parser found for data type {datatypeEnum}")
+                self.skippedFrames[datatype] += 1
+                if Parser.dispatch[datatype] is None:
+                    trace.warn("decode", "Packets without parser")
                 i += packetLength
 
-        return i
-
     
 if __name__ == "__main__":
     pass